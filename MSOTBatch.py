@@ -0,0 +1,413 @@
+###############################################################################
+#
+# Headless batch mode for the MS Office telemetry parser. Walks a directory
+# tree exported from one or more images, finds every sln.tbl / evt.tbl /
+# user.tbl set, and parses the sets on a pool of worker processes. Run with
+# CPython 2.7, outside of Autopsy:
+#
+#     python MSOTBatch.py <export folder> [-o timeline.csv] [-f csv|jsonl|sqlite] [-w workers] [--numpy]
+#                        [--sessions sessions.db] [--cache folder] [--sort] [--memory-budget MB]
+#                        [--carve unallocated.bin ...]
+#
+###############################################################################
+
+import argparse
+import functools
+import hashlib
+import mmap
+import multiprocessing
+import os
+import sys
+
+from lib.sln_tbl_parse_aut import *
+from lib.evt_tbl_parse_aut import *
+from lib.user_tbl_parse_aut import *
+from lib.misc_functions_aut import *
+from lib.tbl_functions_aut import *
+from lib.timeline_sinks_aut import *
+from lib.tbl_filter_aut import *
+from lib.tbl_carver_aut import *
+from lib.evt_numpy_aut import *
+from lib.tbl_sessions_aut import *
+from lib.tbl_cache_aut import *
+from lib.tbl_extjoin_aut import *
+from lib.tbl_checkpoint_aut import *
+
+
+class LocalTblFile:
+
+    """ A .tbl file on the local file system, with the parts of the AbstractFile interface
+        that correlate_tbl_files uses. """
+
+    def __init__(self, objId, path):
+        self.objId = objId
+        self.path = path
+
+    def getId(self):
+        return(self.objId)
+
+    def getUniquePath(self):
+        return(self.path)
+
+    def getName(self):
+        return(os.path.basename(self.path))
+
+    def getSize(self):
+        return(os.path.getsize(self.path))
+
+    def getParent(self):
+        return(None)
+
+    def getParentPath(self):
+        return(os.path.dirname(self.path))
+
+
+def find_tbl_files(root):
+
+    ''' Walk the directory tree under root and return lists of the sln, evt and user tables found. '''
+
+    found = {'sln': [], 'evt': [], 'user': []}
+    for dirpath, dirnames, filenames in os.walk(root):
+        for filename in filenames:
+            name = classify_tbl_name(filename)
+            if name is not None:
+                path = os.path.join(dirpath, filename)
+                found[name[0]].append(LocalTblFile(len(found['sln']) + len(found['evt']) + len(found['user']), path))
+    return(found['sln'], found['evt'], found['user'])
+
+
+def read_header(tbl_file):
+
+    ''' Read the 16 byte header of a LocalTblFile for validate_tbl_format. '''
+
+    with open(tbl_file.getUniquePath(), 'rb') as infile:
+        return(infile.read(16))
+
+
+def tbl_set_fingerprint(tbl_set, tbl_file_dict):
+
+    ''' Content hash of a set of (sln, evt, user) files, for dedup_tbl_sets. '''
+
+    return(':'.join([file_md5(tbl_file_dict[objId].getUniquePath()) for objId in tbl_set]))
+
+
+def file_md5(path):
+    hasher = hashlib.md5()
+    with open(path, 'rb') as infile:
+        for chunk in iter(lambda: infile.read(TBL_CHUNK_SIZE), ''):
+            hasher.update(chunk)
+    return(hasher.hexdigest())
+
+
+def map_tbl_file(path):
+
+    ''' Memory-map a .tbl file read-only, so the parsers read straight from the page cache
+        without copying the file. Returns None for an empty file, which cannot be mapped. '''
+
+    with open(path, 'rb') as infile:
+        if os.fstat(infile.fileno()).st_size == 0:
+            return(None)
+        return(mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def parse_tbl_set(tbl_paths, tbl_filter=None, use_numpy=False, cache_folder=None):
+
+    ''' Parse and join one set of (sln, evt, user) table paths, keeping only the entries tbl_filter
+        keeps if there is one. With use_numpy, the evt entries are joined as an array by the NumPy
+        backend. With cache_folder, the results are taken from the tblCache there when the same files
+        were parsed before, and stored in it otherwise. Runs in a worker process. Returns
+        (tbl_paths, results, error). '''
+
+    sln_path, evt_path, usr_path = tbl_paths
+    cache = None
+    if cache_folder:
+        # The cache only saves time: when it cannot be read, the set is parsed instead
+        cached = None
+        try:
+            cache = tblCache(cache_folder)
+            cache_key = ':'.join([file_md5(path) for path in tbl_paths]) + '|' + (tbl_filter.key() if tbl_filter else '')
+            cached = cache.open_entry(cache_key)
+            if cached is not None:
+                return(tbl_paths, [row + [evt_path] for row in cached], None)
+        except (IOError, OSError, ValueError):
+            cache = None
+        finally:
+            if cached is not None:
+                cached.close()
+
+    tbl_paths, results, error, meta = parse_tbl_files(tbl_paths, tbl_filter, use_numpy)
+    if cache is not None and not error:
+        writer = None
+        try:
+            writer = cache.new_entry(cache_key)
+            writer.write_rows([result[:13] for result in results])
+            writer.commit(meta)
+        except (IOError, OSError):
+            if writer is not None:
+                writer.abort()
+    return(tbl_paths, results, error)
+
+
+def parse_tbl_files(tbl_paths, tbl_filter, use_numpy):
+
+    ''' Map, parse and join the files of a set for parse_tbl_set. Returns (tbl_paths, results, error,
+        meta), where meta is what the ingest module stores with a cache entry to checkpoint the set
+        from, so that both can share a cache folder. '''
+
+    sln_path, evt_path, usr_path = tbl_paths
+    mapped = []
+    try:
+        for path in tbl_paths:
+            mapped.append(map_tbl_file(path))
+        if None in mapped:
+            return(tbl_paths, [], 'empty table file', None)
+        sln_content, evt_content, usr_content = mapped
+
+        sln_table = slnTable(sln_content)
+        sln_table.parse_entries(tbl_filter)
+        user_table = userTable(usr_content)
+        user_table.parse_entries()
+
+        # The evt entries are streamed straight from the mapped file through the join
+        evt_table = evtTable(evt_content, evt_path)
+        if use_numpy:
+            entries = filter_evt_array(evt_entry_array(evt_content), tbl_filter)
+            results = list(iter_array_results(sln_table, evt_table, user_table, entries))
+            # The array is a view of the mapping, drop it before the mapping is closed
+            del entries
+        else:
+            results = list(iter_results(sln_table, evt_table, user_table, iter_evt_entries(evt_content, evt_filter=tbl_filter)))
+
+        meta = {'sln_docids': sln_docid_digests(sln_table),
+                'evt_trailing_bytes': max(len(evt_content) - EVT_FIRST_ENTRY, 0) % EVT_ENTRY_SIZE}
+        return(tbl_paths, results, None, meta)
+    except Exception as e:
+        return(tbl_paths, [], '%s: %s' % (e.__class__.__name__, e), None)
+    finally:
+        for content in mapped:
+            if content is not None:
+                content.close()
+
+
+def carved_sets(paths):
+
+    ''' Carve records out of raw files, such as unallocated space or a pagefile exported from an
+        image. Returns one (sln_table, evt_table, user_table, evt entries) tuple to join per file;
+        the evt_table of each is named after its file. '''
+
+    carvers = []
+    for path in paths:
+        carver = tblCarver()
+        with open(path, 'rb') as infile:
+            carver.carve_stream(infile)
+        sys.stderr.write('Carved %d sln entries, %d evt entries and %d user tables from %s\n' %
+                         (len(carver.sln_table.entries), len(carver.evt_entries), len(carver.user_tables), path))
+        carvers.append(carver)
+
+    # Documents carved from one file can match events carved from another
+    sln_table = merge_carved_sln(carvers)
+    user_tables = [user_table for file_carver in carvers for user_table in file_carver.user_tables]
+    sets = []
+    for path, carver in zip(paths, carvers):
+        if carver.user_tables:
+            user_table = carver.user_tables[0]
+        elif user_tables:
+            user_table = user_tables[0]
+        else:
+            user_table = blank_user_table()
+        sets.append((sln_table, evtTable(None, path), user_table, carver.evt_entries))
+    return(sets)
+
+
+def carve_files(paths):
+
+    ''' Carve records out of raw files and join them. Rows name the file their evt entry was carved from. '''
+
+    results = []
+    for sln_table, evt_table, user_table, evt_entries in carved_sets(paths):
+        results.extend(iter_results(sln_table, evt_table, user_table, evt_entries))
+    return(results)
+
+
+def iter_sorted_results(files_to_analyze, tbl_filter, carve_paths, memory_budget, temp_dir=None):
+
+    ''' Join every set, and the records carved out of carve_paths, with an externalJoin, and yield
+        (evt.tbl path, result) for all of them in timestamp order. The path is None for carved rows.
+        The sets are parsed one after another in this process, and only about memory_budget bytes of
+        joined entries are held in memory; the rest is spilled to temp_dir. '''
+
+    join = externalJoin(memory_budget, temp_dir)
+    set_paths = []
+    try:
+        for tbl_paths in files_to_analyze:
+            if add_sorted_set(join, tbl_paths, tbl_filter):
+                set_paths.append(tbl_paths[1])
+        for carved_set in carved_sets(carve_paths):
+            join.add_set(*carved_set)
+            set_paths.append(None)
+        if join.runs:
+            sys.stderr.write('Spilled %d joined entries to %d runs\n' % (join.spilled, len(join.runs)))
+
+        for set_number, result in join.iter_results():
+            yield (set_paths[set_number], result)
+    finally:
+        join.close()
+
+
+def add_sorted_set(join, tbl_paths, tbl_filter):
+
+    ''' Parse a set of (sln, evt, user) table paths and add it to join, for iter_sorted_results. The sln
+        entries keep copies of their raw fields rather than referring to the file, and the evt and user
+        tables are unmapped once the set is added, so no file of the set stays open during the merge.
+        Returns False, after saying why, if the set was skipped. '''
+
+    sln_path, evt_path, usr_path = tbl_paths
+    mapped = []
+    try:
+        if os.path.getsize(sln_path) == 0:
+            sys.stderr.write('Skipped %s: empty table file\n' % os.path.dirname(sln_path))
+            return(False)
+        for path in (evt_path, usr_path):
+            mapped.append(map_tbl_file(path))
+        if None in mapped:
+            sys.stderr.write('Skipped %s: empty table file\n' % os.path.dirname(sln_path))
+            return(False)
+        evt_content, usr_content = mapped
+        try:
+            sln_table = slnTable(None)
+            with open(sln_path, 'rb') as infile:
+                sln_table.parse_stream(infile, sln_filter=tbl_filter)
+            user_table = userTable(usr_content)
+            user_table.parse_entries()
+        except Exception as e:
+            sys.stderr.write('Skipped %s: %s: %s\n' % (os.path.dirname(sln_path), e.__class__.__name__, e))
+            return(False)
+        join.add_set(sln_table, evtTable(None, evt_path), user_table, iter_evt_entries(evt_content, evt_filter=tbl_filter))
+        return(True)
+    finally:
+        for content in mapped:
+            if content is not None:
+                content.close()
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Parse MS Office telemetry tables from an exported folder tree.')
+    parser.add_argument('root', help='folder to search for sln.tbl, evt.tbl and user.tbl sets')
+    parser.add_argument('-o', '--output', help='file to write the timeline to (default: standard output)')
+    parser.add_argument('-f', '--format', choices=sorted(SINK_FORMATS), default='csv',
+                        help='output format: csv, jsonl or sqlite (default: csv). sqlite needs --output')
+    parser.add_argument('--start', default='', help='only keep entries from this day on (YYYY-MM-DD, UTC)')
+    parser.add_argument('--end', default='', help='only keep entries up to the end of this day (YYYY-MM-DD, UTC)')
+    parser.add_argument('--event-ids', default='', help='only keep these event IDs, such as 1,13 or 5-8')
+    parser.add_argument('--doc-types', default='',
+                        help='only keep these document types: %s' % ', '.join(DOC_TYPES))
+    parser.add_argument('--carve', action='append', default=[], metavar='FILE',
+                        help='also carve records out of this raw file, such as exported unallocated space or a pagefile (repeatable)')
+    parser.add_argument('--sessions', metavar='DB',
+                        help='also write document sessions and a per-document summary to this SQLite database')
+    parser.add_argument('--cache', metavar='FOLDER',
+                        help='keep the parsed results of each set in this folder, and reuse them for identical sets in later runs')
+    parser.add_argument('--numpy', action='store_true',
+                        help='decode and join the evt.tbl entries as arrays with NumPy, which must be installed')
+    parser.add_argument('--sort', action='store_true',
+                        help='write the timeline in timestamp order across all sets. The sets are then parsed in this process, '
+                             'and joined entries beyond --memory-budget are spilled to temporary files')
+    parser.add_argument('--memory-budget', type=int, default=JOIN_MEMORY_BUDGET // (1024 * 1024), metavar='MB',
+                        help='memory the joined entries may use with --sort, and the events of the sessions with --sessions, '
+                             'before they are spilled (default: %(default)s)')
+    parser.add_argument('-w', '--workers', type=int, default=multiprocessing.cpu_count(),
+                        help='number of worker processes (default: number of CPUs)')
+    args = parser.parse_args(argv)
+    if args.format == 'sqlite' and not args.output:
+        parser.error('sqlite output needs --output')
+    if args.numpy and numpy is None:
+        parser.error('--numpy needs NumPy to be installed')
+    if args.sort and (args.numpy or args.cache):
+        parser.error('--sort cannot be combined with --numpy or --cache')
+    if args.memory_budget < 1:
+        parser.error('--memory-budget must be at least 1 MB')
+    try:
+        tbl_filter = parse_filter_spec(args.start, args.end, args.event_ids, args.doc_types)
+    except ValueError as e:
+        parser.error('invalid filter: %s' % e)
+
+    sln_tbl_files, evt_tbl_files, usr_tbl_files = find_tbl_files(args.root)
+
+    # Drop files whose header is not a valid table of the type their name says
+    sln_tbl_files, sln_rejected = probe_tbl_files(sln_tbl_files, 'sln', read_header)
+    evt_tbl_files, evt_rejected = probe_tbl_files(evt_tbl_files, 'evt', read_header)
+    usr_tbl_files, usr_rejected = probe_tbl_files(usr_tbl_files, 'user', read_header)
+    for tbl_file in sln_rejected + evt_rejected + usr_rejected:
+        sys.stderr.write('Skipped %s: invalid table header\n' % tbl_file.getUniquePath())
+
+    tbl_file_dict = {}
+    for tbl_file in sln_tbl_files + evt_tbl_files + usr_tbl_files:
+        tbl_file_dict[tbl_file.getId()] = tbl_file
+
+    # Identical sets are parsed once, and their rows written once for each copy
+    correlated_sets, unpaired = correlate_tbl_files(sln_tbl_files, evt_tbl_files, usr_tbl_files)
+    for group in unpaired:
+        sys.stderr.write('Skipped %s: tables cannot be paired into sets\n' % ', '.join([tbl_file.getUniquePath() for tbl_file in group]))
+    files_to_analyze = []
+    duplicate_sources = {}
+    for tbl_set, duplicates in dedup_tbl_sets(correlated_sets, tbl_file_dict, lambda tbl_set: tbl_set_fingerprint(tbl_set, tbl_file_dict)):
+        tbl_paths = tuple(tbl_file_dict[objId].getUniquePath() for objId in tbl_set)
+        files_to_analyze.append(tbl_paths)
+        duplicate_sources[tbl_paths[1]] = [tbl_file_dict[duplicate[1]].getUniquePath() for duplicate in duplicates]
+    sys.stderr.write('Found %d Office telemetry table sets, %d unique\n' % (len(correlated_sets), len(files_to_analyze)))
+
+    sink = open_sink(args.format, args.output)
+    sessions = sessionBuilder(args.memory_budget * 1024 * 1024) if args.sessions else None
+
+    if args.sort:
+        try:
+            for evt_path, result in iter_sorted_results(files_to_analyze, tbl_filter, args.carve, args.memory_budget * 1024 * 1024):
+                sink.write(result)
+                if evt_path is not None:
+                    for duplicate in duplicate_sources[evt_path]:
+                        sink.write(result[:13] + [duplicate])
+                if sessions is not None:
+                    sessions.add(result)
+        except:
+            if sessions is not None:
+                sessions.close()
+            raise
+        finally:
+            sink.close()
+    else:
+        pool = multiprocessing.Pool(max(args.workers, 1))
+        try:
+            for tbl_paths, results, error in pool.imap_unordered(functools.partial(parse_tbl_set, tbl_filter=tbl_filter, use_numpy=args.numpy,
+                                                                                   cache_folder=args.cache), files_to_analyze):
+                if error:
+                    sys.stderr.write('Skipped %s: %s\n' % (os.path.dirname(tbl_paths[0]), error))
+                    continue
+                for result in results:
+                    sink.write(result)
+                    for duplicate in duplicate_sources[tbl_paths[1]]:
+                        sink.write(result[:13] + [duplicate])
+                # Copies of a set are the same events, so they only count once towards the sessions
+                if sessions is not None:
+                    sessions.add_rows(results)
+            pool.close()
+            for result in carve_files(args.carve):
+                sink.write(result)
+                if sessions is not None:
+                    sessions.add(result)
+        except:
+            if sessions is not None:
+                sessions.close()
+            raise
+        finally:
+            pool.terminate()
+            pool.join()
+            sink.close()
+
+    if sessions is not None:
+        written = write_session_db(args.sessions, sessions)
+        sys.stderr.write('Wrote %d sessions of %d documents to %s\n' % (written, len(sessions.index), args.sessions))
+
+
+if __name__ == '__main__':
+    main()
@@ -13,14 +13,28 @@
 
 import jarray
 import inspect
+import os
+import hashlib
+import itertools
+import time
+import threading
+import Queue
 import StringIO
 import binascii
-from datetime import datetime
+from java.lang import Runtime
 from java.lang import System
 from java.util.logging import Level
 from jarray import zeros
 from java.text import SimpleDateFormat
+from java.util import ArrayList
 from java.util import Date
+from java.lang import IllegalArgumentException
+from javax.swing import BoxLayout
+from javax.swing import JCheckBox
+from javax.swing import JLabel
+from javax.swing import JPanel
+from javax.swing import JTextField
+from java.awt import FlowLayout
 from org.sleuthkit.datamodel import SleuthkitCase
 from org.sleuthkit.datamodel import AbstractFile
 from org.sleuthkit.datamodel import ReadContentInputStream
@@ -32,17 +46,62 @@ from org.sleuthkit.autopsy.ingest.IngestModule import IngestModuleException
 from org.sleuthkit.autopsy.ingest import DataSourceIngestModule
 from org.sleuthkit.autopsy.ingest import FileIngestModule
 from org.sleuthkit.autopsy.ingest import IngestModuleFactoryAdapter
+from org.sleuthkit.autopsy.ingest import GenericIngestModuleJobSettings
+from org.sleuthkit.autopsy.ingest import IngestModuleIngestJobSettingsPanel
 from org.sleuthkit.autopsy.ingest import IngestMessage
 from org.sleuthkit.autopsy.ingest import IngestServices
 from org.sleuthkit.autopsy.ingest import ModuleDataEvent
 from org.sleuthkit.autopsy.coreutils import Logger
+from org.sleuthkit.autopsy.coreutils import PlatformUtil
 from org.sleuthkit.autopsy.casemodule import Case
 from org.sleuthkit.autopsy.casemodule.services import Services
 from org.sleuthkit.autopsy.casemodule.services import FileManager
+from org.sleuthkit.autopsy.casemodule.services import Blackboard
 from lib.sln_tbl_parse_aut import *
 from lib.evt_tbl_parse_aut import *
 from lib.user_tbl_parse_aut import *
 from lib.misc_functions_aut import *
+from lib.tbl_functions_aut import *
+from lib.tbl_checkpoint_aut import *
+from lib.ingest_stats_aut import *
+from lib.tbl_filter_aut import *
+from lib.tbl_carver_aut import *
+from lib.tbl_cache_aut import *
+from lib.tbl_prefetch_aut import *
+
+# Number of artifacts posted to the blackboard per batch
+ARTIFACT_BATCH_SIZE = 1000
+
+# Number of worker threads reading, parsing and joining tbl sets at the same time
+TBL_SET_WORKERS = Runtime.getRuntime().availableProcessors()
+
+# Number of threads each sln.tbl window is searched and decoded on, in addition to the set workers.
+# Raise it when a case holds a few very large sln.tbl files rather than many small ones.
+SLN_SCAN_WORKERS = 1
+
+# Bytes of the .tbl files read ahead of the parsers, by all worker threads together, so reading from
+# the image overlaps with parsing. 0 turns read-ahead off.
+PREFETCH_BYTES = PREFETCH_BUDGET
+
+# Batches of results that can wait for the artifact writer before the workers block
+RESULTS_QUEUE_SIZE = 16
+
+# Seconds between cancellation checks while waiting on a queue
+QUEUE_POLL_SECONDS = 0.5
+
+# Write the ingest statistics to a JSON file in the module output folder, in addition to the ingest message
+WRITE_STATS_JSON = False
+
+# Run the parsers under a profiler, and save the profile in the module output folder
+PROFILE_PARSERS = False
+
+# Keep the joined results of each tbl set in a cache shared by all cases, so sets found again in
+# another case are not parsed again. The cache is in the Autopsy user folder.
+USE_PARSE_CACHE = True
+PARSE_CACHE_FOLDER = os.path.join(PlatformUtil.getUserConfigDirectory(), "MSOT", "parse_cache")
+
+# Files carved for telemetry records, in addition to unallocated space, when carving is turned on
+CARVE_FILE_NAMES = ["pagefile.sys", "swapfile.sys"]
 
 # Factory that defines the name and details of the module and allows Autopsy
 # to create instances of the modules that will do the anlaysis.
@@ -51,6 +110,9 @@ class MSOfficeTelemProcessFactory(IngestModuleFactoryAdapter):
 
     moduleName = "MS Office Telemetry Parser"
 
+    def __init__(self):
+        self.settings = None
+
     def getModuleDisplayName(self):
         return self.moduleName
 
@@ -66,9 +128,82 @@ class MSOfficeTelemProcessFactory(IngestModuleFactoryAdapter):
     def isDataSourceIngestModuleFactory(self):
         return True
 
+    def getDefaultIngestJobSettings(self):
+        return GenericIngestModuleJobSettings()
+
+    def hasIngestJobSettingsPanel(self):
+        return True
+
+    def getIngestJobSettingsPanel(self, settings):
+        if not isinstance(settings, GenericIngestModuleJobSettings):
+            raise IllegalArgumentException("Expected settings argument to be instanceof GenericIngestModuleJobSettings")
+        self.settings = settings
+        return MSOfficeTelemSettingsPanel(self.settings)
+
     # can return null if isFileIngestModuleFactory returns false
     def createDataSourceIngestModule(self, ingestOptions):
-        return MSOfficeTelemProcesser()
+        return MSOfficeTelemProcesser(ingestOptions)
+
+
+# Ingest settings panel for the filters. The settings are kept as the text entered, and turned into a
+# tblFilter by parse_filter_spec when the ingest starts.
+class MSOfficeTelemSettingsPanel(IngestModuleIngestJobSettingsPanel):
+
+    def __init__(self, settings):
+        self.local_settings = settings
+        self.initComponents()
+        self.customizeComponents()
+
+    def initComponents(self):
+        self.setLayout(BoxLayout(self, BoxLayout.Y_AXIS))
+        self.add(JLabel("Only parse entries matching these filters. Leave a field empty to keep everything."))
+
+        self.start_date = JTextField(10, focusLost=self.saveSettings, actionPerformed=self.saveSettings)
+        self.end_date = JTextField(10, focusLost=self.saveSettings, actionPerformed=self.saveSettings)
+        dates = JPanel(FlowLayout(FlowLayout.LEFT))
+        dates.add(JLabel("From (YYYY-MM-DD, UTC):"))
+        dates.add(self.start_date)
+        dates.add(JLabel("To:"))
+        dates.add(self.end_date)
+        self.add(dates)
+
+        self.event_ids = JTextField(20, focusLost=self.saveSettings, actionPerformed=self.saveSettings)
+        events = JPanel(FlowLayout(FlowLayout.LEFT))
+        events.add(JLabel("Event IDs (e.g. 1,13 or 5-8):"))
+        events.add(self.event_ids)
+        self.add(events)
+
+        self.doc_type_boxes = {}
+        doc_types = JPanel(FlowLayout(FlowLayout.LEFT))
+        doc_types.add(JLabel("Document types:"))
+        for doc_type in DOC_TYPES:
+            self.doc_type_boxes[doc_type] = JCheckBox(doc_type, actionPerformed=self.saveSettings)
+            doc_types.add(self.doc_type_boxes[doc_type])
+        self.add(doc_types)
+
+        self.carve = JCheckBox("Carve records from unallocated space and pagefiles", actionPerformed=self.saveSettings)
+        self.add(self.carve)
+
+    def customizeComponents(self):
+        self.start_date.setText(self.local_settings.getSetting("start_date") or "")
+        self.end_date.setText(self.local_settings.getSetting("end_date") or "")
+        self.event_ids.setText(self.local_settings.getSetting("event_ids") or "")
+        selected = (self.local_settings.getSetting("doc_types") or "").split(",")
+        for doc_type in DOC_TYPES:
+            self.doc_type_boxes[doc_type].setSelected(doc_type in selected)
+        self.carve.setSelected(self.local_settings.getSetting("carve") == "true")
+
+    def saveSettings(self, event):
+        self.local_settings.setSetting("start_date", self.start_date.getText().strip())
+        self.local_settings.setSetting("end_date", self.end_date.getText().strip())
+        self.local_settings.setSetting("event_ids", self.event_ids.getText().strip())
+        self.local_settings.setSetting("doc_types", ",".join([doc_type for doc_type in DOC_TYPES if self.doc_type_boxes[doc_type].isSelected()]))
+        self.local_settings.setSetting("carve", "true" if self.carve.isSelected() else "false")
+
+    # Return the settings used
+    def getSettings(self):
+        self.saveSettings(None)
+        return self.local_settings
 
 
 # Data source ingest module.  One gets created per data source.
@@ -79,8 +214,9 @@ class MSOfficeTelemProcesser(DataSourceIngestModule):
     def log(self, level, msg):
         self._logger.logp(level, self.__class__.__name__, inspect.stack()[1][3], msg)
 
-    def __init__(self):
+    def __init__(self, settings=None):
         self.context = None
+        self.local_settings = settings
 
     # Where any setup and configuration is done
     # 'context' is an instance of org.sleuthkit.autopsy.ingest.IngestJobContext.
@@ -88,6 +224,26 @@ class MSOfficeTelemProcesser(DataSourceIngestModule):
     def startUp(self, context):
         self.context = context
 
+        # Filters from the ingest settings, checked by the parsers before entries are decoded
+        self.tbl_filter = None
+        self.carve = False
+        if self.local_settings is not None:
+            self.carve = self.local_settings.getSetting("carve") == "true"
+            try:
+                self.tbl_filter = parse_filter_spec(self.local_settings.getSetting("start_date") or "",
+                                                    self.local_settings.getSetting("end_date") or "",
+                                                    self.local_settings.getSetting("event_ids") or "",
+                                                    self.local_settings.getSetting("doc_types") or "")
+            except ValueError as e:
+                raise IngestModuleException("Invalid Office telemetry filter: " + str(e))
+
+        self.cache = None
+        if USE_PARSE_CACHE:
+            try:
+                self.cache = tblCache(PARSE_CACHE_FOLDER)
+            except (IOError, OSError) as e:
+                self.log(Level.WARNING, "Office telemetry parse cache not available: " + str(e))
+
         # TODO: Throw an IngestModule.IngestModuleException exception if there was a problem setting up
         # raise IngestModuleException(IngestModule(), "Oh No!")
         pass
@@ -101,219 +257,594 @@ class MSOfficeTelemProcesser(DataSourceIngestModule):
         # we don't know how much work there is yet
         progressBar.switchToIndeterminate()
 
+        # Time and counters for each phase of the ingest
+        self.stats = ingestStats(PROFILE_PARSERS)
+        self.read_budget = readBudget(PREFETCH_BYTES) if PREFETCH_BYTES > 0 else None
+
         # Use FileManager to get .tbl files
-        # Currently only checking for files in a parent folder whose namee contains "Telemetry"
-        # to get the standard %USERPROFILE%/AppData/Locaaal/Microsoft/Ofice/16.0/Telemetry
+        # All tables are found with a single query, so discovery time does not grow with the number of
+        # table names.
         fileManager = Case.getCurrentCase().getServices().getFileManager()
-        sln_tbl_files = fileManager.findFiles(dataSource, "sln.tbl")
-        evt_tbl_files = fileManager.findFiles(dataSource, "evt.tbl")
-        usr_tbl_files = fileManager.findFiles(dataSource, "user.tbl")
-
-        # Build a dict correlating each AbstractFile object and its Autopsy object ID
-        tbl_file_dict = {}
-        if (len(sln_tbl_files) > 0 and len(evt_tbl_files) > 0 and len(usr_tbl_files) > 0):
-            for file in sln_tbl_files:
-                tbl_file_dict[file.getId()] = file
-            for file in evt_tbl_files:
-                tbl_file_dict[file.getId()] = file
-            for file in usr_tbl_files:
-                tbl_file_dict[file.getId()] = file
-
-        # Get total # of files for the progress bar
-        numFiles = (len(sln_tbl_files) + len(evt_tbl_files) + len(usr_tbl_files))
-        self.log(Level.INFO, "Found " + str(numFiles) + " Office telemetry files")
-        progressBar.switchToDeterminate(numFiles)
-        artifactCount = 0
-
-        files_to_analyze = correlate_tbl_files(sln_tbl_files, evt_tbl_files, usr_tbl_files)
-
+        with self.stats.timer('discovery'):
+            tbl_files = fileManager.findFiles(dataSource, "%.tbl")
+        self.fingerprints = {}
+        tbl_file_dict, files_to_analyze, duplicate_sources = discover_tbl_sets(tbl_files, self.stats, self.log, self.fingerprints)
+        progressBar.switchToDeterminate(max(len(files_to_analyze), 1))
+        poster = ArtifactPoster(self.log)
+        module_folder = os.path.join(Case.getCurrentCase().getModuleDirectory(), "MSOT")
+        checkpoints = tblCheckpoints(os.path.join(module_folder, "checkpoints"))
+
+        # Each tbl set is independent, so sets are read, parsed and joined on a pool of worker threads.
+        # Results come back through a bounded queue, and artifacts are only ever created on this thread.
+        pending_sets = Queue.Queue()
         for tbl_set in files_to_analyze:
-
-            sln_object = tbl_file_dict[tbl_set[0]]
-            evt_object = tbl_file_dict[tbl_set[1]]
-            usr_object = tbl_file_dict[tbl_set[2]]
-
-            # Read the contents of each file into Java zeros object
-            sln_size = int(sln_object.getSize())
-            sln_buffer = zeros(sln_size, 'b')
-            sln_object.read(sln_buffer, 0, sln_size)
-
-            evt_size = int(evt_object.getSize())
-            evt_buffer = zeros(evt_size, 'b')
-            evt_object.read(evt_buffer, 0, evt_size)
-
-            usr_size = int(sln_object.getSize())
-            usr_buffer = zeros(usr_size, 'b')
-            usr_object.read(usr_buffer, 0, usr_size)
-
-            # Ensure the .tbl files are valid Office telemetry files
-            if validate_tbl_format(sln_buffer) != 'sln':
-                continue
-            if validate_tbl_format(evt_buffer) != 'evt':
-                continue
-            if validate_tbl_format(usr_buffer) != 'user':
-                continue
-
-            # If the tables have validated, parse them
-            sln_table = slnTable(sln_buffer)
-            sln_table.parse_entries()
-            evt_table = evtTable(evt_buffer, evt_object.getId())
-            evt_table.parse_entries()
-            user_table = userTable(usr_buffer)
-            user_table.parse_entries()
-
-            # Set some local references for the user data that will be added to the output file
-            user = user_table.entries[1]
-            host = user_table.entries[3] + "." + user_table.entries[4]
-
-            # docid offsets will be a dict formatted as:
-            # docid : [[sln_table_offsets], [evt_table_offsets]]
-            docid_offsets = build_entry_dict(sln_table, evt_table)
+            pending_sets.put(tbl_set)
+        results_queue = Queue.Queue(RESULTS_QUEUE_SIZE)
+        self.stopped = threading.Event()
+        workers = []
+        for worker_num in range(min(TBL_SET_WORKERS, len(files_to_analyze))):
+            worker = threading.Thread(target=self.tbl_set_worker, args=(pending_sets, results_queue, tbl_file_dict, checkpoints))
+            worker.setDaemon(True)
+            worker.start()
+            workers.append(worker)
+
+        completed = 0
+        while completed < len(files_to_analyze):
+            try:
+                message, tbl_set, value = results_queue.get(True, QUEUE_POLL_SECONDS)
+            except Queue.Empty:
+                message = None
+                # Sets left when every worker has died are never going to be processed
+                if not any(w.isAlive() for w in workers) and results_queue.empty():
+                    self.log(Level.SEVERE, "Office telemetry workers stopped with " + str(len(files_to_analyze) - completed) + " table sets left")
+                    break
 
             # Check if the user pressed cancel while we were busy
             if self.context.isJobCancelled():
+                self.stopped.set()
+                with self.stats.timer('posting'):
+                    poster.flush()
+                self.report_stats(poster)
                 return IngestModule.ProcessResult.OK
 
-            # Create a 2 dimensional list to hold the final entries before writing to file.
-            # Each entry will be appended to this list as a sub-list.
-            results = []
-
-            for docid in docid_offsets:
-
-                # Get all the sln table values for this document
-                # Assume the SLN table does not contain duplicate entries for this.
-                doc_path   = (sln_table.entries[docid_offsets[docid][0][0]][3]) + "\\" + (sln_table.entries[docid_offsets[docid][0][0]][2])
-                doc_id     = sln_table.entries[docid_offsets[docid][0][0]][1]
-                doc_type   = sln_table.entries[docid_offsets[docid][0][0]][0]
-                doc_title  = sln_table.entries[docid_offsets[docid][0][0]][4]
-                doc_author = sln_table.entries[docid_offsets[docid][0][0]][5]
-                addin_name = sln_table.entries[docid_offsets[docid][0][0]][6]
-                desc       = sln_table.entries[docid_offsets[docid][0][0]][7]
-
-                # Get the evt table values for this document. There can be multiple entries per docid.
-                for entry in range(len(docid_offsets[docid][1])):
-                    if entry:
-                        timestamp  = evt_table.entries[docid_offsets[docid][1][entry]][5].strftime('%Y-%m-%d %H:%M:%S.%f')
-                        entry_num  = evt_table.entries[docid_offsets[docid][1][entry]][0]
-                        event_id   = evt_table.entries[docid_offsets[docid][1][entry]][2]
-                        event_desc = evt_table.entries[docid_offsets[docid][1][entry]][3]
-                        objId      = evt_table.entries[docid_offsets[docid][1][entry]][6]
-
-                        results.append([timestamp, entry_num, event_id, event_desc, doc_id, doc_title, doc_path, doc_type, doc_author, addin_name, desc, user, host, objId])
-                        artifactCount += 1
-
-            for result in results:
-
-                # Get the Autopsy object for the evt.tbl that create the artifact
-                sourcefile = tbl_file_dict[result[13]]
-
-                # Make an artifact on the blackboard.
-                artifact = sourcefile.newArtifact(BlackboardArtifact.ARTIFACT_TYPE.TSK_RECENT_OBJECT)
-                # Add Path attribute: MS Office document reported by telemetry
-                artifact.addAttribute(BlackboardAttribute(BlackboardAttribute.ATTRIBUTE_TYPE.TSK_PATH.getTypeID(), MSOfficeTelemProcessFactory.moduleName, result[6]))
-                # Add Datetime attribute: time of document open/closed reported by telemetry
-                event_datetime = int((datetime.strptime(result[0], "%Y-%m-%d %H:%M:%S.%f") - datetime(1970, 1, 1)).total_seconds())
-                artifact.addAttribute(BlackboardAttribute(BlackboardAttribute.ATTRIBUTE_TYPE.TSK_DATETIME.getTypeID(), MSOfficeTelemProcessFactory.moduleName, event_datetime))
-                # Add Description attribute based on event ID
-                artifact.addAttribute(BlackboardAttribute(BlackboardAttribute.ATTRIBUTE_TYPE.TSK_COMMENT.getTypeID(), MSOfficeTelemProcessFactory.moduleName, result[3]))
-                # Add Username attribute
-                artifact.addAttribute(BlackboardAttribute(BlackboardAttribute.ATTRIBUTE_TYPE.TSK_USER_NAME.getTypeID(), MSOfficeTelemProcessFactory.moduleName, result[11]))
-
-def correlate_tbl_files(sln_tbl_files, evt_tbl_files, usr_tbl_files):
-
-    """ Iterate through lists of .tbl files found on the data source, and group them by
-        file path. Returns list of tuples, each tuple is a group of correlated
-        .tbl files.
-
-        TODO: Multiple groups of .tbl files in a single directory are going to
-        break the parser. """
-
-    # Create dicts with key: path and value: object ID
-    sln_dict = {}
-    evt_dict = {}
-    usr_dict = {}
-    for sln_file in sln_tbl_files:
-        folderpath = sln_file.getUniquePath()[:-7]
-        sln_dict[folderpath] = sln_file.getId()
-    for evt_file in evt_tbl_files:
-        folderpath = evt_file.getUniquePath()[:-7]
-        evt_dict[folderpath] = evt_file.getId()
-    for usr_file in usr_tbl_files:
-        folderpath = usr_file.getUniquePath()[:-8]
-        usr_dict[folderpath] = usr_file.getId()
-
-    # Find common path values across dicts. If path exists in all 3 dicts,
-    # add to the common_paths list.
-    common_paths = []
-    for path in sln_dict:
-        if ((path in evt_dict) and (path in usr_dict)):
-            common_paths.append(path)
-
-    # Create a list of tuples of correlated .tbl files
+            if message == 'results':
+                batch, resume = value
+                with self.stats.timer('posting'):
+                    for result in batch:
+                        # Post an artifact for the evt.tbl that created the entry, and for each identical copy of it
+                        poster.post(tbl_file_dict[result[13]], result)
+                        for duplicate in duplicate_sources[result[13]]:
+                            poster.post(duplicate, result)
+                # The artifacts are created as they are posted, so the set is carried on after this batch if
+                # the job is cancelled or the worker fails before the set is done
+                if resume is not None:
+                    checkpoint_id, checkpoint = resume
+                    checkpoints.set(checkpoint_id, checkpoint)
+            elif message == 'done':
+                with self.stats.timer('posting'):
+                    poster.flush()
+                # Everything up to the last complete evt entry of the set has been posted
+                if value is not None:
+                    checkpoint_id, checkpoint = value
+                    checkpoints.set(checkpoint_id, checkpoint)
+                completed += 1
+                progressBar.progress(completed)
+
+        # Recover records from outside the intact tables
+        if self.carve:
+            self.carve_data_source(dataSource, fileManager, poster, progressBar, checkpoints)
+
+        with self.stats.timer('posting'):
+            poster.flush()
+        self.log(Level.INFO, "Posted " + str(poster.posted) + " Office telemetry artifacts")
+        self.report_stats(poster)
+        return IngestModule.ProcessResult.OK
+
+    def carve_data_source(self, dataSource, fileManager, poster, progressBar, checkpoints):
+
+        ''' Carve sln entries, evt entries and user.tbl files out of the unallocated space and pagefiles
+            of the data source, then join the recovered records and post them like those of intact tables,
+            on the file they were carved from. The evt entries posted from each file are kept in checkpoints
+            as ranges of offsets, and entries posted by an earlier ingest are not posted again. '''
+
+        carve_files = list(Case.getCurrentCase().getSleuthkitCase().findAllFilesWhere(
+            "data_source_obj_id = " + str(dataSource.getId()) +
+            " AND type = " + str(TskData.TSK_DB_FILES_TYPE_ENUM.UNALLOC_BLOCKS.getFileType())))
+        for name in CARVE_FILE_NAMES:
+            carve_files.extend(fileManager.findFiles(dataSource, name))
+        self.log(Level.INFO, "Carving " + str(len(carve_files)) + " files for Office telemetry records")
+        progressBar.switchToDeterminate(max(len(carve_files), 1))
+
+        carvers = []
+        for number in range(len(carve_files)):
+            if self.context.isJobCancelled():
+                return
+            progressBar.progress("Carving " + carve_files[number].getName(), number)
+            carver = tblCarver()
+            with self.stats.timer('carve'):
+                carver.carve_stream(TimedStream(TblStream(carve_files[number], buffer_size=CARVE_CHUNK_SIZE), self.stats),
+                                    cancelled=self.context.isJobCancelled)
+            self.stats.count('carved_bytes', int(carve_files[number].getSize()))
+            self.stats.count('carved_sln_entries', len(carver.sln_table.entries))
+            self.stats.count('carved_evt_entries', len(carver.evt_entries))
+            self.stats.count('carved_user_tables', len(carver.user_tables))
+            carvers.append(carver)
+
+        # Documents carved from one file can match events carved from another
+        sln_table = merge_carved_sln(carvers)
+        sln_guids = set([binascii.unhexlify(entry.doc_id) for entry in sln_table.entries.values()])
+        user_tables = [user_table for file_carver in carvers for user_table in file_carver.user_tables]
+        for number in range(len(carvers)):
+            carver = carvers[number]
+            carve_file = carve_files[number]
+            checkpoint_id = carve_checkpoint_key(carve_file.getId(), carve_file.getUniquePath())
+            previous = checkpoints.get(checkpoint_id)
+            ranges = previous.get('posted_ranges', []) if previous is not None else []
+            evt_entries = [entry for entry in carver.evt_entries if not in_ranges(entry[0], ranges)]
+            self.stats.count('carved_evt_entries_posted_before', len(carver.evt_entries) - len(evt_entries))
+            if not evt_entries:
+                continue
+            if carver.user_tables:
+                user_table = carver.user_tables[0]
+            elif user_tables:
+                user_table = user_tables[0]
+            else:
+                user_table = blank_user_table()
+            evt_table = evtTable(None, carve_file.getId())
+            with self.stats.timer('join'):
+                results = list(iter_results(sln_table, evt_table, user_table, evt_entries))
+            self.stats.count('carved_results', len(results))
+            with self.stats.timer('posting'):
+                for result in results:
+                    poster.post(carve_file, result)
+                poster.flush()
+
+            # The entries joined are those whose document was carved; the others may still be joined
+            # with a document carved by a later ingest.
+            joined_offsets = set([entry[0] for entry in evt_entries if entry[4] in sln_guids])
+            if joined_offsets:
+                checkpoints.set(checkpoint_id, {'posted_ranges': posted_ranges([entry[0] for entry in carver.evt_entries],
+                                                                               ranges, joined_offsets)})
+
+    def report_stats(self, poster):
+
+        ''' Post the ingest statistics as an ingest message, and write them (and the parser profile, if
+            profiling is on) to the module output folder. '''
+
+        self.stats.count('artifacts', poster.posted)
+        self.stats.finish()
+        summary = self.stats.summary()
+        self.log(Level.INFO, "Office telemetry ingest statistics:\n" + summary)
+        IngestServices.getInstance().postMessage(IngestMessage.createMessage(IngestMessage.MessageType.INFO,
+            MSOfficeTelemProcessFactory.moduleName, "Office telemetry ingest statistics", summary.replace("\n", "<br>")))
+
+        if WRITE_STATS_JSON or PROFILE_PARSERS:
+            output_dir = os.path.join(Case.getCurrentCase().getModuleDirectory(), "MSOT")
+            if not os.path.exists(output_dir):
+                os.makedirs(output_dir)
+            run_time = time.strftime("%Y%m%d_%H%M%S")
+            if WRITE_STATS_JSON:
+                self.stats.write_json(os.path.join(output_dir, "ingest_stats_" + run_time + ".json"))
+            if PROFILE_PARSERS:
+                self.stats.write_profile(os.path.join(output_dir, "parser_profile_" + run_time + ".pstats"))
+
+    def tbl_set_worker(self, pending_sets, results_queue, tbl_file_dict, checkpoints):
+
+        ''' Worker thread: take tbl sets from pending_sets until it is empty, and put batches of their
+            results on results_queue, followed by a 'done' message for each set. The 'done' message is
+            sent even if the thread is killed by a Java Error, which Exception does not catch. '''
+
+        while not self.stopped.isSet():
+            try:
+                tbl_set = pending_sets.get_nowait()
+            except Queue.Empty:
+                return
+            checkpoint = None
+            try:
+                checkpoint = self.stats.profiled(self.process_tbl_set, tbl_set, tbl_file_dict, checkpoints, results_queue)
+            except Exception as e:
+                self.log(Level.SEVERE, "Error processing Office telemetry files " + str(tbl_set) + ": " + str(e))
+            finally:
+                sent = self.put_result(results_queue, ('done', tbl_set, checkpoint))
+            if not sent:
+                return
+
+    def put_result(self, results_queue, message):
+
+        ''' Put a message on the bounded results queue, waiting for room. Returns False if the job was
+            cancelled in the meantime. '''
+
+        with self.stats.timer('queue_wait'):
+            while not self.stopped.isSet() and not self.context.isJobCancelled():
+                try:
+                    results_queue.put(message, True, QUEUE_POLL_SECONDS)
+                    return True
+                except Queue.Full:
+                    pass
+        return False
+
+    def process_tbl_set(self, tbl_set, tbl_file_dict, checkpoints, results_queue):
+
+        ''' Read, parse and join one set of correlated .tbl files, or read its results from the parse
+            cache, putting the results on results_queue in batches. Runs on a worker thread. Returns
+            (checkpoint ID, checkpoint) once all results are queued, or None if the set was skipped or
+            the job was cancelled. '''
+
+        evt_object = tbl_file_dict[tbl_set[1]]
+        stats = self.stats
+        stats.count('tbl_sets')
+
+        filter_key = self.tbl_filter.key() if self.tbl_filter else ''
+        checkpoint_id = checkpoint_key(tbl_set, evt_object.getUniquePath(), filter_key)
+        evt_size = int(evt_object.getSize())
+        evt_prefix = read_tbl_header(evt_object, min(EVT_PREFIX_SIZE, evt_size)).tostring()
+
+        # A set that is new to this case may have been parsed in another one. Sets ingested into this
+        # case before are resumed from their checkpoint instead. The cache is keyed by the MD5s Autopsy
+        # computed, or hashed while looking for duplicates; files that have neither yet are hashed while
+        # they are parsed, and the results stored under that key.
+        cache_writer = None
+        set_hashers = None
+        if self.cache is not None and checkpoints.get(checkpoint_id) is None:
+            fingerprint = self.fingerprints.get(tbl_set)
+            if fingerprint is None:
+                fingerprint = tbl_set_fingerprint(tbl_set, tbl_file_dict, compute=False)
+            if fingerprint is None:
+                set_hashers = [hashlib.md5(), hashlib.md5(), hashlib.md5()]
+            else:
+                with stats.timer('cache'):
+                    cached = self.cache.open_entry(fingerprint + '|' + filter_key)
+                if cached is not None and not ('sln_docids' in cached.meta and 'evt_trailing_bytes' in cached.meta and
+                                               cached.meta.get('evt_offsets')):
+                    # Stored by something that had no checkpoints to resume from, so it cannot be used here
+                    cached.close()
+                    cached = None
+                if cached is not None:
+                    stats.count('cache_hits')
+                    try:
+                        return self.post_cached_set(tbl_set, cached, checkpoint_id, evt_size, evt_prefix, fingerprint, results_queue)
+                    finally:
+                        cached.close()
+            stats.count('cache_misses')
+            cache_writer = self.cache.new_entry()
+        try:
+            checkpoint = self.parse_tbl_set(tbl_set, tbl_file_dict, checkpoints, results_queue, checkpoint_id,
+                                            evt_size, evt_prefix, cache_writer, set_hashers)
+        except:
+            if cache_writer is not None:
+                cache_writer.abort()
+            raise
+        if cache_writer is not None:
+            if checkpoint is None:
+                cache_writer.abort()
+            else:
+                if set_hashers is not None:
+                    fingerprint = ':'.join([hasher.hexdigest() for hasher in set_hashers])
+                with stats.timer('cache'):
+                    cache_writer.commit({'sln_docids': checkpoint[1]['sln_docids'],
+                                         'evt_trailing_bytes': evt_size - checkpoint[1]['evt_offset'],
+                                         'evt_offsets': True},
+                                        fingerprint + '|' + filter_key)
+        return checkpoint
+
+    def post_cached_set(self, tbl_set, cached, checkpoint_id, evt_size, evt_prefix, fingerprint, results_queue):
+
+        ''' Put the results of a tbl set read from the parse cache on results_queue, each batch with the
+            checkpoint to carry on from after it, and return its checkpoint as if it had been parsed. '''
+
+        stats = self.stats
+        evt_objId = tbl_set[1]
+        meta = cached.meta
+        sln_hash = fingerprint.split(':')[0]
+        batch = []
+        offset = None
+        with stats.timer('cache'):
+            for row, offset in cached.iter_rows():
+                batch.append(row + [evt_objId])
+                if len(batch) >= ARTIFACT_BATCH_SIZE:
+                    stats.count('results', len(batch))
+                    resume = (checkpoint_id, resume_checkpoint(offset, EVT_FIRST_ENTRY, {}, evt_prefix, sln_hash, meta['sln_docids']))
+                    if not self.put_result(results_queue, ('results', tbl_set, (batch, resume))):
+                        return None
+                    batch = []
+        stats.count('results', len(batch))
+        if batch:
+            resume = (checkpoint_id, resume_checkpoint(offset, EVT_FIRST_ENTRY, {}, evt_prefix, sln_hash, meta['sln_docids']))
+            if not self.put_result(results_queue, ('results', tbl_set, (batch, resume))):
+                return None
+
+        evt_offset = evt_size - meta['evt_trailing_bytes']
+        return (checkpoint_id, make_checkpoint(evt_offset, evt_prefix, sln_hash, meta['sln_docids']))
+
+    def parse_tbl_set(self, tbl_set, tbl_file_dict, checkpoints, results_queue, checkpoint_id, evt_size, evt_prefix, cache_writer, set_hashers=None):
+
+        ''' Parse and join a tbl set for process_tbl_set, writing its results to cache_writer as well if
+            there is one. set_hashers, if given, are three hashlib objects the whole content of the sln,
+            evt and user tables is hashed into as they are read. '''
+
+        # Streams read ahead on their own threads, closed when the set is done even if it was not read
+        # to the end
+        streams = []
+        try:
+            return self.join_tbl_set(tbl_set, tbl_file_dict, checkpoints, results_queue, checkpoint_id, evt_size, evt_prefix,
+                                     cache_writer, set_hashers, streams)
+        finally:
+            for stream in streams:
+                stream.close()
+
+    def open_tbl_stream(self, abstract_file, streams, position=0, length=None):
+
+        ''' Open a stream over abstract_file from position, of at most length bytes, timing its reads.
+            With read-ahead on, the file is read ahead on a thread and the stream is added to streams
+            to be closed. The time spent waiting on the read-ahead is reported as 'prefetch_wait'. '''
+
+        stream = TblStream(abstract_file, position)
+        if length is not None:
+            stream = LimitedStream(stream, length)
+        stream = TimedStream(stream, self.stats)
+        if self.read_budget is None:
+            return stream
+        stream = PrefetchStream(stream, self.read_budget)
+        streams.append(stream)
+        return TimedStream(stream, self.stats, 'prefetch_wait', None)
+
+    def join_tbl_set(self, tbl_set, tbl_file_dict, checkpoints, results_queue, checkpoint_id, evt_size, evt_prefix, cache_writer, set_hashers, streams):
+
+        ''' Body of parse_tbl_set. Returns the checkpoint, or None if the job was cancelled. '''
+
+        sln_object = tbl_file_dict[tbl_set[0]]
+        evt_object = tbl_file_dict[tbl_set[1]]
+        usr_object = tbl_file_dict[tbl_set[2]]
+        stats = self.stats
+
+        # A set without a checkpoint is parsed from the first evt entry, so evt.tbl can be read ahead
+        # while sln.tbl is parsed. Otherwise where to start depends on what changed in sln.tbl.
+        evt_stream = None
+        previous = checkpoints.get(checkpoint_id)
+        if previous is None:
+            evt_stream = self.open_tbl_stream(evt_object, streams, EVT_FIRST_ENTRY)
+            if set_hashers is not None:
+                # The header is not streamed, but is part of the hash
+                set_hashers[1].update(evt_prefix[:EVT_FIRST_ENTRY])
+                evt_stream = HashingStream(evt_stream, set_hashers[1])
+
+        # The headers were validated during discovery. The sln and evt tables can grow to hundreds of MB,
+        # so they are streamed through a fixed-size window instead of being read in full.
+        with stats.timer('sln_parse'):
+            sln_table = slnTable(None, SLN_SCAN_WORKERS)
+            sln_hasher = set_hashers[0] if set_hashers is not None else hashlib.md5()
+            sln_table.parse_stream(HashingStream(self.open_tbl_stream(sln_object, streams), sln_hasher), sln_filter=self.tbl_filter)
+            sln_hash = sln_hasher.hexdigest()
+            sln_digests = sln_docid_digests(sln_table)
+        stats.count('sln_entries', len(sln_table.entries))
+        stats.count('sln_entries_skipped', sln_table.skipped_entries)
+        stats.count('sln_entries_filtered', sln_table.filtered_entries)
+
+        # evt.tbl is append-only. If this set was ingested before, only the entries added since then
+        # are parsed, plus the earlier entries of any documents added to sln.tbl since.
+        evt_start, rejoin_docids = plan_incremental(previous, evt_size, evt_prefix, sln_hash, sln_digests)
+        if evt_start > EVT_FIRST_ENTRY:
+            self.log(Level.INFO, "Resuming " + evt_object.getUniquePath() + " at offset " + str(evt_start))
+        if evt_stream is None:
+            evt_stream = self.open_tbl_stream(evt_object, streams, evt_start)
+
+        # The user table is a single small record, so it is read in full.
+        with stats.timer('user_parse'):
+            usr_size = int(usr_object.getSize())
+            with stats.timer('read'):
+                usr_buffer = zeros(usr_size, 'b')
+                usr_object.read(usr_buffer, 0, usr_size)
+            stats.count('bytes_read', usr_size)
+            if set_hashers is not None:
+                set_hashers[2].update(usr_buffer.tostring())
+            user_table = userTable(usr_buffer)
+            user_table.parse_entries()
+        stats.count('user_entries')
+
+        # The evt entries are not stored. They are streamed through the join as they are read, and the
+        # results are handed to the writer in batches as soon as they are produced.
+        evt_table = evtTable(None, evt_object.getId())
+        evt_entries = evt_table.iter_stream(evt_stream, position=evt_start, evt_filter=self.tbl_filter)
+
+        # Join the already processed entries of documents that are new in sln.tbl, which had nothing to join with before
+        if rejoin_docids:
+            rejoin_start = min(rejoin_docids.values())
+            earlier_entries = evt_table.iter_stream(self.open_tbl_stream(evt_object, streams, rejoin_start, evt_start - rejoin_start),
+                                                    position=rejoin_start, evt_filter=self.tbl_filter)
+            evt_entries = itertools.chain(iter_rejoin_entries(earlier_entries, rejoin_docids), evt_entries)
+
+        # Each batch goes with the checkpoint to carry on from once it is posted
+        with stats.timer('join'):
+            for batch, offsets in iter_result_batches(sln_table, evt_table, user_table,
+                                                      stats.timed_blocks(evt_entries, 'evt_parse', 'evt_entries'), ARTIFACT_BATCH_SIZE):
+                stats.count('results', len(batch))
+                if cache_writer is not None:
+                    cache_writer.write_rows([result[:13] for result in batch], offsets)
+                if not batch:
+                    continue
+                resume = (checkpoint_id, resume_checkpoint(offsets[-1], evt_start, rejoin_docids, evt_prefix, sln_hash, sln_digests))
+                if not self.put_result(results_queue, ('results', tbl_set, (batch, resume))):
+                    return None
+        stats.count('evt_trailing_bytes', evt_table.trailing_bytes)
+
+        # Checkpoint the last entry actually read, in case the stream ended before the end of the file
+        evt_offset = max(evt_table.end_offset, evt_start)
+        return (checkpoint_id, make_checkpoint(evt_offset, evt_prefix, sln_hash, sln_digests))
+
+
+class ArtifactPoster:
+
+    """ Posts TSK_RECENT_OBJECT artifacts for the joined table entries in batches. The attributes
+        of each artifact are built as one collection and committed with a single addAttributes call.
+        Indexing and the ModuleDataEvent are done once per batch of batch_size artifacts. """
+
+    def __init__(self, log, batch_size=ARTIFACT_BATCH_SIZE):
+        self.log = log
+        self.batch_size = batch_size
+        self.blackboard = Case.getCurrentCase().getServices().getBlackboard()
+        self.pending = ArrayList()
+        self.posted = 0
+
+    def post(self, sourcefile, result):
+
+        ''' Create the artifact for one result row from iter_results on sourcefile. '''
+
+        moduleName = MSOfficeTelemProcessFactory.moduleName
+        attributes = ArrayList()
+        # Add Path attribute: MS Office document reported by telemetry
+        attributes.add(BlackboardAttribute(BlackboardAttribute.ATTRIBUTE_TYPE.TSK_PATH.getTypeID(), moduleName, result[6]))
+        # Add Datetime attribute: time of document open/closed reported by telemetry, already in epoch seconds.
+        # Entries with a zero FILETIME have no time to report.
+        if result[0] is not None:
+            attributes.add(BlackboardAttribute(BlackboardAttribute.ATTRIBUTE_TYPE.TSK_DATETIME.getTypeID(), moduleName, result[0]))
+        # Add Description attribute based on event ID
+        attributes.add(BlackboardAttribute(BlackboardAttribute.ATTRIBUTE_TYPE.TSK_COMMENT.getTypeID(), moduleName, result[3]))
+        # Add Username attribute
+        attributes.add(BlackboardAttribute(BlackboardAttribute.ATTRIBUTE_TYPE.TSK_USER_NAME.getTypeID(), moduleName, result[11]))
+
+        # Make an artifact on the blackboard.
+        artifact = sourcefile.newArtifact(BlackboardArtifact.ARTIFACT_TYPE.TSK_RECENT_OBJECT)
+        artifact.addAttributes(attributes)
+        self.pending.add(artifact)
+        if self.pending.size() >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+
+        ''' Index the pending artifacts for keyword search and tell the UI about them with one event. '''
+
+        if self.pending.isEmpty():
+            return
+        for artifact in self.pending:
+            try:
+                self.blackboard.indexArtifact(artifact)
+            except Blackboard.BlackboardException:
+                self.log(Level.SEVERE, "Error indexing artifact " + str(artifact.getArtifactID()))
+        IngestServices.getInstance().fireModuleDataEvent(
+            ModuleDataEvent(MSOfficeTelemProcessFactory.moduleName, BlackboardArtifact.ARTIFACT_TYPE.TSK_RECENT_OBJECT, self.pending))
+        self.posted += self.pending.size()
+        self.pending = ArrayList()
+
+
+class TblStream:
+
+    """ File-like wrapper around a ReadContentInputStream, so the table parsers can read an
+        AbstractFile in windows. Every read goes through one reusable Java buffer. """
+
+    def __init__(self, abstract_file, position=0, buffer_size=TBL_CHUNK_SIZE):
+        self.stream = ReadContentInputStream(abstract_file)
+        self.buffer = zeros(buffer_size, 'b')
+        while position > 0:
+            skipped = self.stream.skip(position)
+            if skipped <= 0:
+                break
+            position -= skipped
+
+    def read(self, size):
+        if size > len(self.buffer):
+            self.buffer = zeros(size, 'b')
+        count = self.stream.read(self.buffer, 0, size)
+        if count <= 0:
+            return('')
+        return(self.buffer[:count].tostring())
+
+
+def discover_tbl_sets(tbl_files, stats, log, fingerprints=None):
+
+    """ Turn the .tbl files found on a data source into the sets to parse. Returns
+        (tbl_file_dict, files_to_analyze, duplicate_sources):
+            tbl_file_dict:      Autopsy object ID -> AbstractFile of every valid table
+            files_to_analyze:   unique (sln, evt, user) object ID sets
+            duplicate_sources:  evt object ID of each set -> evt AbstractFiles of its identical copies
+        The fingerprints computed to find duplicates are added to the dict fingerprints, if given, by
+        set, so the files are not hashed again. """
+
+    # Sort the files by name into sln, evt and user tables
+    tbl_files_by_type = {'sln': [], 'evt': [], 'user': []}
+    for tbl_file in tbl_files:
+        name = classify_tbl_name(tbl_file.getName())
+        if name is not None:
+            tbl_files_by_type[name[0]].append(tbl_file)
+    sln_tbl_files = tbl_files_by_type['sln']
+    evt_tbl_files = tbl_files_by_type['evt']
+    usr_tbl_files = tbl_files_by_type['user']
+
+    # Get total # of files for the progress bar
+    numFiles = (len(sln_tbl_files) + len(evt_tbl_files) + len(usr_tbl_files))
+    log(Level.INFO, "Found " + str(numFiles) + " Office telemetry files")
+    stats.count('tbl_files', numFiles)
+
+    # Classify the files by their 16 byte header alone, and drop any that are not valid tables
+    # of the type their name says, before anything else is read from them.
+    read_header = lambda tbl_file: read_tbl_header(tbl_file).tostring()
+    with stats.timer('validation'):
+        sln_tbl_files, sln_rejected = probe_tbl_files(sln_tbl_files, 'sln', read_header)
+        evt_tbl_files, evt_rejected = probe_tbl_files(evt_tbl_files, 'evt', read_header)
+        usr_tbl_files, usr_rejected = probe_tbl_files(usr_tbl_files, 'user', read_header)
+    for tbl_file in sln_rejected + evt_rejected + usr_rejected:
+        log(Level.INFO, "Skipping " + tbl_file.getUniquePath() + ": not a valid Office telemetry table")
+    stats.count('tbl_files_invalid', len(sln_rejected) + len(evt_rejected) + len(usr_rejected))
+
+    # Build a dict correlating each AbstractFile object and its Autopsy object ID
+    tbl_file_dict = {}
+    for file in sln_tbl_files + evt_tbl_files + usr_tbl_files:
+        tbl_file_dict[file.getId()] = file
+
+    if fingerprints is None:
+        fingerprints = {}
+
+    def remember_fingerprint(tbl_set):
+        fingerprints[tbl_set] = tbl_set_fingerprint(tbl_set, tbl_file_dict)
+        return(fingerprints[tbl_set])
+
+    # Byte-identical sets (shadow copies, backups, carved copies) are parsed once. The results of
+    # the parsed set also belong to the evt.tbl of each of its duplicates.
+    # Where a folder holds a deleted table next to the current one of the same name, the current one
+    # is used.
+    with stats.timer('discovery'):
+        correlated_sets, unpaired = correlate_tbl_files(sln_tbl_files, evt_tbl_files, usr_tbl_files,
+                                                        lambda tbl_file: tbl_file.isMetaFlagSet(TskData.TSK_FS_META_FLAG_ENUM.ALLOC))
+        unique_sets = dedup_tbl_sets(correlated_sets, tbl_file_dict, remember_fingerprint)
+    for group in unpaired:
+        log(Level.WARNING, "Skipping Office telemetry files that cannot be paired into sets: " +
+            ", ".join([tbl_file.getUniquePath() for tbl_file in group]))
+    stats.count('tbl_sets_unpaired', len(unpaired))
     files_to_analyze = []
-    for path in common_paths:
-        files_to_analyze.append((sln_dict[path], evt_dict[path], usr_dict[path]))
-
-    # Return compiled list
-    return(files_to_analyze)
-
-
-def validate_tbl_format(infile_content):
-
-    ''' Validate file header of .tbl file. First 8 bytes must be 20 00 00 00 53 44 44 54.
-        Second 8 bytes determine which file (sln, etv, user). '''
-
-    tbl_type = '' # Will hold type of tbl file
-
-    # Grab the first 8 bytes of the file
-    test_block_1 = infile_content[0:8]
-
-    # Header should be 2000000053444454
-    if binascii.hexlify(test_block_1) == '2000000053444454':
-        print('Valid .tbl file found. Checking tbl type...')
-    else:
-        sys.exit('Invalid .tbl file!')
-
-    # Test the next 8 bytes to determine the type of .tbl file.
-    test_block_2 = infile_content[8:16]
-    if binascii.hexlify(test_block_2) == '01000000564e4953':
-        tbl_type = 'sln'
-    elif binascii.hexlify(test_block_2) == '01000000544e5645':
-        tbl_type = 'evt'
-    elif binascii.hexlify(test_block_2) == '0100000052455355':
-        tbl_type = 'user'
-
-    return(tbl_type)
-
-
-def build_entry_dict(sln_table, evt_table):
-
-    ''' Build a dict from the entries parsed from sln_table and evt_table, to associate
-        each docid with the offsets of entries in both tables. '''
-
-    # docid_offsets is a dict with the format:
-    # docid : [[sln_table_offsets], [evt_table_offsets]]
-    docid_offsets = {}
-
-    # Build a list of unique docids from the sln table.
-    table_entries = set()
-    for entry in sln_table.entries:
-        table_entries.add(sln_table.entries[entry][1])
-
-    # Add the offsets from the sln table into docid_offsets
-    for entry in sln_table.entries:
-        if sln_table.entries[entry][1] not in docid_offsets:
-            # Add a new entry to docid_offsets. Add the value for this sln entry.
-            docid_offsets[sln_table.entries[entry][1]] = [[entry,],[]]
-        else:
-            # Append the value for this sln entry
-            # TODO: It doesn't appear the SLN table will contain duplicate DOCID entries.
-            docid_offsets[sln_table.entries[entry][1]][0].append(entry)
-
-    for entry in evt_table.entries:
-        if evt_table.entries[entry][4] not in docid_offsets:
-            pass
-        else:
-            docid_offsets[evt_table.entries[entry][4]][1].append(entry)
-
-    return(docid_offsets)
+    duplicate_sources = {}
+    for tbl_set, duplicates in unique_sets:
+        files_to_analyze.append(tbl_set)
+        duplicate_sources[tbl_set[1]] = [tbl_file_dict[duplicate[1]] for duplicate in duplicates]
+        stats.count('tbl_sets_duplicate', len(duplicates))
+    log(Level.INFO, "Found " + str(len(correlated_sets)) + " Office telemetry table sets, " + str(len(files_to_analyze)) + " unique")
+    return(tbl_file_dict, files_to_analyze, duplicate_sources)
+
+
+def tbl_set_fingerprint(tbl_set, tbl_file_dict, compute=True):
+
+    """ Content hash of a set of (sln, evt, user) files, from the MD5s Autopsy already computed where
+        available. Files without one are hashed here, or with compute False, None is returned instead. """
+
+    hashes = []
+    for objId in tbl_set:
+        abstract_file = tbl_file_dict[objId]
+        md5 = abstract_file.getMd5Hash()
+        if not md5:
+            if not compute:
+                return(None)
+            hasher = hashlib.md5()
+            stream = HashingStream(TblStream(abstract_file), hasher)
+            while stream.read(TBL_CHUNK_SIZE):
+                pass
+            md5 = hasher.hexdigest()
+        hashes.append(md5.lower())
+    return(':'.join(hashes))
+
+
+def read_tbl_header(abstract_file, size=16):
+
+    """ Read only the start of a .tbl file, by default the 16 byte header for validate_tbl_format. """
+
+    header = zeros(size, 'b')
+    if size > 0:
+        abstract_file.read(header, 0, size)
+    return(header)
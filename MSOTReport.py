@@ -0,0 +1,145 @@
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+# General report module for Autopsy. Writes the full joined telemetry timeline,
+# with every field the blackboard artifacts leave out (title, author, add-in,
+# host...), straight from the .tbl files in the case.
+
+import inspect
+import os
+from java.util.logging import Level
+from jarray import zeros
+from org.sleuthkit.autopsy.coreutils import Logger
+from org.sleuthkit.autopsy.casemodule import Case
+from org.sleuthkit.autopsy.report import GeneralReportModuleAdapter
+from org.sleuthkit.autopsy.report.ReportProgressPanel import ReportStatus
+from lib.sln_tbl_parse_aut import *
+from lib.evt_tbl_parse_aut import *
+from lib.user_tbl_parse_aut import *
+from lib.misc_functions_aut import *
+from lib.tbl_functions_aut import *
+from lib.timeline_sinks_aut import *
+from lib.ingest_stats_aut import *
+from lib.tbl_sessions_aut import *
+from lib.tbl_extjoin_aut import *
+from MSOTParser import TblStream, discover_tbl_sets
+
+# Format of the report: "csv", "jsonl" or "sqlite"
+REPORT_FORMAT = "csv"
+
+# File name of the report for each format, relative to the report folder
+REPORT_FILE_NAMES = {"csv": "msot_timeline.csv", "jsonl": "msot_timeline.jsonl", "sqlite": "msot_timeline.db"}
+
+# Memory the joined entries may use while the timeline is put in timestamp order, and the events of the
+# sessions while they are sorted, in bytes each. Entries beyond it are spilled to the temporary folder
+# of the case.
+REPORT_MEMORY_BUDGET = JOIN_MEMORY_BUDGET
+
+# SQLite database the document sessions and per-document summary are written to, next to the timeline
+SESSIONS_FILE_NAME = "msot_sessions.db"
+
+
+class MSOfficeTelemReportModule(GeneralReportModuleAdapter):
+
+    moduleName = "MS Office Telemetry Timeline"
+
+    _logger = Logger.getLogger(moduleName)
+
+    def log(self, level, msg):
+        self._logger.logp(level, self.__class__.__name__, inspect.stack()[1][3], msg)
+
+    def getName(self):
+        return self.moduleName
+
+    def getDescription(self):
+        return "Timeline of every Microsoft Office telemetry entry, with all document, add-in and user fields"
+
+    def getRelativeFilePath(self):
+        return REPORT_FILE_NAMES[REPORT_FORMAT]
+
+    # 'baseReportDir' is the folder the report is written to.
+    # 'progressBar' is of type org.sleuthkit.autopsy.report.ReportProgressPanel
+    def generateReport(self, baseReportDir, progressBar):
+
+        progressBar.setIndeterminate(True)
+        progressBar.start()
+        progressBar.updateStatusLabel("Finding Office telemetry files")
+
+        # All data sources in the case are searched
+        fileManager = Case.getCurrentCase().getServices().getFileManager()
+        tbl_files = fileManager.findFiles("%.tbl")
+        tbl_file_dict, files_to_analyze, duplicate_sources = discover_tbl_sets(tbl_files, ingestStats(), self.log)
+
+        progressBar.setIndeterminate(False)
+        progressBar.setMaximumProgress(max(len(files_to_analyze), 1))
+        progressBar.updateStatusLabel("Writing Office telemetry timeline")
+
+        # The entries of all sets are joined first, so the timeline can be written in timestamp order
+        join = externalJoin(REPORT_MEMORY_BUDGET, Case.getCurrentCase().getTempDirectory())
+        set_sources = {}
+        report_path = os.path.join(baseReportDir, self.getRelativeFilePath())
+        sessions = sessionBuilder(REPORT_MEMORY_BUDGET, Case.getCurrentCase().getTempDirectory())
+        try:
+            for tbl_set in files_to_analyze:
+                evt_object = tbl_file_dict[tbl_set[1]]
+                # One row for the evt.tbl the entry came from, and one for each identical copy
+                set_sources[len(join.sets)] = [evt_object.getUniquePath()] + [duplicate.getUniquePath() for duplicate in duplicate_sources[tbl_set[1]]]
+                try:
+                    join.add_set(*open_tbl_set(tbl_set, tbl_file_dict))
+                except Exception as e:
+                    self.log(Level.SEVERE, "Error processing Office telemetry files " + str(tbl_set) + ": " + str(e))
+                progressBar.increment()
+            if join.runs:
+                self.log(Level.INFO, "Spilled " + str(join.spilled) + " joined entries to " + str(len(join.runs)) + " runs")
+
+            sink = open_sink(REPORT_FORMAT, report_path)
+            try:
+                for set_number, result in join.iter_results():
+                    for source in set_sources[set_number]:
+                        sink.write(result[:13] + [source])
+                    sessions.add(result)
+            finally:
+                sink.close()
+        except:
+            sessions.close()
+            raise
+        finally:
+            join.close()
+
+        Case.getCurrentCase().addReport(report_path, self.moduleName, "Office telemetry timeline")
+        self.log(Level.INFO, "Wrote " + str(sink.written) + " Office telemetry timeline rows to " + report_path)
+
+        progressBar.updateStatusLabel("Writing Office document sessions")
+        sessions_path = os.path.join(baseReportDir, SESSIONS_FILE_NAME)
+        written = write_session_db(sessions_path, sessions)
+        Case.getCurrentCase().addReport(sessions_path, self.moduleName, "Office document sessions and summary")
+        self.log(Level.INFO, "Wrote " + str(written) + " sessions of " + str(len(sessions.index)) + " documents to " + sessions_path)
+        progressBar.complete(ReportStatus.COMPLETE)
+
+
+def open_tbl_set(tbl_set, tbl_file_dict):
+
+    """ Parse the sln and user tables of one set of correlated .tbl files, and open its evt table as a
+        stream. Returns (sln_table, evt_table, user_table, evt entries) for externalJoin.add_set; the
+        evt entries are read as they are joined and never stored. """
+
+    sln_object = tbl_file_dict[tbl_set[0]]
+    evt_object = tbl_file_dict[tbl_set[1]]
+    usr_object = tbl_file_dict[tbl_set[2]]
+
+    sln_table = slnTable(None)
+    sln_table.parse_stream(TblStream(sln_object))
+
+    usr_size = int(usr_object.getSize())
+    usr_buffer = zeros(usr_size, 'b')
+    usr_object.read(usr_buffer, 0, usr_size)
+    user_table = userTable(usr_buffer)
+    user_table.parse_entries()
+
+    evt_table = evtTable(None, evt_object.getId())
+    return((sln_table, evt_table, user_table, evt_table.iter_stream(TblStream(evt_object))))
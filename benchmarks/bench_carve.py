@@ -0,0 +1,89 @@
+###############################################################################
+#
+# Throughput and recovery of the record carver. Builds a blob of random and
+# zero-filled data with a synthetic tbl set scattered through it, carves it
+# in windows, and checks every record was recovered. Runs under CPython 2.7
+# or Jython 2.7:
+#
+#     python benchmarks/bench_carve.py [blob size in MB] [evt entries]
+#
+###############################################################################
+
+import os
+import random
+import StringIO
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from lib.sln_tbl_parse_aut import *
+from lib.evt_tbl_parse_aut import *
+from lib.tbl_carver_aut import *
+from tbl_generator import *
+
+
+def build_blob(size, evt_entries, seed=1):
+
+    ''' Build size bytes of noise (alternating random and zero-filled runs) with the records of a
+        generated tbl set inserted in pieces at random offsets. Returns (blob, sln content, evt content). '''
+
+    sln_file = StringIO.StringIO()
+    generate_sln(sln_file, max(evt_entries // 10, 1), seed=seed)
+    evt_file = StringIO.StringIO()
+    generate_evt(evt_file, evt_entries, [], unknown_ratio=0, seed=seed)
+    user_file = StringIO.StringIO()
+    generate_user(user_file)
+    sln_content = sln_file.getvalue()
+    evt_content = evt_file.getvalue()
+
+    # Keep whole records together, as they would be in freed clusters
+    pieces = [sln_content[40:], evt_content[EVT_FIRST_ENTRY:], user_file.getvalue()]
+    rnd = random.Random(seed)
+    noise = []
+    noise_size = max(size - sum([len(piece) for piece in pieces]), 0)
+    run = 1024 * 1024
+    for start in xrange(0, noise_size, run):
+        length = min(run, noise_size - start)
+        noise.append(os.urandom(length) if rnd.random() < 0.5 else '\x00' * length)
+    noise = ''.join(noise)
+
+    cuts = sorted([rnd.randrange(len(noise) + 1) for piece in pieces])
+    blob = []
+    last = 0
+    for cut, piece in zip(cuts, pieces):
+        blob.append(noise[last:cut])
+        blob.append(piece)
+        last = cut
+    blob.append(noise[last:])
+    return(''.join(blob), sln_content, evt_content)
+
+
+def main():
+
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    evt_entries = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    blob, sln_content, evt_content = build_blob(size_mb * 1024 * 1024, evt_entries)
+
+    carver = tblCarver()
+    start = time.time()
+    carver.carve_stream(StringIO.StringIO(blob))
+    carve_time = time.time() - start
+
+    sln_table = slnTable(sln_content)
+    sln_table.parse_entries()
+    expected_sln = sorted([entry[1] for entry in sln_table.entries.values()])
+    carved_sln = sorted([entry[1] for entry in carver.sln_table.entries.values()])
+    expected_evt = [entry[1:] for entry in iter_evt_entries(evt_content) if plausible_evt_entry(entry[1:])]
+    carved_evt = [entry[1:] for entry in carver.evt_entries]
+
+    print('%d MB blob, %d sln entries, %d evt entries' % (len(blob) // (1024 * 1024), len(expected_sln), len(expected_evt)))
+    print('carved in %.3fs, %.1f MB/s' % (carve_time, len(blob) / (1024.0 * 1024.0) / carve_time))
+    print('recovered %d sln entries, %d evt entries, %d user tables; %d candidates rejected' %
+          (len(carved_sln), len(carved_evt), len(carver.user_tables), carver.rejected))
+    if carved_sln != expected_sln or carved_evt != expected_evt or len(carver.user_tables) != 1:
+        sys.exit('Carved records differ from the inserted tables!')
+
+
+if __name__ == '__main__':
+    main()
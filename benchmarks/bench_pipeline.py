@@ -0,0 +1,168 @@
+###############################################################################
+#
+# Benchmark of each parser, the join and the full headless pipeline over
+# synthetic tables of increasing size. Runs under CPython 2.7 without Autopsy:
+#
+#     python benchmarks/bench_pipeline.py [-s 1000,10000,100000] [-o results.json]
+#                                         [-b baseline.json] [-t 0.25]
+#
+# Sizes are numbers of evt.tbl entries. sln.tbl gets one document per 10 evt
+# entries, so a 10M entry run writes about 1.5GB of evt.tbl and 3GB of sln.tbl.
+# With a baseline from an earlier run, the exit status is 1 if any phase is
+# slower than the baseline by more than the tolerance.
+#
+###############################################################################
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from lib.sln_tbl_parse_aut import *
+from lib.evt_tbl_parse_aut import *
+from lib.user_tbl_parse_aut import *
+from lib.misc_functions_aut import *
+from lib.tbl_functions_aut import *
+from lib.evt_numpy_aut import *
+from lib.tbl_extjoin_aut import *
+from tbl_generator import *
+import MSOTBatch
+
+DEFAULT_SIZES = '1000,10000,100000,1000000'
+
+# Phases measured for each size, in the order they are reported
+PHASES = ['sln_parse', 'evt_parse', 'user_parse', 'join', 'spill_join', 'pipeline']
+
+# Runs the timestamp ordered join of the spill_join phase spills to, through a memory budget of a fraction
+# of the joined entries
+SPILL_RUNS = 8
+
+# The evt.tbl decoding and join of the NumPy backend, from the file content, when NumPy is installed
+if numpy is not None:
+    PHASES.append('numpy_join')
+
+
+def read_file(path):
+    with open(path, 'rb') as infile:
+        return(infile.read())
+
+
+def timed(func, *args):
+
+    ''' Call func(*args), returning (seconds taken, result). '''
+
+    start = time.time()
+    result = func(*args)
+    return(time.time() - start, result)
+
+
+def spill_join(sln_table, evt_table, user_table, folder):
+
+    ''' Join through an externalJoin whose budget holds about 1/SPILL_RUNS of the entries, and return
+        the timestamp ordered results. '''
+
+    join = externalJoin(max(len(evt_table.entries) // SPILL_RUNS, 1) * JOIN_RECORD_COST, folder)
+    join.add_set(sln_table, evt_table, user_table)
+    return([result for set_number, result in join.iter_results()])
+
+
+def bench_size(folder, evt_entries):
+
+    ''' Generate a tbl set with evt_entries entries in folder and time each phase on it.
+        Returns {phase: {'seconds', 'records', 'per_second'}}. '''
+
+    write_tbl_set(folder, evt_entries)
+    sln_path, evt_path, usr_path = [os.path.join(folder, name) for name in ('sln.tbl', 'evt.tbl', 'user.tbl')]
+
+    sln_table = slnTable(read_file(sln_path))
+    evt_table = evtTable(read_file(evt_path), evt_path)
+    user_table = userTable(read_file(usr_path))
+
+    timings = {}
+    timings['sln_parse'] = (timed(sln_table.parse_entries)[0], len(sln_table.entries))
+    timings['evt_parse'] = (timed(evt_table.parse_entries)[0], len(evt_table.entries))
+    timings['user_parse'] = (timed(user_table.parse_entries)[0], 1)
+    seconds, results = timed(list, iter_results(sln_table, evt_table, user_table))
+    timings['join'] = (seconds, len(results))
+    seconds, results = timed(spill_join, sln_table, evt_table, user_table, folder)
+    timings['spill_join'] = (seconds, len(results))
+    if numpy is not None:
+        seconds, results = timed(list, iter_array_results(sln_table, evt_table, user_table,
+                                                          evt_entry_array(evt_table.infile_content)))
+        timings['numpy_join'] = (seconds, len(results))
+    del sln_table, evt_table, user_table, results
+
+    seconds, (tbl_paths, results, error) = timed(MSOTBatch.parse_tbl_set, (sln_path, evt_path, usr_path))
+    if error:
+        sys.exit('Pipeline failed on %s: %s' % (folder, error))
+    timings['pipeline'] = (seconds, len(results))
+
+    phases = {}
+    for phase in timings:
+        seconds, records = timings[phase]
+        phases[phase] = {'seconds': round(seconds, 4), 'records': records,
+                         'per_second': round(records / seconds, 1) if seconds > 0 else None}
+    return(phases)
+
+
+def compare(results, baseline, tolerance):
+
+    ''' List the phases that took more than (1 + tolerance) times as long as in the baseline. '''
+
+    regressions = []
+    for size in sorted(results, key=int):
+        for phase in PHASES:
+            old = baseline.get(size, {}).get(phase)
+            new = results[size][phase]
+            if old and old['seconds'] > 0 and new['seconds'] > old['seconds'] * (1 + tolerance):
+                regressions.append('%s entries, %s: %.3fs against %.3fs' % (size, phase, new['seconds'], old['seconds']))
+    return(regressions)
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Benchmark the telemetry table parsers on synthetic tables.')
+    parser.add_argument('-s', '--sizes', default=DEFAULT_SIZES,
+                        help='comma separated numbers of evt entries (default: %s)' % DEFAULT_SIZES)
+    parser.add_argument('-o', '--output', help='JSON file to write the results to')
+    parser.add_argument('-b', '--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.25,
+                        help='fraction a phase may slow down before it counts as a regression (default: 0.25)')
+    parser.add_argument('-d', '--directory', help='folder for the generated tables (default: a temporary folder)')
+    args = parser.parse_args(argv)
+
+    work_dir = args.directory or tempfile.mkdtemp(prefix='msot_bench_')
+    results = {}
+    try:
+        print('%10s  %-10s  %10s  %10s  %14s' % ('evt size', 'phase', 'records', 'seconds', 'records/s'))
+        for size in [int(size) for size in args.sizes.split(',')]:
+            phases = bench_size(os.path.join(work_dir, str(size)), size)
+            results[str(size)] = phases
+            for phase in PHASES:
+                print('%10d  %-10s  %10d  %10.3f  %14s' % (size, phase, phases[phase]['records'],
+                                                          phases[phase]['seconds'], phases[phase]['per_second']))
+            shutil.rmtree(os.path.join(work_dir, str(size)))
+    finally:
+        if not args.directory:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(results, outfile, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as infile:
+            regressions = compare(results, json.load(infile), args.tolerance)
+        for regression in regressions:
+            print('Regression: ' + regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
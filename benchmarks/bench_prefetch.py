@@ -0,0 +1,110 @@
+###############################################################################
+#
+# Overlap of reading and parsing with read-ahead. A synthetic tbl set is read
+# through a stream throttled to the throughput of a slow image, and parsed and
+# joined the way the ingest module does, with and without PrefetchStream.
+# Runs under CPython 2.7 or Jython 2.7:
+#
+#     python benchmarks/bench_prefetch.py [-e 200000] [-m 50]
+#
+# With read-ahead the wall time should approach the larger of the read time
+# and the parse time, instead of their sum.
+#
+###############################################################################
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from lib.sln_tbl_parse_aut import *
+from lib.evt_tbl_parse_aut import *
+from lib.user_tbl_parse_aut import *
+from lib.misc_functions_aut import *
+from lib.tbl_functions_aut import *
+from lib.tbl_prefetch_aut import *
+from tbl_generator import *
+
+
+class ThrottledStream:
+
+    """ Reads a file no faster than megabytes_per_second, sleeping as a slow image would block. """
+
+    def __init__(self, path, megabytes_per_second):
+        self.infile = open(path, 'rb')
+        self.seconds_per_byte = 1.0 / (megabytes_per_second * 1024 * 1024)
+
+    def read(self, size):
+        data = self.infile.read(size)
+        time.sleep(len(data) * self.seconds_per_byte)
+        return(data)
+
+
+def parse_set(paths, open_stream):
+
+    ''' Parse and join a set from the streams open_stream(path) returns. The evt stream is opened first,
+        so it can be read ahead while sln.tbl is parsed. Returns the number of results. '''
+
+    sln_path, evt_path, usr_path = paths
+    evt_stream = open_stream(evt_path)
+    sln_table = slnTable(None)
+    sln_table.parse_stream(open_stream(sln_path))
+    with open(usr_path, 'rb') as infile:
+        user_table = userTable(infile.read())
+    user_table.parse_entries()
+    evt_table = evtTable(None, evt_path)
+    results = 0
+    for result in iter_results(sln_table, evt_table, user_table, evt_table.iter_stream(evt_stream)):
+        results += 1
+    return(results)
+
+
+def timed(func, *args):
+    start = time.time()
+    result = func(*args)
+    return(time.time() - start, result)
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Time parsing a tbl set from a slow stream, with and without read-ahead.')
+    parser.add_argument('-e', '--entries', type=int, default=200000, help='number of evt entries (default: 200000)')
+    parser.add_argument('-m', '--megabytes', type=float, default=50.0,
+                        help='throughput of the simulated image in MB/s (default: 50)')
+    args = parser.parse_args(argv)
+
+    folder = tempfile.mkdtemp(prefix='msot_bench_')
+    try:
+        write_tbl_set(folder, args.entries)
+        paths = [os.path.join(folder, name) for name in ('sln.tbl', 'evt.tbl', 'user.tbl')]
+        size_mb = sum([os.path.getsize(path) for path in paths[:2]]) / (1024.0 * 1024.0)
+
+        def read_all(path):
+            stream = ThrottledStream(path, args.megabytes)
+            while stream.read(TBL_CHUNK_SIZE):
+                pass
+
+        read_time = timed(lambda: [read_all(path) for path in paths[:2]])[0]
+        parse_time, results = timed(parse_set, paths, lambda path: open(path, 'rb'))
+        serial_time = timed(parse_set, paths, lambda path: ThrottledStream(path, args.megabytes))[0]
+        budget = readBudget()
+        prefetch_time, prefetch_results = timed(parse_set, paths, lambda path: PrefetchStream(ThrottledStream(path, args.megabytes), budget))
+        if prefetch_results != results:
+            sys.exit('Read-ahead gave %d results instead of %d!' % (prefetch_results, results))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    print('%d evt entries, %.1f MB read at %.0f MB/s, %d results' % (args.entries, size_mb, args.megabytes, results))
+    print('%-24s %8.3fs' % ('read only:', read_time))
+    print('%-24s %8.3fs' % ('parse only:', parse_time))
+    print('%-24s %8.3fs' % ('read and parse in turn:', serial_time))
+    print('%-24s %8.3fs  (%.2fx, max of read and parse %.3fs)' %
+          ('with read-ahead:', prefetch_time, serial_time / prefetch_time, max(read_time, parse_time)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+###############################################################################
+#
+# Scaling of the chunk-parallel sln.tbl search and decode with the number of
+# worker threads. Runs under CPython 2.7 or Jython 2.7:
+#
+#     python benchmarks/bench_sln_parallel.py [number of entries] [-w 1,2,4,8]
+#
+# The threads only run in parallel under Jython, which is what Autopsy runs
+# the ingest module with; under CPython the interpreter lock keeps the
+# search to one core, and the numbers show the overhead of the split.
+#
+###############################################################################
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from lib.sln_tbl_parse_aut import *
+from bench_sln_scan import build_sln_content
+
+DEFAULT_WORKERS = '1,2,4,8'
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Time slnTable.parse_entries on 1 to n worker threads.')
+    parser.add_argument('entries', nargs='?', type=int, default=100000, help='number of sln entries (default: 100000)')
+    parser.add_argument('-w', '--workers', default=DEFAULT_WORKERS,
+                        help='comma separated numbers of workers (default: %s)' % DEFAULT_WORKERS)
+    args = parser.parse_args(argv)
+
+    content = build_sln_content(args.entries)
+    size_mb = len(content) / (1024.0 * 1024.0)
+    print('%d entries, %.1f MB' % (args.entries, size_mb))
+    print('%8s  %10s  %10s  %8s' % ('workers', 'seconds', 'MB/s', 'speedup'))
+
+    baseline = None
+    for workers in [int(workers) for workers in args.workers.split(',')]:
+        sln_table = slnTable(content, workers)
+        start = time.time()
+        sln_table.parse_entries()
+        seconds = time.time() - start
+
+        offsets = sorted(sln_table.entries)
+        if baseline is None:
+            baseline = (seconds, offsets)
+        elif offsets != baseline[1]:
+            sys.exit('Entries found on %d workers differ from those found on %d!' % (workers, int(args.workers.split(',')[0])))
+        print('%8d  %10.3f  %10.1f  %7.2fx' % (workers, seconds, size_mb / seconds, baseline[0] / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+###############################################################################
+#
+# Throughput comparison of the sln.tbl entry locator against the legacy
+# byte-by-byte hexlify scanner. Runs under CPython 2.7 or Jython 2.7:
+#
+#     python benchmarks/bench_sln_scan.py [number of entries]
+#
+###############################################################################
+
+import binascii
+import os
+import StringIO
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from lib.sln_tbl_parse_aut import *
+from tbl_generator import *
+
+
+def build_sln_content(num_entries):
+
+    ''' Build an in-memory sln.tbl with num_entries entries. '''
+
+    content = StringIO.StringIO()
+    generate_sln(content, num_entries, bom_ratio=0)
+    return(content.getvalue())
+
+
+def legacy_locate(content):
+
+    ''' The original locator: hexlify every byte and compare it against 0x94. '''
+
+    offsets = []
+    doc_length = len(content)
+    byte = 0
+    while(byte < doc_length):
+        if binascii.hexlify(content[byte:byte+1]) == '94':
+            if binascii.hexlify(content[byte:byte+4]) == '940b0000':
+                offsets.append(byte)
+        byte += 1
+    return(offsets)
+
+
+def main():
+
+    num_entries = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    content = build_sln_content(num_entries)
+    size_mb = len(content) / (1024.0 * 1024.0)
+
+    start = time.time()
+    legacy_offsets = legacy_locate(content)
+    legacy_time = time.time() - start
+
+    sln_table = slnTable(content)
+    start = time.time()
+    sln_table.parse_entries()
+    parse_time = time.time() - start
+
+    if sorted(sln_table.entries) != legacy_offsets:
+        sys.exit('Entry offsets differ from the legacy scanner!')
+
+    print('%d entries, %.1f MB' % (num_entries, size_mb))
+    print('legacy byte scan (locate only):  %8.3fs  %8.1f MB/s' % (legacy_time, size_mb / legacy_time))
+    print('signature search (full parse):   %8.3fs  %8.1f MB/s' % (parse_time, size_mb / parse_time))
+
+
+if __name__ == '__main__':
+    main()
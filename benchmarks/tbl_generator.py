@@ -0,0 +1,182 @@
+###############################################################################
+#
+# Synthetic Office telemetry table generator. Writes valid sln.tbl, evt.tbl
+# and user.tbl files of any size, for benchmarking the parsers without
+# Autopsy or real evidence. Runs under CPython 2.7 or Jython 2.7:
+#
+#     python benchmarks/tbl_generator.py <output folder> <evt entries> [sln entries]
+#
+###############################################################################
+
+import os
+import random
+import struct
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from lib.sln_tbl_parse_aut import *
+from lib.evt_tbl_parse_aut import *
+from lib.misc_functions_aut import *
+
+# File headers checked by validate_tbl_format
+TBL_SIGNATURE = '\x20\x00\x00\x00\x53\x44\x44\x54'
+SLN_HEADER = TBL_SIGNATURE + '\x01\x00\x00\x00\x56\x4e\x49\x53'
+EVT_HEADER = TBL_SIGNATURE + '\x01\x00\x00\x00\x54\x4e\x56\x45'
+USER_HEADER = TBL_SIGNATURE + '\x01\x00\x00\x00\x52\x45\x53\x55'
+
+# Size of user.tbl, up to the end of the Internet Explorer version
+USER_TBL_SIZE = 2404
+
+# Full evt entry including the block length, which the parser skips
+EVT_WRITE_STRUCT = struct.Struct('<IB19xQ4xB3x16s80xQ12x')
+
+# Entries generated per write, so large tables are never held in memory
+WRITE_BATCH = 10000
+
+# Range of generated timestamps: 2016-01-01 to 2019-01-01, as FILETIMEs
+FIRST_TIMESTAMP = 131000256000000000
+LAST_TIMESTAMP = 131907456000000000
+
+
+def utf16_field(text, size):
+
+    ''' Encode text as a NUL padded UTF-16LE field of size bytes. '''
+
+    data = text.encode('utf-16-le')[:size]
+    return(data + '\x00' * (size - len(data)))
+
+
+def make_docid(rnd):
+    return(''.join([chr(rnd.randrange(256)) for i in range(16)]))
+
+
+def sln_entry(docid, number, application_dll, rnd):
+
+    ''' Build one 2964 byte sln.tbl entry, with the fields at the offsets slnTable reads. '''
+
+    entry = bytearray(SLN_ENTRY_SIZE)
+    entry[0:4] = SLN_ENTRY_SIGNATURE
+    entry[4:20] = docid
+    folder = number % 97
+    if application_dll:
+        entry[48:568] = utf16_field(u'addin%d.dll' % number, 520)
+        entry[568:1086] = utf16_field(u'C:\\Program Files\\Vendor %d\\Add-ins' % folder, 518)
+        entry[1116:1120] = '\x09\x00\x00\x00'
+        entry[1156:1228] = utf16_field(u'Add-in %d' % number, 72)
+        entry[1672:1804] = utf16_field(u'Add-in title %d' % number, 132)
+        entry[2192:2706] = utf16_field(u'Description of add-in %d' % number, 514)
+        entry[2706:2963] = utf16_field(u'Vendor %d' % folder, 257)
+    else:
+        entry[48:568] = utf16_field(u'Document %d.docx' % number, 520)
+        entry[568:1086] = utf16_field(u'C:\\Users\\user%d\\Documents\\Folder %d' % (folder % 5, folder), 518)
+        entry[1116:1120] = '\xff\xff\xff\xff'
+        if rnd.random() < 0.2:
+            entry[1144:1148] = EMPTY_STRING_FIELD
+        else:
+            entry[1144:1402] = utf16_field(u'Title of document %d' % number, 258)
+        entry[1402:1672] = utf16_field(u'Author %d' % (number % 13), 270)
+    return(str(entry))
+
+
+def generate_sln(outfile, num_entries, dll_ratio=0.2, bom_ratio=0.01, seed=1):
+
+    ''' Write an sln.tbl with num_entries entries to outfile, a fraction dll_ratio of them application_dll
+        entries. A fraction bom_ratio have a BOM-only doc_name, which the parser skips.
+        Returns the list of docids written. '''
+
+    rnd = random.Random(seed)
+    outfile.write(SLN_HEADER + '\x00' * 24)
+    docids = []
+    for start in xrange(0, num_entries, WRITE_BATCH):
+        entries = []
+        for number in xrange(start, min(start + WRITE_BATCH, num_entries)):
+            docid = make_docid(rnd)
+            entry = sln_entry(docid, number, rnd.random() < dll_ratio, rnd)
+            if rnd.random() < bom_ratio:
+                entry = entry[:48] + EMPTY_STRING_FIELD + entry[52:]
+            else:
+                docids.append(docid)
+            entries.append(entry)
+        outfile.write(''.join(entries))
+    return(docids)
+
+
+def generate_evt(outfile, num_entries, docids, unknown_ratio=0.05, zero_time_ratio=0.01, seed=2):
+
+    ''' Write an evt.tbl with num_entries 156 byte entries to outfile. Entries refer to the given docids,
+        except a fraction unknown_ratio that refer to docids missing from sln.tbl. Timestamps increase
+        through the file; a fraction zero_time_ratio have a zero FILETIME. '''
+
+    rnd = random.Random(seed)
+    pack = EVT_WRITE_STRUCT.pack
+    step = max((LAST_TIMESTAMP - FIRST_TIMESTAMP) // max(num_entries, 1), 1)
+    outfile.write(EVT_HEADER + '\x00' * (EVT_FIRST_ENTRY - 16))
+    for start in xrange(0, num_entries, WRITE_BATCH):
+        entries = []
+        for number in xrange(start, min(start + WRITE_BATCH, num_entries)):
+            if docids and rnd.random() >= unknown_ratio:
+                docid = docids[rnd.randrange(len(docids))]
+            else:
+                docid = make_docid(rnd)
+            timestamp2 = FIRST_TIMESTAMP + number * step
+            timestamp1 = timestamp2 - rnd.randrange(10000000000)
+            if rnd.random() < zero_time_ratio:
+                timestamp2 = 0
+            entries.append(pack(EVT_ENTRY_SIZE, number % 256, timestamp1, rnd.randint(1, 20), docid, timestamp2))
+        outfile.write(''.join(entries))
+
+
+def generate_user(outfile, seed=3):
+
+    ''' Write a user.tbl with every field that userTable reads populated. '''
+
+    rnd = random.Random(seed)
+    user = bytearray(USER_TBL_SIZE)
+    user[0:16] = USER_HEADER
+    user[36:44] = struct.pack('<Q', LAST_TIMESTAMP)
+    user[44:558] = utf16_field(u'analyst%d' % rnd.randrange(1000), 514)
+    user[558:1110] = utf16_field(u'CORP', 552)
+    user[1124:1156] = utf16_field(u'WKS-%04d' % rnd.randrange(10000), 32)
+    user[1156:1668] = utf16_field(u'corp.example.com', 512)
+    # Telemetry agent version 16.0, revision 4266, build 1001
+    user[1668:1676] = struct.pack('>HHHH', 0, 16, 4266, 1001)
+    user[1676:2196] = utf16_field(u'\\\\fileserver\\telemetry$', 520)
+    user[2196:2356] = utf16_field(u'Intel64 Family 6 Model 158', 160)
+    # Logical and physical processors, CPU architecture, RAM, screen height and width
+    user[2356:2380] = struct.pack('>IIIIII', 8, 4, 9, 16384, 1080, 1920)
+    # OS version 10.0, product type 1, build 17134, default UI language and default language
+    user[2380:2396] = struct.pack('>HHHHHHHH', 0, 10, 1, 17134, 1033, 0, 1033, 0)
+    # Internet Explorer version 11.0, revision 17134
+    user[2396:2404] = struct.pack('>HHHH', 0, 11, 17134, 0)
+    outfile.write(str(user))
+
+
+def write_tbl_set(folder, evt_entries, sln_entries=None, seed=1):
+
+    ''' Write a correlated sln.tbl, evt.tbl and user.tbl into folder. sln_entries defaults to one
+        document per 10 evt entries. Returns the folder. '''
+
+    if sln_entries is None:
+        sln_entries = max(evt_entries // 10, 1)
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    with open(os.path.join(folder, 'sln.tbl'), 'wb') as outfile:
+        docids = generate_sln(outfile, sln_entries, seed=seed)
+    with open(os.path.join(folder, 'evt.tbl'), 'wb') as outfile:
+        generate_evt(outfile, evt_entries, docids, seed=seed + 1)
+    with open(os.path.join(folder, 'user.tbl'), 'wb') as outfile:
+        generate_user(outfile, seed=seed + 2)
+    return(folder)
+
+
+def main():
+
+    if len(sys.argv) < 3:
+        sys.exit('Usage: tbl_generator.py <output folder> <evt entries> [sln entries]')
+    sln_entries = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    write_tbl_set(sys.argv[1], int(sys.argv[2]), sln_entries)
+
+
+if __name__ == '__main__':
+    main()
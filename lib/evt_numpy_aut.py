@@ -0,0 +1,122 @@
+###############################################################################
+#
+# NumPy backend for evt.tbl, for bulk processing under CPython. The entries
+# are viewed in place as a structured array, and the FILETIME conversion,
+# event code lookup, filtering and docid join run over whole arrays instead
+# of one entry at a time. NumPy is optional: numpy is None when it is not
+# installed, which is always the case under Jython.
+#
+###############################################################################
+
+import binascii
+from evt_tbl_parse_aut import *
+from tbl_functions_aut import *
+from misc_functions_aut import *
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Layout of an evt.tbl entry, the same fields EVT_ENTRY_STRUCT decodes. The GUID is compared as a
+# fixed 16 byte string.
+if numpy is not None:
+    EVT_DTYPE = numpy.dtype({'names': ['block_length', 'entry_num', 'timestamp1', 'event_id', 'guid', 'timestamp2'],
+                             'formats': ['<u4', 'u1', '<u8', 'u1', 'S16', '<u8'],
+                             'offsets': [0, 4, 24, 36, 40, 136],
+                             'itemsize': EVT_ENTRY_SIZE})
+
+
+def evt_entry_array(content, start=EVT_FIRST_ENTRY):
+
+    ''' View the entries of an evt.tbl held in memory (a string or mmap) as an array of EVT_DTYPE,
+        without copying them. A truncated final entry is left out. '''
+
+    count = max((len(content) - start) // EVT_ENTRY_SIZE, 0)
+    return(numpy.frombuffer(content, EVT_DTYPE, count, start))
+
+
+def filter_evt_array(entries, evt_filter):
+
+    ''' The entries a tblFilter keeps, with the same rules as iter_evt_entries. '''
+
+    if evt_filter is None or not evt_filter.filters_evt():
+        return(entries)
+    keep = numpy.ones(len(entries), bool)
+    if evt_filter.event_ids is not None:
+        keep &= numpy.in1d(entries['event_id'], sorted(evt_filter.event_ids))
+    if evt_filter.start_filetime is not None or evt_filter.end_filetime is not None:
+        timestamps = entries['timestamp2']
+        keep &= timestamps != 0
+        if evt_filter.start_filetime is not None:
+            keep &= timestamps >= numpy.uint64(evt_filter.start_filetime)
+        if evt_filter.end_filetime is not None:
+            keep &= timestamps < numpy.uint64(evt_filter.end_filetime)
+    return(entries[keep])
+
+
+def filetime_array_to_epoch(timestamps):
+
+    ''' Vectorized filetime_to_epoch: an array of FILETIMEs to an int64 array of epoch seconds, with
+        NO_TIMESTAMP where the FILETIME is 0. '''
+
+    epochs = (timestamps.astype('int64') - EPOCH_AS_FILETIME) // HUNDREDS_OF_NS
+    epochs[timestamps == 0] = NO_TIMESTAMP
+    return(epochs)
+
+
+def event_description_array(event_ids, event_codes):
+
+    ''' Look up the description of each event ID in an array, 'Unknown' for IDs not in event_codes. '''
+
+    descriptions = numpy.array(['Unknown'] * 256, object)
+    for event_id, description in event_codes.items():
+        descriptions[event_id] = description
+    return(descriptions[event_ids])
+
+
+def join_evt_array(entries, docid_index):
+
+    ''' Match the GUID of each entry against the docids of build_docid_index with a sorted search.
+        Returns (evt positions, docids): the positions in entries that have a document, in order, and
+        the hex docid each one matched. '''
+
+    if not len(entries) or not docid_index:
+        return(numpy.zeros(0, 'intp'), [])
+    docids = sorted(docid_index)
+    keys = numpy.array([binascii.unhexlify(docid) for docid in docids], 'S16')
+    order = numpy.argsort(keys, kind='mergesort')
+    keys = keys[order]
+
+    guids = entries['guid']
+    found = numpy.minimum(numpy.searchsorted(keys, guids), len(keys) - 1)
+    positions = numpy.nonzero(keys[found] == guids)[0]
+    return(positions, [docids[i] for i in order[found[positions]].tolist()])
+
+
+def iter_array_results(sln_table, evt_table, user_table, entries):
+
+    ''' Same rows as iter_results, joining an array from evt_entry_array instead of iterating the evt
+        entries one at a time. Only the matched entries are ever turned into Python objects. '''
+
+    user = user_table.entries[1]
+    host = user_table.entries[3] + "." + user_table.entries[4]
+    docid_index = build_docid_index(sln_table)
+    objId = evt_table.objId
+
+    positions, docids = join_evt_array(entries, docid_index)
+    matched = entries[positions]
+    timestamps = filetime_array_to_epoch(matched['timestamp2']).tolist()
+    entry_nums = matched['entry_num'].tolist()
+    event_ids = matched['event_id'].tolist()
+    event_descs = event_description_array(matched['event_id'], evt_table.event_codes).tolist()
+
+    joined_fields = {}
+    for i in xrange(len(docids)):
+        sln_fields = joined_fields.get(docids[i])
+        if sln_fields is None:
+            sln_fields = joined_fields[docids[i]] = sln_result_fields(docid_index[docids[i]])
+        doc_id, doc_title, doc_path, doc_type, doc_author, addin_name, desc = sln_fields
+        timestamp = timestamps[i]
+        yield [None if timestamp == NO_TIMESTAMP else timestamp, entry_nums[i], event_ids[i], event_descs[i],
+               doc_id, doc_title, doc_path, doc_type, doc_author, addin_name, desc, user, host, objId]
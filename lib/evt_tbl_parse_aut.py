@@ -1,19 +1,172 @@
+import array
 import binascii
+import bisect
+from itertools import islice
+import struct
 from misc_functions_aut import *
 
+# evt.tbl entries are fixed size blocks that start after the 40 byte file header.
+EVT_FIRST_ENTRY = 40
+EVT_ENTRY_SIZE = 156
+
+# Layout of a single entry, decoded in one call:
+# block length (4, skipped), entry number (1), timestamp 1 (8 at offset 24), event ID (1 at offset 36),
+# GUID (16 at offset 40), timestamp 2 (8 at offset 136). Timestamps are little endian FILETIMEs.
+EVT_ENTRY_STRUCT = struct.Struct('<4xB19xQ4xB3x16s80xQ12x')
+
+
+# Offsets within an entry of the fields a tblFilter checks before the entry is decoded
+EVT_EVENT_ID_OFFSET = 36
+EVT_TIMESTAMP2_OFFSET = 136
+FILETIME_STRUCT = struct.Struct('<Q')
+
+# Entries whose timestamps add_entries converts in one call
+EVT_CONVERT_BATCH = 4096
+
+
+def iter_evt_entries(content, start=EVT_FIRST_ENTRY, base=0, evt_filter=None):
+
+    ''' Walk the buffer one fixed-size entry at a time, yielding (offset, entry_num, timestamp 1,
+        event_id, GUID, timestamp 2) with the raw values. A truncated final entry is not returned.
+        base is the file offset of the start of the buffer when it only holds part of the file.
+
+        With evt_filter (a tblFilter), entries whose event ID byte or timestamp 2 are rejected by it
+        are skipped before the rest of the entry is unpacked. '''
+
+    unpack_from = EVT_ENTRY_STRUCT.unpack_from
+    end = start + ((len(content) - start) // EVT_ENTRY_SIZE) * EVT_ENTRY_SIZE
+    if evt_filter is None or not evt_filter.filters_evt():
+        for byte in xrange(start, end, EVT_ENTRY_SIZE):
+            yield (base + byte + 4,) + unpack_from(content, byte)
+        return
+
+    event_bytes = evt_filter.event_bytes
+    start_filetime = evt_filter.start_filetime
+    end_filetime = evt_filter.end_filetime
+    check_time = start_filetime is not None or end_filetime is not None
+    unpack_filetime = FILETIME_STRUCT.unpack_from
+    for byte in xrange(start, end, EVT_ENTRY_SIZE):
+        if event_bytes is not None and content[byte+EVT_EVENT_ID_OFFSET] not in event_bytes:
+            continue
+        if check_time:
+            timestamp2 = unpack_filetime(content, byte+EVT_TIMESTAMP2_OFFSET)[0]
+            if (timestamp2 == 0 or (start_filetime is not None and timestamp2 < start_filetime) or
+                    (end_filetime is not None and timestamp2 >= end_filetime)):
+                continue
+        yield (base + byte + 4,) + unpack_from(content, byte)
+
+
+# Array type code for 64 bit integers. Python 2 has no 'q' code and 'l' is only 32 bits on Windows,
+# where a double holds the values (offsets and epoch seconds) exactly instead.
+INT64_TYPECODE = 'l' if array.array('l').itemsize >= 8 else 'd'
+
+# Stored in the timestamp columns for entries with no time
+NO_TIMESTAMP = -(2 ** 62)
+
+
+class evtEntries:
+
+    """ Compact store for the entries of an evtTable. Each field is held in its own array, with one
+        element per entry, instead of a list per entry:
+            offsets, entry_num, timestamp 1, event_id, timestamp 2: arrays of numbers
+            docids: index into self.docids, which holds each distinct GUID once
+        The event description is looked up from the event_id code and the Autopsy object ID is
+        stored once for the whole table.
+
+        Entries must be added in file order. The store can be used like the dict it replaces: it is
+        keyed by offset, and store[offset] returns the entry as a list with the same index positions:
+            [entry_num,  timestamp 1, event_id, event_desc, GUID, timestamp 2, Autopsy object ID]
+                 0            1          2         3          4         5              6         """
+
+    def __init__(self, objId, event_codes):
+        self.objId = objId
+        self.event_codes = event_codes
+        self.offsets = array.array(INT64_TYPECODE)
+        self.entry_nums = array.array('B')
+        self.timestamps1 = array.array(INT64_TYPECODE)
+        self.event_ids = array.array('B')
+        self.docid_codes = array.array('i')
+        self.timestamps2 = array.array(INT64_TYPECODE)
+        self.docids = []
+        self.docid_lookup = {}
+
+    def append(self, offset, entry_num, timestamp1, event_id, guid, timestamp2):
+
+        ''' Add an entry. Timestamps are epoch seconds or None, guid is the hex docid. '''
+
+        code = self.docid_lookup.get(guid)
+        if code is None:
+            code = len(self.docids)
+            self.docid_lookup[guid] = code
+            self.docids.append(guid)
+        self.offsets.append(offset)
+        self.entry_nums.append(entry_num)
+        self.timestamps1.append(NO_TIMESTAMP if timestamp1 is None else timestamp1)
+        self.event_ids.append(event_id)
+        self.docid_codes.append(code)
+        self.timestamps2.append(NO_TIMESTAMP if timestamp2 is None else timestamp2)
+
+    def index(self, offset):
+        i = bisect.bisect_left(self.offsets, offset)
+        if i == len(self.offsets) or self.offsets[i] != offset:
+            raise KeyError(offset)
+        return(i)
+
+    def row(self, i):
+
+        ''' The entry at position i, as a list. '''
+
+        timestamp1 = self.timestamps1[i]
+        timestamp2 = self.timestamps2[i]
+        event_id = self.event_ids[i]
+        return([self.entry_nums[i],
+                None if timestamp1 == NO_TIMESTAMP else int(timestamp1),
+                event_id,
+                self.event_codes.get(event_id, 'Unknown'),
+                self.docids[self.docid_codes[i]],
+                None if timestamp2 == NO_TIMESTAMP else int(timestamp2),
+                self.objId])
+
+    def __getitem__(self, offset):
+        return(self.row(self.index(offset)))
+
+    def get(self, offset, default=None):
+        try:
+            return(self[offset])
+        except KeyError:
+            return(default)
+
+    def __contains__(self, offset):
+        try:
+            self.index(offset)
+            return(True)
+        except KeyError:
+            return(False)
+
+    def __len__(self):
+        return(len(self.offsets))
+
+    def __iter__(self):
+        for offset in self.offsets:
+            yield int(offset)
+
+    def keys(self):
+        return(list(self))
+
+    def iteritems(self):
+        for i in xrange(len(self.offsets)):
+            yield (int(self.offsets[i]), self.row(i))
+
+    def items(self):
+        return(list(self.iteritems()))
+
+
 class evtTable:
 
     def __init__(self, infile_content, objId):
-        self.infile_content = infile_content
+        self.infile_content = tbl_buffer(infile_content)
         self.objId = objId
 
-        # dict containing information about each table entry
-        self.entries = {}
-        # entries structure is:
-            # key: offset
-            # value: list [entry_num,  timestamp 1, event_id, event_desc, GUID, timestamp 2, Autopsy object ID]
-            #                 0            1          2         3          4         5              6
-
         # dict containing definitions for the event_id codes. These are listed in full at:
         # https://msdn.microsoft.com/en-us/library/office/jj230106.aspx
         self.event_codes = {
@@ -39,45 +192,77 @@ class evtTable:
             20:"Add-in failed to verify licensing"
         }
 
-    def parse_entries(self):
+        # Store containing information about each table entry
+        self.entries = evtEntries(objId, self.event_codes)
+        # entries structure is:
+            # key: offset
+            # value: list [entry_num,  timestamp 1, event_id, event_desc, GUID, timestamp 2, Autopsy object ID]
+            #                 0            1          2         3          4         5              6
+            # Timestamps are seconds since 01/01/1970, or None if the entry has no time.
+
+    def parse_entries(self, evt_filter=None):
+
+        ''' Decode every entry in the file content in memory, or only those evt_filter (a tblFilter)
+            keeps. '''
+
+        # Number of bytes at the end of the file that do not make up a full entry
+        self.trailing_bytes = (len(self.infile_content) - EVT_FIRST_ENTRY) % EVT_ENTRY_SIZE
+
+        self.add_entries(iter_evt_entries(self.infile_content, evt_filter=evt_filter))
+
+    def parse_stream(self, stream, chunk_size=TBL_CHUNK_SIZE, position=0, evt_filter=None):
+
+        ''' Parse the entries from a file-like object (anything with read(size)) instead of from
+            content held in memory. The stream is positioned at file offset position, which is either
+            the start of the file or the start of an entry. '''
 
-        doc_length = len(self.infile_content)
-        byte = 40 # Start reading the evt file at the first entry
+        self.add_entries(self.iter_stream(stream, chunk_size, position, evt_filter))
 
-        # Search through the file content in memory, looking for the table entries.
-        while(byte < doc_length):
+    def iter_stream(self, stream, chunk_size=TBL_CHUNK_SIZE, position=0, evt_filter=None):
 
-            # The first field is block length, which is always 156
-            # No need to store this field
-            offset = byte + 4
-            self.entries[offset] = []
+        ''' Same as iter_evt_entries, reading the file from a stream in windows of about chunk_size
+            bytes. An entry split between two reads is carried over into the next window, so only
+            one window is held in memory no matter how big the file is.
 
-            # The entry number is the second byte
-            entry_num = self.infile_content[byte+4:byte+5]
-            self.entries[offset].append(int(binascii.hexlify(entry_num), 16))
+            Once the stream is exhausted, self.end_offset is the file offset just past the last
+            complete entry read, which is short of the end of the file if the stream ended early. '''
 
-            # Timestamp at offsets 24 - 31
-            timestamp1 = self.infile_content[byte+24:byte+32]
-            timestamp1_hex = binascii.hexlify(timestamp1)
-            self.entries[offset].append(convert_time(timestamp1_hex))
+        chunk_size = max(chunk_size // EVT_ENTRY_SIZE, 1) * EVT_ENTRY_SIZE
+        window = ''
+        base = position
+        start = max(EVT_FIRST_ENTRY - position, 0)
+        self.end_offset = position
+        while(True):
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            window += chunk
+            if len(window) < start:
+                continue
+            for entry in iter_evt_entries(window, start, base, evt_filter):
+                yield entry
+            consumed = start + ((len(window) - start) // EVT_ENTRY_SIZE) * EVT_ENTRY_SIZE
+            window = window[consumed:]
+            base += consumed
+            start = 0
+            self.end_offset = base
+        self.trailing_bytes = len(window)
 
-            # The event ID is at offset 36 (one byte)
-            event_id = (int(binascii.hexlify(self.infile_content[byte+36:byte+37]), 16))
-            self.entries[offset].append(event_id)
-            # Event ID can be mapped to a text description in self.event_codes
-            if event_id in self.event_codes:
-                event_desc = self.event_codes[event_id]
-            else:
-                event_desc = 'Unknown'
-            self.entries[offset].append(event_desc)
+    def add_entries(self, evt_entries):
 
-            # The GUID is offsets 40-55
-            self.entries[offset].append(binascii.hexlify(self.infile_content[byte+40:byte+56]))
+        ''' Add the raw values from iter_evt_entries to self.entries. '''
 
-            # Timestamp at offsets 136 - 143
-            timestamp2 = self.infile_content[byte+136:byte+144]
-            timestamp2_hex = binascii.hexlify(timestamp2)
-            self.entries[offset].append(convert_time(timestamp2_hex))
-            self.entries[offset].append(self.objId)
+        append = self.entries.append
+        hexlify = binascii.hexlify
+        evt_entries = iter(evt_entries)
 
-            byte += 156 # Jump to next entry
+        # The offset is that of the entry number, 4 bytes into the entry after the block length
+        # (always 156), which is not stored. Both timestamps of a batch of entries are converted at once.
+        while(True):
+            batch = list(islice(evt_entries, EVT_CONVERT_BATCH))
+            if not batch:
+                break
+            timestamps1 = filetimes_to_epoch([entry[2] for entry in batch])
+            timestamps2 = filetimes_to_epoch([entry[5] for entry in batch])
+            for i, (offset, entry_num, timestamp1, event_id, guid, timestamp2) in enumerate(batch):
+                append(offset, entry_num, timestamps1[i], event_id, hexlify(guid), timestamps2[i])
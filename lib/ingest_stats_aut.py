@@ -0,0 +1,194 @@
+###############################################################################
+#
+# Timing and counters for the phases of the telemetry ingest pipeline
+#
+###############################################################################
+
+import itertools
+import json
+import threading
+import time
+
+try:
+    from cProfile import Profile
+except ImportError:
+    # Jython has no cProfile
+    from profile import Profile
+import pstats
+
+# Counter used to report the throughput of each phase
+PHASE_COUNTERS = {
+    'discovery': 'tbl_files',
+    'read': 'bytes_read',
+    'validation': 'tbl_files',
+    'sln_parse': 'sln_entries',
+    'evt_parse': 'evt_entries',
+    'user_parse': 'user_entries',
+    'join': 'results',
+    'posting': 'artifacts',
+    'carve': 'carved_bytes',
+}
+
+# Order phases are reported in
+PHASE_ORDER = ['discovery', 'read', 'prefetch_wait', 'validation', 'cache', 'sln_parse', 'evt_parse', 'user_parse', 'carve', 'join', 'queue_wait', 'posting']
+
+
+class ingestStats:
+
+    """ Collects the wall time spent in each phase and counters for records, bytes, skipped entries and
+        artifacts. Phases can be nested; the time of an inner phase is not counted in the outer one, so
+        reads done while parsing are reported under 'read' only. Safe to use from several threads. """
+
+    def __init__(self, profile=False):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.started = time.time()
+        self.finished = None
+        self.phase_times = {}
+        self.counters = {}
+        self.profile = profile
+        self.profilers = []
+
+    def timer(self, phase):
+
+        ''' Context manager timing a phase: with stats.timer('sln_parse'): ... '''
+
+        return(phaseTimer(self, phase))
+
+    def add_time(self, phase, seconds):
+        with self.lock:
+            self.phase_times[phase] = self.phase_times.get(phase, 0.0) + seconds
+
+    def count(self, counter, amount=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def timed_blocks(self, iterable, phase, counter, block_size=4096):
+
+        ''' Pass the items of iterable through, timing the work of producing them under phase and counting
+            them under counter. Items are pulled in blocks so timing costs little per item. '''
+
+        iterator = iter(iterable)
+        while True:
+            with self.timer(phase):
+                block = list(itertools.islice(iterator, block_size))
+            if not block:
+                return
+            self.count(counter, len(block))
+            for item in block:
+                yield item
+
+    def profiled(self, func, *args):
+
+        ''' Call func(*args), under a profiler if profiling is on. '''
+
+        if not self.profile:
+            return(func(*args))
+        profiler = Profile()
+        try:
+            return(profiler.runcall(func, *args))
+        finally:
+            with self.lock:
+                self.profilers.append(profiler)
+
+    def finish(self):
+        self.finished = time.time()
+
+    def as_dict(self):
+
+        ''' The collected statistics, with the throughput of each phase in items per second. '''
+
+        with self.lock:
+            phase_times = dict(self.phase_times)
+            counters = dict(self.counters)
+        phases = {}
+        for phase in phase_times:
+            seconds = phase_times[phase]
+            phases[phase] = {'seconds': round(seconds, 3)}
+            counter = PHASE_COUNTERS.get(phase)
+            if counter in counters and seconds > 0:
+                phases[phase]['per_second'] = round(counters[counter] / seconds, 1)
+        return({'wall_seconds': round((self.finished or time.time()) - self.started, 3),
+                'phases': phases,
+                'counters': counters})
+
+    def summary(self):
+
+        ''' Human readable summary, one line per phase followed by the counters. '''
+
+        stats = self.as_dict()
+        lines = ['Total wall time: %.3fs' % stats['wall_seconds']]
+        phases = sorted(stats['phases'], key=lambda phase: (PHASE_ORDER.index(phase) if phase in PHASE_ORDER else len(PHASE_ORDER), phase))
+        for phase in phases:
+            line = '%s: %.3fs' % (phase, stats['phases'][phase]['seconds'])
+            if 'per_second' in stats['phases'][phase]:
+                line += ' (%s %s/s)' % (stats['phases'][phase]['per_second'], PHASE_COUNTERS[phase])
+            lines.append(line)
+        for counter in sorted(stats['counters']):
+            lines.append('%s: %s' % (counter, stats['counters'][counter]))
+        return('\n'.join(lines))
+
+    def write_json(self, path):
+        with open(path, 'w') as outfile:
+            json.dump(self.as_dict(), outfile, indent=2, sort_keys=True)
+
+    def write_profile(self, path):
+
+        ''' Save the combined profile of every profiled call in pstats format. Returns False if nothing was profiled. '''
+
+        with self.lock:
+            profilers = list(self.profilers)
+        if not profilers:
+            return(False)
+        combined = pstats.Stats(profilers[0])
+        for profiler in profilers[1:]:
+            combined.add(profiler)
+        combined.dump_stats(path)
+        return(True)
+
+
+class phaseTimer:
+
+    """ Times one phase for ingestStats.timer. The time of phases nested inside it on the same thread
+        is subtracted from it. """
+
+    def __init__(self, stats, phase):
+        self.stats = stats
+        self.phase = phase
+
+    def __enter__(self):
+        stack = getattr(self.stats.local, 'stack', None)
+        if stack is None:
+            stack = self.stats.local.stack = []
+        stack.append(self)
+        self.nested = 0.0
+        self.start = time.time()
+        return(self)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.time() - self.start
+        stack = self.stats.local.stack
+        stack.pop()
+        if stack:
+            stack[-1].nested += elapsed
+        self.stats.add_time(self.phase, elapsed - self.nested)
+        return(False)
+
+
+class TimedStream:
+
+    """ Wraps a file-like object, timing its reads under phase ('read' by default) and counting the
+        bytes under counter, if there is one. """
+
+    def __init__(self, stream, stats, phase='read', counter='bytes_read'):
+        self.stream = stream
+        self.stats = stats
+        self.phase = phase
+        self.counter = counter
+
+    def read(self, size):
+        with self.stats.timer(self.phase):
+            data = self.stream.read(size)
+        if self.counter is not None:
+            self.stats.count(self.counter, len(data))
+        return(data)
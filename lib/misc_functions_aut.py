@@ -6,34 +6,50 @@
 
 from datetime import datetime, timedelta
 from itertools import izip_longest
-import binascii
-import codecs
-
-def convert_time(timestamp):
-    ''' Windows NT time is specified as the number of 100 nanosecond intervals since
-        01/01/1601 00:00:00 UTC. It is stored as a 64 bit value. Python time libraries use
-        the format of seconds since 01/01/1970. '''
-
-    epoch_as_filetime = 116444736000000000
-    hundreds_of_ns = 10000000
-
-    # Convert to little endian before converting to int. Timestamp is a string containing a hex value.
-    # Split into a list (1 byte per element), reverse the list, and convert back to string.
-    timestamp_le = []
-    for offset in range(0, 16, 2):
-        timestamp_le.append(timestamp[offset:offset + 2])
-    timestamp_le = timestamp_le[::-1]
-    timestamp_le = ''.join(timestamp_le)
-
-    # Convert timestamp_le to int
-    timestamp_int = int(timestamp_le, 16)
-    # Make sure timestamp is not 0
-    # If 0, return 1/1/1970
-    # TODO: figure out why there are some 0 values
-    if timestamp_int != 0:
-        return(datetime.utcfromtimestamp((timestamp_int - epoch_as_filetime) / hundreds_of_ns))
-    else:
-        return(1) # Filler value
+import struct
+import threading
+
+# Windows NT time is specified as the number of 100 nanosecond intervals since
+# 01/01/1601 00:00:00 UTC. It is stored as a 64 bit little endian value. Python time libraries use
+# the format of seconds since 01/01/1970.
+EPOCH_AS_FILETIME = 116444736000000000
+HUNDREDS_OF_NS = 10000000
+
+def filetime_to_epoch(timestamp):
+    ''' Convert a FILETIME to seconds since 01/01/1970. The timestamp is either the raw 8 bytes
+        from the .tbl file or the value already read as an integer.
+
+        Some table entries have a FILETIME of 0, meaning no time was recorded. None is returned for
+        these rather than a placeholder date. '''
+
+    if not isinstance(timestamp, (int, long)):
+        timestamp = struct.unpack('<Q', timestamp)[0]
+    if timestamp == 0:
+        return(None)
+    return((timestamp - EPOCH_AS_FILETIME) // HUNDREDS_OF_NS)
+
+
+def filetimes_to_epoch(timestamps):
+    ''' Batch form of filetime_to_epoch. Takes a sequence of FILETIME integers, or a byte string
+        of consecutive little endian FILETIMEs, and returns a list of epoch seconds (None for 0). '''
+
+    if isinstance(timestamps, basestring):
+        timestamps = struct.unpack('<%dQ' % (len(timestamps) // 8), timestamps[:len(timestamps) // 8 * 8])
+    return([(timestamp - EPOCH_AS_FILETIME) // HUNDREDS_OF_NS if timestamp else None for timestamp in timestamps])
+
+
+def epoch_to_filetime(epoch):
+    ''' Convert seconds since 01/01/1970 to a FILETIME integer, the inverse of filetime_to_epoch. '''
+
+    return(epoch * HUNDREDS_OF_NS + EPOCH_AS_FILETIME)
+
+
+def epoch_to_datetime(epoch):
+    ''' Convert epoch seconds from filetime_to_epoch to a UTC datetime, for display only. '''
+
+    if epoch is None:
+        return(None)
+    return(datetime(1970, 1, 1) + timedelta(seconds=epoch))
 
 
 def chunker(data, query_size, fillvalue='0'):
@@ -60,13 +76,102 @@ def string_cleaner(data):
     # Return the string
     return (clean_data_str)
 
-def utf16decode(bytes):
+# Decoded strings keyed by their raw UTF-16LE bytes. Document paths, authors and folder names repeat
+# thousands of times across sln entries and user tables, so each distinct value is decoded once and
+# every entry holding it shares the same string object.
+utf16_cache = {}
+UTF16_CACHE_LIMIT = 65536
+
+def utf16decode(data):
+
+    """ Take the UTF-16LE encoded strings as bytes from .tbl files and decode them,
+        stopping at the first NUL terminator. Jython-compatible. """
+
+    # The terminator is the first 00 00 that falls on a character boundary
+    end = data.find('\x00\x00')
+    while end != -1 and end % 2:
+        end = data.find('\x00\x00', end + 1)
+    if end != -1:
+        data = data[:end]
+    elif len(data) % 2:
+        data = data[:-1]
+
+    text = utf16_cache.get(data)
+    if text is None:
+        text = data.decode('utf-16-le', 'replace')
+        # Drop the byte order mark some fields start with
+        if text[0:1] == u'\ufeff':
+            text = text[1:]
+        if len(utf16_cache) >= UTF16_CACHE_LIMIT:
+            utf16_cache.clear()
+        utf16_cache[data] = text
+    return(text)
+
+
+# Size of the windows .tbl files are read in when they are streamed rather than read in full
+TBL_CHUNK_SIZE = 4 * 1024 * 1024
+
+def tbl_buffer(infile_content):
+
+    """ Return .tbl file content as a searchable byte string. Java byte arrays read
+        by Autopsy are converted once; strings and mmap objects are used as-is. """
+
+    if hasattr(infile_content, 'tostring'):
+        return(infile_content.tostring())
+    return(infile_content)
+
+
+class HashingStream:
+
+    """ Wraps a file-like object and hashes everything read through it. """
+
+    def __init__(self, stream, hasher):
+        self.stream = stream
+        self.hasher = hasher
+
+    def read(self, size):
+        data = self.stream.read(size)
+        self.hasher.update(data)
+        return(data)
+
+
+class LimitedStream:
+
+    """ Wraps a file-like object and stops reading after length bytes. """
+
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.remaining = length
+
+    def read(self, size):
+        if self.remaining <= 0:
+            return('')
+        data = self.stream.read(min(size, self.remaining))
+        self.remaining -= len(data)
+        return(data)
+
+
+def run_in_threads(func, args_list):
+
+    ''' Call func(*args) for each tuple in args_list on its own thread, and return the results in the
+        order of args_list. The first exception raised by any call is raised again here, once all the
+        threads have finished. Under Jython the threads run in parallel; under CPython only code that
+        releases the interpreter lock does. '''
+
+    results = [None] * len(args_list)
+    errors = []
 
-    """ Take the UTF-16LE encoded strings as bytes from .tbl files and convert
-        to a UTF-8 string. Jython-compatible. """
+    def run(index, args):
+        try:
+            results[index] = func(*args)
+        except Exception as e:
+            errors.append(e)
 
-    bytes = binascii.hexlify(bytes)
-    bytes = [bytes[i:i+2] for i in range(0, len(bytes), 2)]
-    bytes = (''.join(filter(lambda a: a !='00', bytes)))
-    bytes = codecs.decode(bytes, 'hex')
-    return(bytes)
+    threads = [threading.Thread(target=run, args=(index, args)) for index, args in enumerate(args_list)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return(results)
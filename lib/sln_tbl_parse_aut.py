@@ -2,128 +2,324 @@ import binascii
 from misc_functions_aut import *
 import codecs
 
+# Every sln.tbl entry starts with its block length, 0x0b94 (2964) bytes, stored little endian.
+# The length doubles as the signature used to locate entries in the file.
+SLN_ENTRY_SIGNATURE = '\x94\x0b\x00\x00'
+SLN_ENTRY_SIZE = 2964
+
+# UTF-16LE string fields that only contain a BOM and no text
+EMPTY_STRING_FIELD = '\xff\xfe\x00\x00'
+
+# Names of the fields of an sln entry, in the index positions of the list slnEntry replaces
+SLN_ENTRY_FIELDS = ('type', 'doc_id', 'doc_name', 'doc_path', 'doc_title', 'doc_author', 'addin_name', 'description')
+
+# Byte ranges within an entry of the string fields doc_name to description, by entry type. The title
+# and author are in different places for application dlls, and only dlls have an add-in name and
+# description. None is a field the entry type does not have.
+SLN_STRING_RANGES = (((48, 568), (568, 1086), (1144, 1402), (1402, 1672), None, None),
+                     ((48, 568), (568, 1086), (1672, 1804), (2706, 2963), (1156, 1228), (2192, 2706)))
+
+# Smallest range of the content a scan worker is given. Smaller content is split between fewer workers.
+SLN_SCAN_MIN_RANGE = 1024 * 1024
+
+
+def sln_string_ranges(item_type):
+    return(SLN_STRING_RANGES[item_type == 'application_dll'])
+
+
+def utf16_field(data):
+
+    ''' The raw bytes of a string field up to its NUL terminator, as utf16decode would decode them. A
+        field holding only a BOM is kept whole, so it still reads as empty. '''
+
+    if data[0:4] == EMPTY_STRING_FIELD:
+        return(EMPTY_STRING_FIELD)
+    end = data.find('\x00\x00')
+    while end != -1 and end % 2:
+        end = data.find('\x00\x00', end + 1)
+    if end != -1:
+        return(data[:end])
+    return(data)
+
+
+def locate_sln_entries(content, start, end):
+
+    ''' Find the entries from position start of content: each match of the signature, with the search
+        resuming after the end of the entry it starts, so entry contents are never rescanned. Only
+        entries starting before end are returned; they may run past it. Returns (offsets, position the
+        search continues from), the position being start when there were no entries. '''
+
+    offsets = []
+    next_search = start
+    limit = min(end + len(SLN_ENTRY_SIGNATURE) - 1, len(content))
+    byte = content.find(SLN_ENTRY_SIGNATURE, start, limit)
+    while(byte != -1):
+        offsets.append(byte)
+        next_search = byte + SLN_ENTRY_SIZE
+        byte = content.find(SLN_ENTRY_SIGNATURE, next_search, limit)
+    return(offsets, next_search)
+
+
+def locate_sln_entries_parallel(content, start, workers):
+
+    ''' Same result as locate_sln_entries(content, start, len(content)), with the content split into
+        ranges searched on up to workers threads at once.
+
+        Each range is searched as if an entry started at its beginning, and its matches read past its
+        end by up to one entry. Where the entries found before a range run into it, the search of that
+        range may have started out of step: its matches are then checked against a search continued
+        from the entry before, up to the first match both have in common. From there on both find the
+        same entries, so the rest of the range is kept as it is. '''
+
+    range_size = max(-(-(len(content) - start) // max(workers, 1)), SLN_SCAN_MIN_RANGE)
+    ranges = [(range_start, min(range_start + range_size, len(content)))
+              for range_start in xrange(start, len(content), range_size)]
+    if len(ranges) < 2:
+        return(locate_sln_entries(content, start, len(content)))
+    found = run_in_threads(locate_sln_entries, [(content, range_start, range_end) for range_start, range_end in ranges])
+
+    offsets = []
+    next_search = start
+    for (range_start, range_end), (range_offsets, range_next) in zip(ranges, found):
+        if next_search <= range_start:
+            offsets.extend(range_offsets)
+            if range_offsets:
+                next_search = range_next
+            continue
+
+        # The last entry before the range ends at next_search, inside it
+        positions = dict([(offset, index) for index, offset in enumerate(range_offsets)])
+        limit = min(range_end + len(SLN_ENTRY_SIGNATURE) - 1, len(content))
+        byte = content.find(SLN_ENTRY_SIGNATURE, next_search, limit)
+        while(byte != -1 and byte not in positions):
+            offsets.append(byte)
+            next_search = byte + SLN_ENTRY_SIZE
+            byte = content.find(SLN_ENTRY_SIGNATURE, next_search, limit)
+        if byte != -1:
+            offsets.extend(range_offsets[positions[byte]:])
+            next_search = range_next
+    return(offsets, next_search)
+
+
+class slnEntry(object):
+
+    """ A single sln.tbl entry. Only the type and docid are decoded when the entry is parsed; the string
+        fields are decoded the first time they are read, and kept. The raw fields come either from the
+        table content, which the entry keeps a reference to along with its offset in it, or from a tuple
+        of the raw field bytes when the content is not kept (see slnTable.parse_stream).
+
+        The fields can still be read by the index positions of the list this replaces. """
+
+    __slots__ = ('type', 'doc_id', 'content', 'start', 'strings')
+
+    def __init__(self, type, doc_id, content, start=None):
+        self.type = type
+        self.doc_id = doc_id
+        self.content = content
+        self.start = start
+        self.strings = None
+
+    def raw_field(self, index):
+
+        ''' Raw bytes of string field index (0 is doc_name, 5 is description), '' if the entry type has
+            no such field. '''
+
+        if self.start is None:
+            return(self.content[index])
+        field_range = sln_string_ranges(self.type)[index]
+        if field_range is None:
+            return('')
+        return(self.content[self.start+field_range[0]:self.start+field_range[1]])
+
+    def string(self, index):
+        if self.strings is None:
+            self.strings = [None] * 6
+        text = self.strings[index]
+        if text is None:
+            raw = self.raw_field(index)
+            # doc_name and doc_path are always decoded, the other fields are blank when they only hold a BOM
+            if index > 1 and (raw == '' or raw[0:4] == EMPTY_STRING_FIELD):
+                text = ''
+            else:
+                text = utf16decode(raw)
+            self.strings[index] = text
+        return(text)
+
+    doc_name = property(lambda self: self.string(0))
+    doc_path = property(lambda self: self.string(1))
+    doc_title = property(lambda self: self.string(2))
+    doc_author = property(lambda self: self.string(3))
+    addin_name = property(lambda self: self.string(4))
+    description = property(lambda self: self.string(5))
+
+    def raw_fields(self):
+
+        ''' The string fields as raw bytes, each cut at its terminator, without decoding any of them. '''
+
+        return(tuple([utf16_field(self.raw_field(index)) for index in range(6)]))
+
+    def __getitem__(self, index):
+        return(getattr(self, SLN_ENTRY_FIELDS[index]))
+
+    def __len__(self):
+        return(len(SLN_ENTRY_FIELDS))
+
+    def __iter__(self):
+        for field in SLN_ENTRY_FIELDS:
+            yield getattr(self, field)
+
+    def __eq__(self, other):
+        return(list(self) == list(other))
+
+    def __ne__(self, other):
+        return(not self == other)
+
+    def __repr__(self):
+        return('slnEntry(%s)' % ', '.join([repr(field) for field in self]))
+
+
 class slnTable:
 
-    def __init__(self, infile_content):
-        self.infile_content = infile_content
+    def __init__(self, infile_content, scan_workers=1):
+        self.infile_content = tbl_buffer(infile_content)
+
+        # Number of threads the content is searched and decoded on, see locate_sln_entries_parallel
+        self.scan_workers = scan_workers
 
         # dict containing information about each table entry
         self.entries = {}
         # entries structure is:
             # key: offset
-            # value: list [type, doc_id,doc_name, doc_path, doc_title, doc_author, addin_name, description]
+            # value: slnEntry [type, doc_id,doc_name, doc_path, doc_title, doc_author, addin_name, description]
             #                 0     1      2         3         4          5             6           7
 
+        # Number of entries found but ignored, because their doc_name is only a BOM
+        self.skipped_entries = 0
+
+        # Number of entries left out because of the document types of a tblFilter
+        self.filtered_entries = 0
+
         # dict containing pattern matches for entry types
         self.item_type_dict = {'user_document':'ffffffff', 'application_dll':'09000000'}
 
     def tester(self):
         return(self.infile_content[0:1])
 
-    def parse_entries(self):
-
-        ''' Search the file for locations of table entries. '''
-
-        doc_length = len(self.infile_content)
-        byte = 0
-
-        # Search through the file content in memory, looking for the table entries.
-        while(byte < doc_length):
-
-            # 1st byte should be 0x94. Binascii will return a string of the hex value
-            if binascii.hexlify(self.infile_content[byte:byte+1]) == '94':
-
-                # test_block will be compared against the pattern header for table entries.
-                test_block = self.infile_content[byte:byte+4]
-
-                # If block matches,
-                if binascii.hexlify(test_block) == '940b0000':
-
-                    # The offset is the current byte number
-                    offset = byte
-                    self.entries[offset] = []
-
-                    # Item type is determined by bytes 1116 - 1119
-                    item_type = self.infile_content[byte+1116:byte+1120]
-                    found_item_type = False
-                    for key, value in self.item_type_dict.items():
-                        if binascii.hexlify(item_type) == value:
-                            self.entries[offset].append(key)
-                            found_item_type = True
-                    if not found_item_type:
-                        self.entries[offset].append('Unknown')
-
-                    # The docid is the 16 bytes after 0x940b
-                    self.entries[offset].append(binascii.hexlify(self.infile_content[byte+4:byte+20]))
-
-                    # The document name is bytes 48 - 567, encoded in UTF-16LE
-                    # Extra whitespace is removed.
-                    # In some cases, the doc_name is just a BOM with no additional text. These entries will be ignored for the time being.
-                    doc_name = self.infile_content[byte+48:byte+568]
-                    if binascii.hexlify(doc_name)[0:8] == 'fffe0000':
-                        del self.entries[offset]
-                        byte += 1
-                        continue
-                    # Remove trailing 00s from doc_name
-                    doc_name = utf16decode(doc_name)
-                    self.entries[offset].append(doc_name)
-
-                    # The document path is bytes 568 - 1086. Because there could be any number of 00s at the end
-                    # of this segment, they need to be removed before converting to text.
-                    doc_path = self.infile_content[byte+568:byte+1086]
-                    doc_path = utf16decode(doc_path)
-                    self.entries[offset].append(doc_path)
-
-                    # The document title is bytes 1144 - 1401 for user documents, and
-                    # 1672-1804 for application dlls.
-                    if self.entries[offset][0] == 'application_dll':
-                        #doc_title = infile_content[byte+1156:byte+1402]
-                        doc_title = self.infile_content[byte+1672:byte+1804]
-                    else:
-                        doc_title = self.infile_content[byte+1144:byte+1402]
-                    if binascii.hexlify(doc_title)[0:8] != 'fffe0000':
-                        # Remove trailing 00s from doc_author
-                        doc_title = utf16decode(doc_title)
-                        self.entries[offset].append(doc_title)
-                    else:
-                        self.entries[offset].append('')
-
-                    # The document author is bytes 1402 - 2192 for user documents, and
-                    # 2706 - 2963 for application dlls.
-                    # Make sure author is not blank before adding the to doc_authors list.
-                    if self.entries[offset][0] == 'application_dll':
-                        doc_author = self.infile_content[byte+2706:byte+2963]
-                    else:
-                        doc_author = self.infile_content[byte+1402:byte+1672]
-                    if binascii.hexlify(doc_author)[0:8] != 'fffe0000':
-                        # Remove trailing 00s from doc_author
-                        doc_author = utf16decode(doc_author)
-                        self.entries[offset].append(doc_author)
-                    else:
-                        self.entries[offset].append('')
-
-                    # Application_dlls have an add-in name field between offsets 1156 - 1227
-                    if self.entries[offset][0] == 'application_dll':
-                        addin_name = self.infile_content[byte+1156:byte+1228]
-                        if binascii.hexlify(addin_name)[0:8] != 'fffe0000':
-                            # Remove trailing 00s from addin_name
-                            addin_name = utf16decode(addin_name)
-                            self.entries[offset].append(addin_name)
-                        else:
-                            self.entries[offset].append('')
-                    else:
-                        self.entries[offset].append('')
-
-                    # Application_dlls also have descriptions between offsets 2192-2705
-                    if self.entries[offset][0] == 'application_dll':
-                        desc = self.infile_content[byte+2192:byte+2706]
-                        if binascii.hexlify(desc)[0:8] != 'fffe0000':
-                            # Remove trailing 00s from desc
-                            desc = utf16decode(desc)
-                            self.entries[offset].append(desc)
-                        else:
-                            self.entries[offset].append('')
-                    else:
-                        self.entries[offset].append('')
-
-            byte += 1
+    def parse_entries(self, sln_filter=None):
+
+        ''' Search the file for locations of table entries. With sln_filter (a tblFilter), only
+            entries of its document types are decoded and stored. '''
+
+        self.parse_window(self.infile_content, 0, 0, True, sln_filter)
+
+    def parse_stream(self, stream, chunk_size=TBL_CHUNK_SIZE, sln_filter=None):
+
+        ''' Parse the entries from a file-like object (anything with read(size)) positioned at the
+            start of the file, in windows of about chunk_size bytes. The unsearched tail of each
+            window, including any entry cut off by the end of the read, is carried over into the
+            next one, so only one window is held in memory no matter how big the file is. The entries
+            keep copies of their raw string fields, cut at their terminators, instead of the window. '''
+
+        chunk_size = max(chunk_size, SLN_ENTRY_SIZE)
+        window = ''
+        base = 0
+        search_from = 0
+        while(True):
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            window += chunk
+            if search_from - base >= len(window):
+                # Still inside the last entry found, nothing to search yet
+                base += len(window)
+                window = ''
+                continue
+            search_from = self.parse_window(window, base, search_from - base, False, sln_filter, False)
+            keep = max(search_from - base, 0)
+            window = window[keep:]
+            base += keep
+        if window and search_from - base < len(window):
+            self.parse_window(window, base, search_from - base, True, sln_filter, False)
+
+    def parse_window(self, content, base, start, final, sln_filter=None, keep_content=True):
+
+        ''' Parse the entries in content, which holds the file from offset base onwards, starting
+            the search at position start of content. Unless final is set, an entry that runs past
+            the end of content is left for the next window. With keep_content the entries refer to
+            content for their string fields, otherwise they copy them. Returns the file offset the
+            search should continue from. '''
+
+        if self.scan_workers > 1:
+            offsets, next_search = locate_sln_entries_parallel(content, start, self.scan_workers)
+        else:
+            offsets, next_search = locate_sln_entries(content, start, len(content))
+
+        # Entries never overlap, so only the last one can run past the end of content. Unless this is the
+        # final window, it is left for the next one.
+        if not final and offsets and offsets[-1] + SLN_ENTRY_SIZE > len(content):
+            self.decode_entries(content, base, offsets[:-1], sln_filter, keep_content)
+            return(base + offsets[-1])
+        self.decode_entries(content, base, offsets, sln_filter, keep_content)
+
+        # A signature can still start in the last few bytes of the window
+        return(base + max(next_search, len(content) - len(SLN_ENTRY_SIGNATURE) + 1))
+
+    def decode_entries(self, content, base, offsets, sln_filter=None, keep_content=True):
+
+        ''' Decode the entries at offsets of content into entries, on scan_workers threads when there
+            are enough of them. '''
+
+        ranges = min(self.scan_workers, len(offsets) * SLN_ENTRY_SIZE // SLN_SCAN_MIN_RANGE)
+        if ranges < 2:
+            self.decode_range(content, base, offsets, sln_filter, keep_content)
+            return
+        range_size = -(-len(offsets) // ranges)
+        parts = []
+        for first in xrange(0, len(offsets), range_size):
+            part = slnTable(None)
+            part.item_type_dict = self.item_type_dict
+            parts.append((part, offsets[first:first+range_size]))
+        run_in_threads(lambda part, part_offsets: part.decode_range(content, base, part_offsets, sln_filter, keep_content), parts)
+        for part, part_offsets in parts:
+            self.entries.update(part.entries)
+            self.skipped_entries += part.skipped_entries
+            self.filtered_entries += part.filtered_entries
+
+    def decode_range(self, content, base, offsets, sln_filter=None, keep_content=True):
+
+        ''' Decode the entries at offsets of content, which holds the file from offset base onwards. '''
+
+        # Reverse lookup of the raw item type bytes to the entry type name
+        item_types = {}
+        for key, value in self.item_type_dict.items():
+            item_types[binascii.unhexlify(value)] = key
+
+        # Document types to keep, checked on the raw type bytes before anything is decoded
+        doc_types = None
+        if sln_filter is not None and sln_filter.filters_sln():
+            doc_types = sln_filter.doc_types
+
+        hexlify = binascii.hexlify
+        entries = self.entries
+        for byte in offsets:
+
+            # In some cases, the doc_name is just a BOM with no additional text. These entries will be ignored for the time being.
+            if content[byte+48:byte+52] == EMPTY_STRING_FIELD:
+                self.skipped_entries += 1
+                continue
+
+            # Item type is determined by bytes 1116 - 1119
+            item_type = item_types.get(content[byte+1116:byte+1120], 'Unknown')
+            if doc_types is not None and item_type not in doc_types:
+                self.filtered_entries += 1
+                continue
+
+            # The docid is the 16 bytes after 0x940b. The string fields are left undecoded until they are
+            # read: most are never used by the join, because their document has no events.
+            doc_id = hexlify(content[byte+4:byte+20])
+            if keep_content:
+                entry = slnEntry(item_type, doc_id, content, byte)
+            else:
+                entry = slnEntry(item_type, doc_id, tuple([utf16_field(content[byte+field[0]:byte+field[1]]) if field else ''
+                                                           for field in sln_string_ranges(item_type)]))
+            entries[base + byte] = entry
@@ -0,0 +1,367 @@
+###############################################################################
+#
+# Parse cache shared between cases. The joined results of a tbl set are
+# stored under the content hash of its files, so the same set found again in
+# another case (re-imaged disks, repeat collections, logical copies of a full
+# image) is not parsed again.
+#
+###############################################################################
+
+import array
+import hashlib
+from itertools import izip
+import json
+import os
+import sys
+import tempfile
+import time
+import zlib
+from evt_tbl_parse_aut import *
+
+# Version of the cached data. Bump it whenever a parser or the layout of the results changes, so that
+# results cached by an older version are never used. Each version has its own folder in the cache.
+CACHE_VERSION = 3
+
+# Size the cache is kept under, in bytes. The entries used longest ago are removed first.
+CACHE_SIZE_LIMIT = 2 * 1024 * 1024 * 1024
+
+# Extension of the cache entry files, and of the files entries are written to before they are complete
+CACHE_FILE_SUFFIX = '.msotc'
+CACHE_TEMP_SUFFIX = '.tmp'
+
+# Rows compressed into an entry at a time when it is written, and bytes decompressed at a time when
+# it is read
+CACHE_BLOCK_ROWS = 65536
+CACHE_READ_SIZE = 256 * 1024
+
+# Seconds after which an unfinished entry is taken to be left over from a job that died
+CACHE_TEMP_AGE = 24 * 60 * 60
+
+# Stored in the offset column for rows written without the offset of their evt entry
+NO_OFFSET = -1
+
+
+class tblCache:
+
+    """ A folder of cache entries, one compressed file per key. An entry is written to a temporary file
+        and renamed into place once it is complete, so readers never see a partial entry, and any
+        number of ingest jobs, in one Autopsy or several, can share the folder.
+
+        An entry file is a zlib stream holding a JSON header with the version, then blocks of rows, each
+        a JSON line with the repeated fields first used in the block followed by the other fields of its
+        rows as arrays (see cacheWriter), and last a JSON line with the key and metadata about the set. Each read of an entry updates its modification time, which is what the least recently used
+        eviction goes by. """
+
+    def __init__(self, folder, size_limit=CACHE_SIZE_LIMIT):
+        self.folder = os.path.join(folder, 'v%d' % CACHE_VERSION)
+        self.size_limit = size_limit
+        if not os.path.isdir(self.folder):
+            try:
+                os.makedirs(self.folder)
+            except OSError:
+                # Another job created it first
+                if not os.path.isdir(self.folder):
+                    raise
+
+    def entry_path(self, key):
+        return(os.path.join(self.folder, hashlib.md5(key).hexdigest() + CACHE_FILE_SUFFIX))
+
+    def open_entry(self, key):
+
+        ''' The cacheEntry of key, or None if there is none. A damaged entry is removed. The entry must
+            be closed once it has been read. '''
+
+        path = self.entry_path(key)
+        try:
+            infile = open(path, 'rb')
+        except IOError:
+            return(None)
+        try:
+            entry = cacheEntry(infile, key)
+        except (ValueError, KeyError, TypeError):
+            infile.close()
+            self.remove(key)
+            return(None)
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return(entry)
+
+    def new_entry(self, key=None):
+
+        ''' A cacheWriter for the entry of key. Nothing is stored until it is committed. The key can be
+            left for commit() when it is only known once the set has been read. '''
+
+        handle, temp_path = tempfile.mkstemp(CACHE_TEMP_SUFFIX, '', self.folder)
+        return(cacheWriter(self, os.fdopen(handle, 'wb'), temp_path, key))
+
+    def remove(self, key):
+        try:
+            os.remove(self.entry_path(key))
+        except OSError:
+            pass
+
+    def evict(self):
+
+        ''' Remove the least recently used entries until the cache is within its size limit, and any
+            unfinished entries left by jobs that died. Files other jobs are still using, or have already
+            removed, are skipped. '''
+
+        entries = []
+        total = 0
+        now = time.time()
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if name.endswith(CACHE_TEMP_SUFFIX):
+                if now - stat.st_mtime > CACHE_TEMP_AGE:
+                    self.remove_file(path)
+                continue
+            if name.endswith(CACHE_FILE_SUFFIX):
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.size_limit:
+                break
+            if self.remove_file(path):
+                total -= size
+
+    def remove_file(self, path):
+        try:
+            os.remove(path)
+            return(True)
+        except OSError:
+            return(False)
+
+
+class cacheWriter:
+
+    """ Writes a cache entry. The rows are stored by column: the fields that repeat for every event of
+        a document (doc_id to host) are stored once per distinct combination, the description once per
+        event ID, and each row as its timestamp, entry number, event ID, the number of its document
+        combination and the file offset of its evt entry, in arrays. The rows are compressed into the temporary file in blocks of
+        CACHE_BLOCK_ROWS as they are written, so only one block is held in memory however many rows the
+        set has. commit() stores the entry and abort() throws it away. """
+
+    def __init__(self, cache, outfile, temp_path, key):
+        self.cache = cache
+        self.outfile = outfile
+        self.temp_path = temp_path
+        self.key = key
+        self.compressor = zlib.compressobj()
+        self.group_lookup = {}
+        self.event_descs = {}
+        self.rows = 0
+        self.new_block()
+        header = {'version': CACHE_VERSION, 'byteorder': sys.byteorder}
+        self.outfile.write(self.compressor.compress(json.dumps(header) + '\n'))
+
+    def new_block(self):
+
+        # Document combinations and event descriptions first seen in the block are stored with it
+        self.new_groups = []
+        self.new_event_descs = {}
+        self.timestamps = array.array('d')
+        self.entry_nums = array.array('B')
+        self.event_ids = array.array('B')
+        self.group_codes = array.array('i')
+        self.offsets = array.array('d')
+
+    def write(self, row, offset=None):
+
+        ''' Add a row of iter_results, without its last field (the Autopsy object ID), and the offset of
+            its evt entry if it is known. '''
+
+        group = tuple(row[4:13])
+        code = self.group_lookup.get(group)
+        if code is None:
+            code = len(self.group_lookup)
+            self.group_lookup[group] = code
+            self.new_groups.append(group)
+        self.timestamps.append(NO_TIMESTAMP if row[0] is None else row[0])
+        self.entry_nums.append(row[1])
+        self.event_ids.append(row[2])
+        self.group_codes.append(code)
+        self.offsets.append(NO_OFFSET if offset is None else offset)
+        if row[2] not in self.event_descs:
+            self.event_descs[row[2]] = self.new_event_descs[row[2]] = row[3]
+        if len(self.timestamps) >= CACHE_BLOCK_ROWS:
+            self.write_block()
+
+    def write_rows(self, rows, offsets=None):
+        if offsets is None:
+            offsets = [None] * len(rows)
+        for row, offset in izip(rows, offsets):
+            self.write(row, offset)
+
+    def write_block(self):
+
+        ''' Compress the rows written since the last block into the file. '''
+
+        if not self.timestamps:
+            return
+        block = {'groups': self.new_groups, 'event_descs': self.new_event_descs.items(), 'rows': len(self.timestamps)}
+        self.outfile.write(self.compressor.compress(json.dumps(block) + '\n'))
+        for column in (self.timestamps, self.entry_nums, self.event_ids, self.group_codes, self.offsets):
+            self.outfile.write(self.compressor.compress(column.tostring()))
+        self.rows += len(self.timestamps)
+        self.new_block()
+
+    def commit(self, meta, key=None):
+
+        ''' Write the last block and meta, a dict of anything else the set needs, and move the entry
+            into place under key, or the key it was created with. If another job stored the same key in
+            the meantime, its entry is kept: both hold the same. '''
+
+        if key is not None:
+            self.key = key
+        self.write_block()
+        self.outfile.write(self.compressor.compress(json.dumps({'rows': self.rows, 'key': self.key, 'meta': meta}) + '\n'))
+        self.outfile.write(self.compressor.flush())
+        self.outfile.close()
+        path = self.cache.entry_path(self.key)
+        try:
+            os.rename(self.temp_path, path)
+        except OSError:
+            # Windows does not rename over an existing file
+            self.cache.remove_file(self.temp_path)
+        self.cache.evict()
+
+    def abort(self):
+        try:
+            self.outfile.close()
+        except IOError:
+            # Flushing what was buffered fails again when the disk is full
+            pass
+        self.cache.remove_file(self.temp_path)
+
+
+class cacheEntry:
+
+    """ A cache entry, read back from the open file infile a block at a time. Iterating over it yields
+        the rows as they were written, iter_rows() the rows with their evt offsets, and meta is the dict
+        given to cacheWriter.commit(). The entry is
+        read through once when it is opened, so that ValueError is raised there, before any row is
+        used, if it is damaged, incomplete, or was written by another version or for another key.
+        close() closes the file. """
+
+    def __init__(self, infile, key):
+        self.infile = infile
+        self.key = key
+        self.meta = None
+        for block in self.iter_blocks():
+            pass
+
+    def iter_blocks(self):
+
+        ''' Read the entry from the start, yielding (groups, event_descs, columns) for each block. groups
+            and event_descs hold everything read so far. Sets self.rows and self.meta at the end. '''
+
+        self.infile.seek(0)
+        reader = zlibReader(self.infile)
+        header = json.loads(reader.readline())
+        if header.get('version') != CACHE_VERSION:
+            raise ValueError('Cache entry is from another version')
+        swap = header.get('byteorder') != sys.byteorder
+
+        groups = []
+        event_descs = {}
+        rows = 0
+        while True:
+            record = json.loads(reader.readline())
+            if 'meta' in record:
+                if record['rows'] != rows:
+                    raise ValueError('Cache entry is incomplete')
+                if record['key'] != self.key:
+                    raise ValueError('Cache entry is for another key')
+                self.rows = rows
+                self.meta = record['meta']
+                return
+            groups.extend(record['groups'])
+            event_descs.update(dict(record['event_descs']))
+            columns = []
+            for typecode in ('d', 'B', 'B', 'i', 'd'):
+                column = array.array(typecode)
+                column.fromstring(reader.read(record['rows'] * column.itemsize))
+                if swap:
+                    column.byteswap()
+                columns.append(column)
+            rows += record['rows']
+            yield groups, event_descs, columns
+
+    def __len__(self):
+        return(self.rows)
+
+    def __iter__(self):
+        for row, offset in self.iter_rows():
+            yield row
+
+    def iter_rows(self):
+
+        ''' Yield (row, offset) for each row, offset being that of its evt entry, or None if it was
+            written without one. '''
+
+        for groups, event_descs, columns in self.iter_blocks():
+            for timestamp, entry_num, event_id, code, offset in izip(*columns):
+                yield ([None if timestamp == NO_TIMESTAMP else int(timestamp), entry_num, event_id, event_descs[event_id]] + groups[code],
+                       None if offset == NO_OFFSET else int(offset))
+
+    def close(self):
+        self.infile.close()
+
+
+class zlibReader:
+
+    """ Reads a zlib compressed file a little at a time, so at most about CACHE_READ_SIZE bytes of it
+        are decompressed ahead of what has been read. Raises ValueError if the data is damaged or ends
+        before what is asked for. """
+
+    def __init__(self, infile):
+        self.infile = infile
+        self.decompressor = zlib.decompressobj()
+        self.buffer = ''
+        self.position = 0
+        self.finished = False
+
+    def fill(self):
+        if self.finished:
+            raise ValueError('Cache entry is incomplete')
+        try:
+            if self.decompressor.unconsumed_tail:
+                data = self.decompressor.decompress(self.decompressor.unconsumed_tail, CACHE_READ_SIZE)
+            else:
+                chunk = self.infile.read(CACHE_READ_SIZE)
+                if chunk:
+                    data = self.decompressor.decompress(chunk, CACHE_READ_SIZE)
+                else:
+                    data = self.decompressor.flush()
+                    self.finished = True
+        except zlib.error as e:
+            raise ValueError('Damaged cache entry: %s' % e)
+        self.buffer = self.buffer[self.position:] + data
+        self.position = 0
+
+    def readline(self):
+
+        ''' Read up to the next newline, which is not returned. '''
+
+        while True:
+            end = self.buffer.find('\n', self.position)
+            if end != -1:
+                line = self.buffer[self.position:end]
+                self.position = end + 1
+                return(line)
+            self.fill()
+
+    def read(self, size):
+        while len(self.buffer) - self.position < size:
+            self.fill()
+        data = self.buffer[self.position:self.position+size]
+        self.position += size
+        return(data)
@@ -0,0 +1,256 @@
+###############################################################################
+#
+# Carving of telemetry table records from unallocated space, pagefiles and
+# any other large content, without intact sln.tbl / evt.tbl / user.tbl files
+#
+###############################################################################
+
+from sln_tbl_parse_aut import *
+from evt_tbl_parse_aut import *
+from user_tbl_parse_aut import *
+from misc_functions_aut import *
+
+# Size of the windows carved content is read in
+CARVE_CHUNK_SIZE = 16 * 1024 * 1024
+
+# Start of a user.tbl file: the .tbl header followed by the user table type
+USER_TBL_HEADER = '\x20\x00\x00\x00\x53\x44\x44\x54\x01\x00\x00\x00\x52\x45\x53\x55'
+USER_TBL_SIZE = 2404
+
+# Every evt.tbl entry starts with its block length, 156, stored little endian
+EVT_ENTRY_SIGNATURE = struct.pack('<I', EVT_ENTRY_SIZE)
+
+# Range of plausible timestamps in carved evt entries, as FILETIMEs: 2010-01-01 to 2040-01-01
+CARVE_MIN_FILETIME = epoch_to_filetime(1262304000)
+CARVE_MAX_FILETIME = epoch_to_filetime(2208988800)
+
+# Event IDs a carved evt entry may have (see evtTable.event_codes)
+CARVE_EVENT_IDS = frozenset(range(1, 21))
+
+
+# Anchor hits in a row that fail the full pattern check before the searcher switches to searching
+# for the whole pattern over the next FULL_SEARCH_SPAN bytes
+ANCHOR_MISS_LIMIT = 16
+FULL_SEARCH_SPAN = 1024 * 1024
+
+
+class multiPatternSearch:
+
+    """ Finds the next match of any of several fixed byte patterns, in file order. Each pattern is
+        found by searching for an anchor, a slice of the pattern picked so the search runs at memchr
+        speed: patterns ending in NUL bytes are slow to search for directly in the zero-filled runs
+        that unallocated space is full of. Every anchor hit is then checked against the whole pattern.
+
+        In random-looking data a short anchor hits too often, so after ANCHOR_MISS_LIMIT false hits
+        in a row the whole pattern is searched for over the next FULL_SEARCH_SPAN bytes instead, which
+        is fast in exactly that kind of data.
+
+        patterns is a list of (name, pattern, anchor start, anchor end). """
+
+    def __init__(self, patterns):
+        self.patterns = patterns
+        self.content = None
+        self.next_hits = {}
+
+    def find_pattern(self, content, pattern, anchor_start, anchor_end, position):
+        anchor = pattern[anchor_start:anchor_end]
+        length = len(pattern)
+        misses = 0
+        hit = content.find(anchor, position + anchor_start)
+        while hit != -1:
+            start = hit - anchor_start
+            if content[start:start+length] == pattern:
+                return(start)
+            misses += 1
+            if misses < ANCHOR_MISS_LIMIT:
+                hit = content.find(anchor, hit + 1)
+                continue
+            end = start + 1 + FULL_SEARCH_SPAN
+            start = content.find(pattern, start + 1, end + length - 1)
+            if start != -1:
+                return(start)
+            misses = 0
+            hit = content.find(anchor, end + anchor_start)
+        return(-1)
+
+    def search(self, content, position):
+
+        ''' Return (offset, name) of the first match at or after position, or (-1, None). Calls for
+            the same content must come with increasing positions. '''
+
+        if content is not self.content:
+            self.content = content
+            self.next_hits = {}
+        best = -1
+        best_name = None
+        for name, pattern, anchor_start, anchor_end in self.patterns:
+            hit = self.next_hits.get(name)
+            if hit is None or (hit != -1 and hit < position):
+                hit = self.find_pattern(content, pattern, anchor_start, anchor_end, position)
+                self.next_hits[name] = hit
+            if hit != -1 and (best == -1 or hit < best):
+                best = hit
+                best_name = name
+        return(best, best_name)
+
+
+# Patterns carved for, with the anchor searched for in each
+CARVE_PATTERNS = [('sln', SLN_ENTRY_SIGNATURE, 0, 2),
+                  ('evt', EVT_ENTRY_SIGNATURE, 0, 1),
+                  ('user', USER_TBL_HEADER, 4, 8)]
+
+# Bytes needed to check each kind of record
+CARVE_RECORD_SIZES = {'sln': SLN_ENTRY_SIZE, 'evt': EVT_ENTRY_SIZE, 'user': USER_TBL_SIZE}
+
+
+def plausible_text(text):
+
+    ''' True if decoded UTF-16 text has no control characters or undecodable code units. '''
+
+    for char in text:
+        if char < u'\x20' or char == u'\ufffd':
+            return(False)
+    return(True)
+
+
+def plausible_sln_entry(entry):
+    return(entry[0] != 'Unknown' and entry[1] != '0' * 32 and entry[2] != '' and
+           plausible_text(entry[2]) and plausible_text(entry[3]))
+
+
+def plausible_evt_entry(entry):
+
+    ''' Check a raw entry from EVT_ENTRY_STRUCT: a known event ID, and timestamps that are either zero
+        or in the plausible range, at least one of them set. '''
+
+    entry_num, timestamp1, event_id, guid, timestamp2 = entry
+    if event_id not in CARVE_EVENT_IDS or (timestamp1 == 0 and timestamp2 == 0):
+        return(False)
+    for timestamp in (timestamp1, timestamp2):
+        if timestamp != 0 and not CARVE_MIN_FILETIME <= timestamp < CARVE_MAX_FILETIME:
+            return(False)
+    return(True)
+
+
+class tblCarver:
+
+    """ Scans content for sln entries, evt entries and user.tbl files, keeping those that pass the
+        plausibility checks. The record layouts are those of slnTable, evtTable and userTable:
+            sln_table:    slnTable holding the carved sln entries, keyed by offset in the content
+            evt_entries:  raw evt entries, as iter_evt_entries returns them
+            user_tables:  parsed userTables
+        Once a record is accepted the search resumes after its end. """
+
+    def __init__(self):
+        self.sln_table = slnTable(None)
+        self.evt_entries = []
+        self.user_tables = []
+        self.rejected = 0
+        self.searcher = multiPatternSearch(CARVE_PATTERNS)
+        self.max_pattern = max([len(pattern[1]) for pattern in CARVE_PATTERNS])
+
+    def carve(self, content):
+
+        ''' Carve content held in memory, or memory-mapped. '''
+
+        self.carve_window(content, 0, 0, True)
+
+    def carve_stream(self, stream, chunk_size=CARVE_CHUNK_SIZE, cancelled=None):
+
+        ''' Carve a file-like object in windows of about chunk_size bytes. The end of each window that
+            could hold the start of a record is carried over into the next one, so records spanning two
+            reads are found whole. cancelled, if given, is called between windows and stops the scan when
+            it returns True. '''
+
+        chunk_size = max(chunk_size, max(CARVE_RECORD_SIZES.values()))
+        window = ''
+        base = 0
+        search_from = 0
+        while(True):
+            if cancelled is not None and cancelled():
+                return
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            window += chunk
+            if search_from - base >= len(window):
+                # Still inside the last record found, nothing to search yet
+                base += len(window)
+                window = ''
+                continue
+            search_from = self.carve_window(window, base, search_from - base, False)
+            keep = max(search_from - base, 0)
+            window = window[keep:]
+            base += keep
+        if window and search_from - base < len(window):
+            self.carve_window(window, base, search_from - base, True)
+
+    def carve_window(self, content, base, start, final):
+
+        ''' Carve content, which holds the input from offset base onwards, from position start. Unless
+            final is set, a record that runs past the end of content is left for the next window.
+            Returns the offset the search should continue from. '''
+
+        unpack_evt = EVT_ENTRY_STRUCT.unpack_from
+        position = start
+        while(True):
+            byte, kind = self.searcher.search(content, position)
+            if byte == -1:
+                break
+            if byte + CARVE_RECORD_SIZES[kind] > len(content):
+                if not final:
+                    return(base + byte)
+                position = byte + 1
+                continue
+
+            accepted = False
+            if kind == 'evt':
+                entry = unpack_evt(content, byte)
+                if plausible_evt_entry(entry):
+                    self.evt_entries.append((base + byte + 4,) + entry)
+                    accepted = True
+            elif kind == 'sln':
+                self.sln_table.parse_window(content[byte:byte+SLN_ENTRY_SIZE], base + byte, 0, True)
+                entry = self.sln_table.entries.get(base + byte)
+                if entry is not None and plausible_sln_entry(entry):
+                    accepted = True
+                elif entry is not None:
+                    del self.sln_table.entries[base + byte]
+            else:
+                user_table = userTable(content[byte:byte+USER_TBL_SIZE])
+                user_table.parse_entries()
+                if user_table.entries[1] and plausible_text(user_table.entries[1]):
+                    self.user_tables.append(user_table)
+                    accepted = True
+
+            if accepted:
+                position = byte + CARVE_RECORD_SIZES[kind]
+            else:
+                self.rejected += 1
+                position = byte + 1
+
+        # A pattern can still start in the last few bytes of the window
+        return(base + max(position, len(content) - self.max_pattern + 1))
+
+
+def blank_user_table():
+
+    ''' A userTable with every field empty, for joining carved entries when no user.tbl was carved. '''
+
+    user_table = userTable('\x00' * USER_TBL_SIZE)
+    user_table.parse_entries()
+    return(user_table)
+
+
+def merge_carved_sln(carvers):
+
+    ''' Combine the sln entries carved from several sources into one slnTable for the join, so evt
+        entries carved from one source can match documents carved from another. Entries are keyed
+        by (source number, offset). '''
+
+    sln_table = slnTable(None)
+    for number in range(len(carvers)):
+        entries = carvers[number].sln_table.entries
+        for offset in entries:
+            sln_table.entries[(number, offset)] = entries[offset]
+    return(sln_table)
@@ -0,0 +1,233 @@
+###############################################################################
+#
+# Checkpoints for incremental re-ingest of correlated .tbl files. evt.tbl is
+# append-only, so only the entries added since the last ingest are parsed.
+#
+###############################################################################
+
+import binascii
+import bisect
+import hashlib
+import json
+import os
+import tempfile
+from evt_tbl_parse_aut import *
+
+# Bytes at the start of evt.tbl that are hashed to recognise the same file on the next ingest
+EVT_PREFIX_SIZE = 64 * 1024
+
+
+# Extension of the checkpoint files, and of the files checkpoints are written to before they are renamed
+CHECKPOINT_FILE_SUFFIX = '.json'
+CHECKPOINT_TEMP_SUFFIX = '.tmp'
+
+
+class tblCheckpoints:
+
+    """ Persisted checkpoints, one per correlated set of .tbl files. Each checkpoint records:
+        evt_offset:       file offset of the first evt.tbl entry not processed yet
+        evt_prefix_size:  number of bytes at the start of evt.tbl covered by evt_prefix_hash
+        evt_prefix_hash:  MD5 of those bytes
+        sln_hash:         MD5 of the whole sln.tbl
+        sln_docids:       {docid: MD5 of the parsed sln entry}
+        rejoin_docids:    only if the set was stopped while joining earlier entries of documents new
+                          in sln.tbl: {docid: file offset to carry on joining its entries from}
+
+        A checkpoint is saved after each batch of results is posted, so a set that was cancelled or
+        failed part way is carried on from the last batch posted.
+
+        Each checkpoint is a file of its own in folder, named after the MD5 of its key, so saving one
+        set costs the same however many sets were ingested before. A checkpoint is written to a
+        temporary file and renamed into place, so a crash or cancel while saving leaves the previous
+        checkpoint of the set whole. """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.checkpoints = {}
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+    def path(self, key):
+
+        ''' File of the checkpoint of key. Keys hold the evt.tbl path, which is unicode under Jython
+            and can have characters outside ASCII, so they are hashed as UTF-8. '''
+
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        return(os.path.join(self.folder, hashlib.md5(key).hexdigest() + CHECKPOINT_FILE_SUFFIX))
+
+    def get(self, key):
+        if key in self.checkpoints:
+            return(self.checkpoints[key])
+        checkpoint = None
+        try:
+            with open(self.path(key), 'r') as infile:
+                stored = json.load(infile)
+            if stored.get('key') == key:
+                checkpoint = stored['checkpoint']
+        except (IOError, ValueError, KeyError, AttributeError):
+            # A missing or unreadable checkpoint means the set is ingested in full again
+            pass
+        self.checkpoints[key] = checkpoint
+        return(checkpoint)
+
+    def set(self, key, checkpoint):
+
+        ''' Store the checkpoint of key, and save it. '''
+
+        self.checkpoints[key] = checkpoint
+        path = self.path(key)
+        handle, temp_path = tempfile.mkstemp(CHECKPOINT_TEMP_SUFFIX, '', self.folder)
+        try:
+            with os.fdopen(handle, 'w') as outfile:
+                json.dump({'key': key, 'checkpoint': checkpoint}, outfile)
+            try:
+                os.rename(temp_path, path)
+            except OSError:
+                # Windows does not rename over an existing file
+                os.remove(path)
+                os.rename(temp_path, path)
+        except:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+
+def checkpoint_key(tbl_set, evt_path, filter_key=''):
+
+    ''' Key of the checkpoint for a (sln, evt, user) tuple of object IDs from correlate_tbl_files.
+        filter_key is the key() of the tblFilter the set is ingested with, if any, so that ingesting
+        with different filters does not resume from a checkpoint left by another filter. '''
+
+    key = '%s:%s:%s:%s' % (tbl_set[0], tbl_set[1], tbl_set[2], evt_path)
+    if filter_key:
+        key += '|' + filter_key
+    return(key)
+
+
+def carve_checkpoint_key(objId, path):
+
+    ''' Key of the checkpoint of a file carved for records, such as unallocated space or a pagefile.
+        Its checkpoint is {'posted_ranges': [first, last] offsets of each run of consecutive carved evt
+        entries already posted}, from posted_ranges(). '''
+
+    return('carve:%s:%s' % (objId, path))
+
+
+def in_ranges(offset, ranges):
+
+    ''' Whether offset falls in one of the sorted [first, last] ranges of a carve checkpoint. '''
+
+    i = bisect.bisect_right(ranges, [offset, float('inf')]) - 1
+    return(i >= 0 and ranges[i][0] <= offset <= ranges[i][1])
+
+
+def posted_ranges(offsets, ranges, posted):
+
+    ''' Merge the offsets of newly posted evt entries into the ranges of a carve checkpoint. offsets
+        are those of every entry carved from the file, in order, ranges are the previous ranges and
+        posted the set of offsets posted now. Each returned range is a run of consecutive carved
+        entries that have all been posted, so entries that were not joined are left out of them and
+        can still be posted by a later ingest. '''
+
+    merged = []
+    run = None
+    for offset in offsets:
+        if offset in posted or in_ranges(offset, ranges):
+            if run is None:
+                run = [offset, offset]
+                merged.append(run)
+            run[1] = offset
+        else:
+            run = None
+    return(merged)
+
+
+def sln_docid_digests(sln_table):
+
+    ''' Hash the fields of every sln entry, so changed documents can be found by docid. The string fields
+        are hashed as raw bytes, so the entries do not have to be decoded. '''
+
+    digests = {}
+    for offset in sln_table.entries:
+        entry = sln_table.entries[offset]
+        fields = (entry.type, entry.doc_id) + entry.raw_fields()
+        digests[entry.doc_id] = hashlib.md5(repr(fields)).hexdigest()
+    return(digests)
+
+
+def plan_incremental(checkpoint, evt_size, evt_prefix, sln_hash, sln_digests):
+
+    ''' Work out how much of a tbl set needs processing, given its previous checkpoint (or None).
+        evt_prefix holds the first min(EVT_PREFIX_SIZE, evt_size) bytes of evt.tbl.
+
+        Returns (evt_start, rejoin_docids). Entries from evt_start onwards are new and are joined in
+        full. rejoin_docids maps the docids that are new in sln.tbl since the checkpoint to the first
+        evt entry: their entries before evt_start were left out of the join for want of a document, and
+        must be joined now. It also holds the docids of a rejoin the checkpoint was saved part way
+        through, mapped to the offset it stopped at. Documents whose sln entry changed are not rejoined,
+        because their earlier entries were already posted; only their new entries carry the changed
+        fields. '''
+
+    if checkpoint is None:
+        return(EVT_FIRST_ENTRY, {})
+
+    # If the start of evt.tbl differs or it got shorter, it is a different file and is processed in full.
+    evt_offset = checkpoint['evt_offset']
+    prefix_size = checkpoint['evt_prefix_size']
+    if (evt_size < evt_offset or len(evt_prefix) < prefix_size or
+            hashlib.md5(evt_prefix[:prefix_size]).hexdigest() != checkpoint['evt_prefix_hash']):
+        return(EVT_FIRST_ENTRY, {})
+
+    rejoin_docids = dict(checkpoint.get('rejoin_docids', {}))
+    if sln_hash == checkpoint['sln_hash']:
+        return(evt_offset, rejoin_docids)
+
+    old_digests = checkpoint['sln_docids']
+    for docid in sln_digests:
+        if docid not in old_digests:
+            rejoin_docids[docid] = EVT_FIRST_ENTRY
+    return(evt_offset, rejoin_docids)
+
+
+def iter_rejoin_entries(evt_entries, rejoin_docids):
+
+    ''' The raw evt entries from before evt_start that are joined again for rejoin_docids from
+        plan_incremental: those of its docids, each from the offset it maps to. '''
+
+    rejoin_from = dict([(binascii.unhexlify(docid), offset) for docid, offset in rejoin_docids.items()])
+    for entry in evt_entries:
+        offset = rejoin_from.get(entry[4])
+        # The raw offset is that of the entry number, 4 bytes into the entry
+        if offset is not None and entry[0] - 4 >= offset:
+            yield entry
+
+
+def make_checkpoint(evt_offset, evt_prefix, sln_hash, sln_digests, rejoin_docids=None):
+
+    ''' Build the checkpoint to save once the entries up to evt_offset have been processed, and those
+        before it of rejoin_docids, if any, up to the offset each maps to. '''
+
+    prefix_size = min(EVT_PREFIX_SIZE, evt_offset, len(evt_prefix))
+    checkpoint = {'evt_offset': evt_offset,
+                  'evt_prefix_size': prefix_size,
+                  'evt_prefix_hash': hashlib.md5(evt_prefix[:prefix_size]).hexdigest(),
+                  'sln_hash': sln_hash,
+                  'sln_docids': sln_digests}
+    if rejoin_docids:
+        checkpoint['rejoin_docids'] = rejoin_docids
+    return(checkpoint)
+
+
+def resume_checkpoint(entry_offset, evt_start, rejoin_docids, evt_prefix, sln_hash, sln_digests):
+
+    ''' Build the checkpoint to save part way through a set planned with plan_incremental, once the
+        results up to the evt entry at raw offset entry_offset (from iter_result_batches) have been
+        posted. Before evt_start, that entry is one of the rejoin, and nothing from evt_start on has
+        been joined yet. '''
+
+    next_offset = entry_offset - 4 + EVT_ENTRY_SIZE
+    if next_offset > evt_start:
+        return(make_checkpoint(next_offset, evt_prefix, sln_hash, sln_digests))
+    rejoin_left = dict([(docid, max(offset, next_offset)) for docid, offset in rejoin_docids.items()])
+    return(make_checkpoint(evt_start, evt_prefix, sln_hash, sln_digests, rejoin_left))
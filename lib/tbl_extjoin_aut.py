@@ -0,0 +1,193 @@
+###############################################################################
+#
+# Join of evt tables too large to hold in memory, with the results returned
+# in timestamp order. Joined entries are buffered up to a memory budget,
+# spilled to temporary files as sorted runs, and merged back k ways.
+#
+###############################################################################
+
+import binascii
+import heapq
+import os
+import struct
+import tempfile
+from evt_tbl_parse_aut import *
+from tbl_functions_aut import *
+from misc_functions_aut import *
+
+# Memory the buffered entries may use before they are spilled, in bytes
+JOIN_MEMORY_BUDGET = 256 * 1024 * 1024
+
+# Approximate memory a buffered entry takes in Python, in bytes, used to turn the budget into a count
+JOIN_RECORD_COST = 160
+
+# Most runs merged at once. With more runs than this, groups of runs are first merged into longer ones.
+JOIN_MERGE_FANIN = 64
+
+# Layout of a spilled entry: timestamp 2 (epoch seconds, NO_TIMESTAMP if none), set number, position in
+# the evt table, entry number, event ID and docid
+JOIN_RECORD_STRUCT = struct.Struct('<qIQBB16s')
+
+# Entries read from or written to a run at a time
+JOIN_READ_RECORDS = 4096
+
+# Extension of the run files
+JOIN_RUN_SUFFIX = '.run'
+
+
+def read_run(path, record_struct=JOIN_RECORD_STRUCT):
+
+    ''' Yield the records of a run file, as tuples in record_struct order. '''
+
+    size = record_struct.size
+    unpack_from = record_struct.unpack_from
+    with open(path, 'rb') as infile:
+        while(True):
+            data = infile.read(size * JOIN_READ_RECORDS)
+            if not data:
+                return
+            for position in xrange(0, len(data) - size + 1, size):
+                yield unpack_from(data, position)
+
+
+def write_run(records, temp_dir, record_struct=JOIN_RECORD_STRUCT):
+
+    ''' Write records, in order, to a new run file in temp_dir and return its path. '''
+
+    handle, path = tempfile.mkstemp(JOIN_RUN_SUFFIX, 'msot', temp_dir)
+    pack = record_struct.pack
+    with os.fdopen(handle, 'wb') as outfile:
+        batch = []
+        for record in records:
+            batch.append(pack(*record))
+            if len(batch) >= JOIN_READ_RECORDS:
+                outfile.write(''.join(batch))
+                batch = []
+        outfile.write(''.join(batch))
+    return(path)
+
+
+def remove_run(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def merge_runs(runs, temp_dir, record_struct=JOIN_RECORD_STRUCT):
+
+    ''' Merge several runs into a new one, and remove them. Returns the path of the new run. '''
+
+    path = write_run(heapq.merge(*[read_run(run, record_struct) for run in runs]), temp_dir, record_struct)
+    for run in runs:
+        remove_run(run)
+    return(path)
+
+
+def iter_merged_runs(runs, temp_dir, record_struct=JOIN_RECORD_STRUCT):
+
+    ''' Merge runs into a single sorted stream of records. With more than JOIN_MERGE_FANIN runs, groups
+        of them are first merged into longer ones. Returns (runs, records): the runs that are left, to
+        be removed once records has been read, and an iterator over the records. '''
+
+    while len(runs) > JOIN_MERGE_FANIN:
+        runs = runs[JOIN_MERGE_FANIN:] + [merge_runs(runs[:JOIN_MERGE_FANIN], temp_dir, record_struct)]
+    return(runs, heapq.merge(*[read_run(run, record_struct) for run in runs]))
+
+
+class externalJoin:
+
+    """ Joins the evt entries of any number of tbl sets against their sln tables, and returns the
+        results of all of them in timestamp order, holding at most memory_budget bytes of entries
+        in memory. Each set is added with add_set(), which streams its evt entries through a semi-join
+        with the sln docids: entries without a document are dropped at once, and the others are kept
+        as compact records. Whenever the buffered records reach the budget they are sorted and spilled
+        to a temporary file as a run. iter_results() then merges the runs, and the string fields of
+        each document are only decoded when its first result is produced.
+
+        Sorting happens before the spill rather than after partitioning the spilled entries by docid:
+        the docid index is held in memory anyway, so partitioning would only add a pass over the
+        spilled entries. """
+
+    def __init__(self, memory_budget=JOIN_MEMORY_BUDGET, temp_dir=None):
+        self.max_records = max(memory_budget // JOIN_RECORD_COST, 1)
+        self.temp_dir = temp_dir
+        self.sets = []
+        self.buffer = []
+        self.runs = []
+        self.spilled = 0
+
+    def add_set(self, sln_table, evt_table, user_table, evt_entries=None):
+
+        ''' Add the entries of a tbl set, from evt_entries (raw tuples from iter_evt_entries or
+            evtTable.iter_stream) or, without it, from evt_table.entries. Returns the number of the set,
+            which iter_results() gives with each of its results. '''
+
+        set_number = len(self.sets)
+        docid_index = build_docid_index(sln_table)
+        user = user_table.entries[1]
+        host = user_table.entries[3] + "." + user_table.entries[4]
+        self.sets.append((docid_index, {}, evt_table.event_codes, user, host, evt_table.objId))
+
+        # The docids as the raw bytes stored in evt entries, for the semi-join
+        guids = set([binascii.unhexlify(docid) for docid in docid_index])
+        buffer = self.buffer
+        if evt_entries is None:
+            rows = ((entry[0], entry[5], entry[2], binascii.unhexlify(entry[4])) for offset, entry in evt_table.entries.iteritems())
+        else:
+            rows = ((entry_num, filetime_to_epoch(timestamp2), event_id, guid)
+                    for offset, entry_num, timestamp1, event_id, guid, timestamp2 in evt_entries)
+        position = 0
+        for entry_num, timestamp, event_id, guid in rows:
+            position += 1
+            if guid not in guids:
+                continue
+            buffer.append((NO_TIMESTAMP if timestamp is None else timestamp, set_number, position, entry_num, event_id, guid))
+            if len(buffer) >= self.max_records:
+                self.spill()
+        return(set_number)
+
+    def spill(self):
+
+        ''' Sort the buffered records and write them to a new run. '''
+
+        self.buffer.sort()
+        self.runs.append(write_run(self.buffer, self.temp_dir))
+        self.spilled += len(self.buffer)
+        del self.buffer[:]
+
+    def iter_results(self):
+
+        ''' Yield (set number, result) for every joined entry of every set, in timestamp order. Entries
+            without a timestamp come first, and entries with the same timestamp are in the order their
+            sets were added and in evt table order. The results are iter_results rows. '''
+
+        if self.runs:
+            if self.buffer:
+                self.spill()
+            self.runs, records = iter_merged_runs(self.runs, self.temp_dir)
+        else:
+            self.buffer.sort()
+            records = iter(self.buffer)
+
+        hexlify = binascii.hexlify
+        for timestamp, set_number, position, entry_num, event_id, guid in records:
+            docid_index, joined_fields, event_codes, user, host, objId = self.sets[set_number]
+            docid = hexlify(guid)
+            sln_fields = joined_fields.get(docid)
+            if sln_fields is None:
+                sln_fields = joined_fields[docid] = sln_result_fields(docid_index[docid])
+            doc_id, doc_title, doc_path, doc_type, doc_author, addin_name, desc = sln_fields
+            yield (set_number, [None if timestamp == NO_TIMESTAMP else timestamp, entry_num, event_id,
+                                event_codes.get(event_id, 'Unknown'), doc_id, doc_title, doc_path, doc_type,
+                                doc_author, addin_name, desc, user, host, objId])
+        self.close()
+
+    def close(self):
+
+        ''' Remove the runs. '''
+
+        for run in self.runs:
+            remove_run(run)
+        self.runs = []
+        del self.buffer[:]
@@ -0,0 +1,100 @@
+###############################################################################
+#
+# Filters on time range, event ID and document type, checked by the table
+# parsers against the raw entry bytes before any field is decoded
+#
+###############################################################################
+
+import calendar
+import time
+from misc_functions_aut import *
+
+# Document types that can be selected, as named in slnTable.item_type_dict, plus 'Unknown'
+DOC_TYPES = ['user_document', 'application_dll', 'Unknown']
+
+# Format of the dates in a filter spec
+FILTER_DATE_FORMAT = '%Y-%m-%d'
+
+
+class tblFilter:
+
+    """ Which entries to keep. Each part is optional and None keeps everything:
+        start_time, end_time:  epoch seconds, start included and end excluded, compared with timestamp 2
+                               of evt entries. Entries with no timestamp are dropped when either is set.
+        event_ids:             event IDs of the evt entries to keep
+        doc_types:             types of the sln entries to keep, from DOC_TYPES
+
+        The raw forms the parsers compare against are worked out once here: the event ID as the single
+        byte stored in the entry, and the time range as FILETIME integers. """
+
+    def __init__(self, start_time=None, end_time=None, event_ids=None, doc_types=None):
+        self.start_time = start_time
+        self.end_time = end_time
+        self.event_ids = frozenset(event_ids) if event_ids else None
+        self.doc_types = frozenset(doc_types) if doc_types else None
+
+        self.event_bytes = frozenset([chr(event_id) for event_id in self.event_ids]) if self.event_ids else None
+        self.start_filetime = epoch_to_filetime(start_time) if start_time is not None else None
+        self.end_filetime = epoch_to_filetime(end_time) if end_time is not None else None
+
+    def filters_evt(self):
+        return(self.event_bytes is not None or self.start_filetime is not None or self.end_filetime is not None)
+
+    def filters_sln(self):
+        return(self.doc_types is not None)
+
+    def key(self):
+
+        ''' Text describing the filter, so results of different filters can be told apart. '' for a
+            filter that keeps everything. '''
+
+        if not self.filters_evt() and not self.filters_sln():
+            return('')
+        return('%s-%s:%s:%s' % ('' if self.start_time is None else self.start_time,
+                                '' if self.end_time is None else self.end_time,
+                                ','.join([str(event_id) for event_id in sorted(self.event_ids or [])]),
+                                ','.join(sorted(self.doc_types or []))))
+
+
+def parse_filter_spec(start_date='', end_date='', event_ids='', doc_types=''):
+
+    ''' Build a tblFilter from text, as entered in the ingest settings or on the command line:
+        start_date, end_date:  YYYY-MM-DD in UTC, both days included
+        event_ids:             comma separated event IDs or ranges, such as "1,13" or "5-8"
+        doc_types:             comma separated names from DOC_TYPES
+        Empty text leaves that part of the filter off. Raises ValueError for invalid text. '''
+
+    start_time = None
+    end_time = None
+    if start_date.strip():
+        start_time = calendar.timegm(time.strptime(start_date.strip(), FILTER_DATE_FORMAT))
+    if end_date.strip():
+        # Keep the whole of the end day
+        end_time = calendar.timegm(time.strptime(end_date.strip(), FILTER_DATE_FORMAT)) + 86400
+    if start_time is not None and end_time is not None and start_time >= end_time:
+        raise ValueError('The start date must not be after the end date')
+
+    ids = set()
+    for part in event_ids.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = [int(value) for value in part.split('-', 1)]
+            ids.update(range(first, last + 1))
+        else:
+            ids.add(int(part))
+    for event_id in ids:
+        if not 0 <= event_id <= 255:
+            raise ValueError('Event IDs must be between 0 and 255: %d' % event_id)
+
+    types = set()
+    for part in doc_types.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if part not in DOC_TYPES:
+            raise ValueError('Unknown document type: %s' % part)
+        types.add(part)
+
+    return(tblFilter(start_time, end_time, ids, types))
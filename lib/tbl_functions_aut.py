@@ -0,0 +1,255 @@
+###############################################################################
+#
+# Functions to correlate, validate and join the .tbl files of a telemetry folder
+#
+###############################################################################
+
+import binascii
+import re
+from misc_functions_aut import *
+
+# Telemetry table file names: sln.tbl, evt.tbl and user.tbl, plus any copies in the same folder with
+# something added to the name, such as "sln (2).tbl" or "sln_old.tbl".
+TBL_NAME_PATTERN = re.compile(r'^(sln|evt|user)(.*)\.tbl$', re.IGNORECASE)
+
+
+def classify_tbl_name(name):
+
+    ''' Return (tbl_type, suffix) for a telemetry table file name, or None for any other file.
+        Tables of one set share the same suffix, '' for the standard names. '''
+
+    match = TBL_NAME_PATTERN.match(name)
+    if match is None:
+        return(None)
+    return(match.group(1).lower(), match.group(2).lower())
+
+
+def tbl_folder_id(tbl_file):
+
+    ''' Identify the folder holding a file: the object ID of its parent, or its parent path for a file
+        with no parent object. '''
+
+    parent = tbl_file.getParent()
+    if parent is not None:
+        return(parent.getId())
+    return(tbl_file.getParentPath())
+
+
+def correlate_tbl_files(sln_tbl_files, evt_tbl_files, usr_tbl_files, is_allocated=None):
+
+    """ Iterate through lists of .tbl files found on the data source, and group them by
+        parent folder and name suffix. Returns (files_to_analyze, unpaired): files_to_analyze
+        is a list of tuples, each tuple is a group of correlated .tbl files, and unpaired lists
+        the groups of files that could not be told apart, which are left out.
+
+        A folder can hold more than one set: copies with the same suffix added to each name
+        ("sln (2).tbl", "evt (2).tbl", "user (2).tbl") form their own set. Where a folder holds
+        more than one file of the same name, such as a deleted table and the current one, the
+        one is_allocated(tbl_file) is true for is used. If that still leaves more than one, the
+        group cannot be paired up one-to-one and is added to unpaired instead. Without
+        is_allocated every file counts as allocated. """
+
+    # Create a dict with key: (folder, suffix) and value: the files of each table type
+    groups = {}
+    for tbl_type, tbl_files in (('sln', sln_tbl_files), ('evt', evt_tbl_files), ('user', usr_tbl_files)):
+        for tbl_file in tbl_files:
+            name = classify_tbl_name(tbl_file.getName())
+            suffix = name[1] if name else ''
+            group = groups.setdefault((tbl_folder_id(tbl_file), suffix), {'sln': [], 'evt': [], 'user': []})
+            group[tbl_type].append(tbl_file)
+
+    # A set is made from one file of each type in the same group
+    files_to_analyze = []
+    unpaired = []
+    for key in groups:
+        group = groups[key]
+        tbl_set = []
+        for tbl_type in ('sln', 'evt', 'user'):
+            candidates = group[tbl_type]
+            if len(candidates) > 1 and is_allocated is not None:
+                candidates = [tbl_file for tbl_file in candidates if is_allocated(tbl_file)]
+            if len(candidates) != 1:
+                break
+            tbl_set.append(candidates[0].getId())
+        if len(tbl_set) == 3:
+            files_to_analyze.append(tuple(tbl_set))
+        elif group['sln'] and group['evt'] and group['user']:
+            unpaired.append(sorted(group['sln'] + group['evt'] + group['user'], key=lambda tbl_file: tbl_file.getId()))
+
+    # Return compiled list
+    files_to_analyze.sort()
+    return(files_to_analyze, unpaired)
+
+
+def validate_tbl_format(infile_content):
+
+    ''' Validate file header of .tbl file. First 8 bytes must be 20 00 00 00 53 44 44 54.
+        Second 8 bytes determine which file (sln, etv, user). Returns '' if the header is not
+        a valid .tbl header or the type is unknown. '''
+
+    tbl_type = '' # Will hold type of tbl file
+
+    # Grab the first 8 bytes of the file
+    test_block_1 = infile_content[0:8]
+
+    # Header should be 2000000053444454
+    if binascii.hexlify(test_block_1) != '2000000053444454':
+        return(tbl_type)
+
+    # Test the next 8 bytes to determine the type of .tbl file.
+    test_block_2 = infile_content[8:16]
+    if binascii.hexlify(test_block_2) == '01000000564e4953':
+        tbl_type = 'sln'
+    elif binascii.hexlify(test_block_2) == '01000000544e5645':
+        tbl_type = 'evt'
+    elif binascii.hexlify(test_block_2) == '0100000052455355':
+        tbl_type = 'user'
+
+    return(tbl_type)
+
+
+def probe_tbl_files(tbl_files, tbl_type, read_header):
+
+    ''' Keep only the files whose 16 byte header is a valid header of tbl_type. read_header(tbl_file)
+        returns the header as a string; nothing past it is read. Returns (valid files, rejected files). '''
+
+    valid = []
+    rejected = []
+    for tbl_file in tbl_files:
+        if validate_tbl_format(read_header(tbl_file)) == tbl_type:
+            valid.append(tbl_file)
+        else:
+            rejected.append(tbl_file)
+    return(valid, rejected)
+
+
+def dedup_tbl_sets(files_to_analyze, tbl_file_dict, fingerprint):
+
+    ''' Group byte-identical sets of (sln, evt, user) object IDs, as found in volume shadow copies,
+        backups and carved copies of the same folder. fingerprint(tbl_set) returns a content hash of the
+        three files; it is only called for sets whose three file sizes match another set, since sets of
+        different sizes cannot be identical.
+
+        Returns a list of (tbl_set, duplicates): tbl_set is the set to parse, the one with the lowest
+        object IDs, and duplicates lists the other sets with the same content. '''
+
+    by_size = {}
+    for tbl_set in files_to_analyze:
+        sizes = tuple([tbl_file_dict[objId].getSize() for objId in tbl_set])
+        by_size.setdefault(sizes, []).append(tbl_set)
+
+    groups = []
+    for sizes in by_size:
+        same_size = by_size[sizes]
+        if len(same_size) == 1:
+            groups.append(same_size)
+            continue
+        by_hash = {}
+        for tbl_set in same_size:
+            by_hash.setdefault(fingerprint(tbl_set), []).append(tbl_set)
+        groups.extend(by_hash.values())
+
+    unique_sets = []
+    for group in groups:
+        group = sorted(group)
+        unique_sets.append((group[0], group[1:]))
+    unique_sets.sort()
+    return(unique_sets)
+
+
+def build_docid_index(sln_table):
+
+    ''' Index the sln table by docid, for joining evt entries against it. The value for each docid is
+        its slnEntry, whose string fields are only decoded if it is joined (see sln_result_fields).
+        If the sln table holds the same docid more than once, the first entry in the file is used. '''
+
+    docid_index = {}
+    for offset in sorted(sln_table.entries):
+        entry = sln_table.entries[offset]
+        if entry.doc_id not in docid_index:
+            docid_index[entry.doc_id] = entry
+    return(docid_index)
+
+
+def sln_result_fields(entry):
+
+    ''' The tuple of sln fields that goes into the results for an slnEntry:
+        (doc_id, doc_title, doc_path, doc_type, doc_author, addin_name, desc) '''
+
+    doc_path = entry.doc_path + "\\" + entry.doc_name
+    return((entry.doc_id, entry.doc_title, doc_path, entry.type, entry.doc_author, entry.addin_name, entry.description))
+
+
+def iter_evt_rows(evt_table, evt_entries=None):
+
+    ''' Yield (entry_num, timestamp 2, event_id, docid) for each evt entry. evt_entries is an iterable of
+        the raw tuples from iter_evt_entries or evtTable.iter_stream; without it, the entries already
+        parsed into evt_table.entries are used. '''
+
+    if evt_entries is None:
+        for offset, entry in evt_table.entries.iteritems():
+            yield (entry[0], entry[5], entry[2], entry[4])
+    else:
+        hexlify = binascii.hexlify
+        for offset, entry_num, timestamp1, event_id, guid, timestamp2 in evt_entries:
+            yield (entry_num, filetime_to_epoch(timestamp2), event_id, hexlify(guid))
+
+
+def iter_results(sln_table, evt_table, user_table, evt_entries=None):
+
+    ''' Join the parsed tables into the final entries with a hash join: the sln table is indexed by
+        docid once, and the evt entries are streamed through the index. Yields one list per evt entry
+        whose docid is in the sln table, in evt table order:
+        [timestamp, entry_num, event_id, event_desc, doc_id, doc_title, doc_path, doc_type,
+         doc_author, addin_name, desc, user, host, Autopsy object ID]
+
+        When evt_entries streams the raw evt entries (see iter_evt_rows), memory use depends only on
+        the size of the sln table. Only the sln entries that are joined have their strings decoded. '''
+
+    # Set some local references for the user data that will be added to the output file
+    user = user_table.entries[1]
+    host = user_table.entries[3] + "." + user_table.entries[4]
+
+    docid_index = build_docid_index(sln_table)
+    event_codes = evt_table.event_codes
+    objId = evt_table.objId
+
+    # The string fields of a document are decoded the first time one of its events is joined
+    joined_fields = {}
+
+    for entry_num, timestamp, event_id, docid in iter_evt_rows(evt_table, evt_entries):
+        sln_fields = joined_fields.get(docid)
+        if sln_fields is None:
+            entry = docid_index.get(docid)
+            if entry is None:
+                continue
+            sln_fields = joined_fields[docid] = sln_result_fields(entry)
+        doc_id, doc_title, doc_path, doc_type, doc_author, addin_name, desc = sln_fields
+        event_desc = event_codes.get(event_id, 'Unknown')
+        yield [timestamp, entry_num, event_id, event_desc, doc_id, doc_title, doc_path, doc_type, doc_author, addin_name, desc, user, host, objId]
+
+
+def iter_result_batches(sln_table, evt_table, user_table, evt_entries, batch_size):
+
+    ''' The results of iter_results over the raw evt_entries in batches of up to batch_size, yielded
+        as (batch, offsets): offsets[i] is the offset of the evt entry batch[i] was joined from. The
+        last batch may be empty. iter_results yields the result of an entry as soon as it takes the
+        entry, so everything up to the entry of the last result of a batch has been joined. '''
+
+    last_offset = [None]
+
+    def track(entries):
+        for entry in entries:
+            last_offset[0] = entry[0]
+            yield entry
+
+    batch = []
+    offsets = []
+    for result in iter_results(sln_table, evt_table, user_table, track(evt_entries)):
+        batch.append(result)
+        offsets.append(last_offset[0])
+        if len(batch) >= batch_size:
+            yield (batch, offsets)
+            batch = []
+            offsets = []
+    yield (batch, offsets)
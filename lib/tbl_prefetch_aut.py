@@ -0,0 +1,139 @@
+###############################################################################
+#
+# Read-ahead for the .tbl streams. Each stream is read on a thread of its
+# own, ahead of the parser, so reading from slow images overlaps with
+# parsing. The chunks read ahead by all the streams of a job count against
+# one byte budget, and a reader waits for the parsers to catch up when it
+# runs out, which caps the memory used.
+#
+###############################################################################
+
+import collections
+import threading
+from misc_functions_aut import *
+
+# Bytes the read-ahead chunks of all streams may hold together
+PREFETCH_BUDGET = 64 * 1024 * 1024
+
+# Most chunks a single stream reads ahead
+PREFETCH_DEPTH = 4
+
+
+class readBudget:
+
+    """ The bytes read-ahead chunks may hold, shared by any number of PrefetchStreams. The condition
+        guards the budget and the chunks of every stream that uses it. """
+
+    def __init__(self, limit=PREFETCH_BUDGET):
+        self.limit = limit
+        self.used = 0
+        self.condition = threading.Condition()
+
+
+class PrefetchStream:
+
+    """ Wraps a file-like object and reads it on a thread, up to depth chunks of chunk_size bytes ahead
+        of the reads made through read(), which returns up to size bytes like a file does.
+
+        The reader only reads a chunk when the budget has room for it, or when the stream has nothing
+        read ahead: a parser waiting on an empty stream is never held up by the chunks of other
+        streams. Apart from the chunk each parser is working on, the chunks waiting to be parsed stay
+        within the budget. An error raised by the wrapped stream is raised again by read(). close()
+        stops the reader and frees its chunks; it only needs to be called if the stream is not read
+        to the end. """
+
+    def __init__(self, stream, budget, chunk_size=TBL_CHUNK_SIZE, depth=PREFETCH_DEPTH):
+        self.stream = stream
+        self.budget = budget
+        self.chunk_size = chunk_size
+        self.depth = depth
+        self.chunks = collections.deque()
+        self.current = ''
+        self.position = 0
+        self.finished = False
+        self.stopped = False
+        self.error = None
+        self.thread = threading.Thread(target=self.read_ahead)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def has_room(self):
+        if len(self.chunks) >= self.depth:
+            return(False)
+        return(not self.chunks or self.budget.used + self.chunk_size <= self.budget.limit)
+
+    def read_ahead(self):
+
+        ''' Reader thread: read chunks until the end of the stream, or until the stream is closed. '''
+
+        budget = self.budget
+        condition = budget.condition
+        while(True):
+            with condition:
+                while not self.stopped and not self.has_room():
+                    condition.wait()
+                if self.stopped:
+                    return
+                # Room for the chunk is taken before it is read, so other readers see it as used
+                budget.used += self.chunk_size
+
+            try:
+                data = self.stream.read(self.chunk_size)
+            except Exception as e:
+                data = None
+                error = e
+
+            with condition:
+                budget.used -= self.chunk_size
+                if data is None:
+                    self.error = error
+                    self.finished = True
+                elif not data:
+                    self.finished = True
+                elif not self.stopped:
+                    budget.used += len(data)
+                    self.chunks.append(data)
+                condition.notify_all()
+                if self.finished or self.stopped:
+                    return
+
+    def next_chunk(self):
+
+        ''' Wait for the next chunk read ahead, None at the end of the stream. '''
+
+        condition = self.budget.condition
+        with condition:
+            while not self.chunks and not self.finished and not self.stopped:
+                condition.wait()
+            if self.chunks:
+                chunk = self.chunks.popleft()
+                self.budget.used -= len(chunk)
+                condition.notify_all()
+                return(chunk)
+            if self.error is not None:
+                raise self.error
+            return(None)
+
+    def read(self, size):
+        parts = []
+        while size > 0:
+            if self.position >= len(self.current):
+                chunk = self.next_chunk()
+                if chunk is None:
+                    break
+                self.current = chunk
+                self.position = 0
+            data = self.current[self.position:self.position+size]
+            self.position += len(data)
+            size -= len(data)
+            parts.append(data)
+        return(''.join(parts))
+
+    def close(self):
+        condition = self.budget.condition
+        with condition:
+            self.stopped = True
+            while self.chunks:
+                self.budget.used -= len(self.chunks.popleft())
+            condition.notify_all()
+        self.current = ''
@@ -0,0 +1,267 @@
+###############################################################################
+#
+# Document sessions and a per-document summary, built from the joined
+# telemetry rows. Loads are paired with the close or crash that follows them
+# for the same document, user and host, and each document gets its first and
+# last sighting, open, failure and crash counts.
+#
+###############################################################################
+
+import binascii
+import struct
+from timeline_sinks_aut import *
+from tbl_extjoin_aut import *
+
+# Event IDs that start a session: document, template or add-in loaded
+SESSION_START_EVENTS = frozenset([1, 3, 5])
+
+# Event IDs that end a session normally: document or add-in closed
+SESSION_END_EVENTS = frozenset([13, 17])
+
+# Event IDs of crashes, which also end a session
+SESSION_CRASH_EVENTS = frozenset([11, 12, 16])
+
+# Event IDs counted as failures: loads, manifests and licensing that failed, and add-ins that misbehaved
+FAILURE_EVENTS = frozenset([2, 4, 6, 8, 9, 10, 15, 19, 20])
+
+# Layout of a spilled event: docid, number of its user and host, timestamp (epoch seconds, NO_TIMESTAMP
+# if none), order it was added in and event ID
+SESSION_RECORD_STRUCT = struct.Struct('<16sIqQB')
+
+# Sessions inserted into the database at a time
+SESSION_INSERT_ROWS = 1000
+
+# Columns of a session row. end_reason is 'closed', 'crashed', or 'unclosed' when the session was
+# followed by another load or by nothing, and then end and duration are None.
+SESSION_HEADER = ['doc_id', 'user', 'host', 'start', 'end', 'duration', 'end_reason', 'events', 'failures']
+
+# Columns of a row of the document index
+DOCUMENT_HEADER = ['doc_id', 'doc_title', 'doc_path', 'doc_type', 'first_seen', 'last_seen', 'events', 'opens',
+                   'sessions', 'open_seconds', 'failures', 'crashes', 'users']
+
+
+class documentIndex:
+
+    """ Summary of the events of every document, keyed by docid. Each summary is a dict with the
+        DOCUMENT_HEADER fields; first_seen and last_seen are epoch seconds, or None if none of the
+        document's events had a time. """
+
+    def __init__(self):
+        self.documents = {}
+        self.users = {}
+
+    def summary(self, doc_id, doc_fields):
+        document = self.documents.get(doc_id)
+        if document is None:
+            doc_title, doc_path, doc_type = doc_fields
+            document = {'doc_id': doc_id, 'doc_title': doc_title, 'doc_path': doc_path, 'doc_type': doc_type,
+                        'first_seen': None, 'last_seen': None, 'events': 0, 'opens': 0, 'sessions': 0,
+                        'open_seconds': 0, 'failures': 0, 'crashes': 0, 'users': 0}
+            self.documents[doc_id] = document
+            self.users[doc_id] = set()
+        return(document)
+
+    def get(self, doc_id):
+        return(self.documents.get(doc_id))
+
+    def __contains__(self, doc_id):
+        return(doc_id in self.documents)
+
+    def __len__(self):
+        return(len(self.documents))
+
+    def __iter__(self):
+        return(iter(sorted(self.documents)))
+
+    def rows(self):
+
+        ''' The summaries as lists in DOCUMENT_HEADER order, sorted by docid. '''
+
+        for doc_id in self:
+            document = self.documents[doc_id]
+            yield [document[field] for field in DOCUMENT_HEADER]
+
+
+class sessionBuilder:
+
+    """ Collects the joined rows of iter_results, keeping only the fields sessions are built from, and
+        builds the sessions and the document index from them with one sort and one pass. Rows should be
+        added in evt.tbl order, which breaks ties between events with the same timestamp.
+
+        The events are kept as compact records, sorted and spilled to temp_dir as runs whenever they
+        reach memory_budget bytes, and merged back by iter_sessions(), the same way as the entries of an
+        externalJoin. Besides the buffered records, only the fields of each document and each distinct
+        user and host are held in memory. """
+
+    def __init__(self, memory_budget=JOIN_MEMORY_BUDGET, temp_dir=None):
+        self.max_records = max(memory_budget // JOIN_RECORD_COST, 1)
+        self.temp_dir = temp_dir
+        self.buffer = []
+        self.runs = []
+        self.added = 0
+        self.doc_fields = {}
+        self.accounts = {}
+        self.account_names = []
+        self.index = documentIndex()
+
+    def add(self, result):
+        doc_id = result[4]
+        account = (result[11], result[12])
+        code = self.accounts.get(account)
+        if code is None:
+            code = self.accounts[account] = len(self.account_names)
+            self.account_names.append(account)
+        timestamp = NO_TIMESTAMP if result[0] is None else result[0]
+        self.buffer.append((binascii.unhexlify(doc_id), code, timestamp, self.added, result[2]))
+        self.added += 1
+        if doc_id not in self.doc_fields:
+            self.doc_fields[doc_id] = (result[5], result[6], result[7])
+        if len(self.buffer) >= self.max_records:
+            self.spill()
+
+    def add_rows(self, results):
+        for result in results:
+            self.add(result)
+
+    def spill(self):
+
+        ''' Sort the buffered records and write them to a new run. '''
+
+        self.buffer.sort()
+        self.runs.append(write_run(self.buffer, self.temp_dir, SESSION_RECORD_STRUCT))
+        del self.buffer[:]
+
+    def iter_events(self):
+
+        ''' Yield the events in (docid, user and host, timestamp, order added) order, as (docid, user,
+            host, timestamp, event ID). '''
+
+        if self.runs:
+            if self.buffer:
+                self.spill()
+            self.runs, records = iter_merged_runs(self.runs, self.temp_dir, SESSION_RECORD_STRUCT)
+        else:
+            self.buffer.sort()
+            records = iter(self.buffer)
+        hexlify = binascii.hexlify
+        account_names = self.account_names
+        for guid, code, timestamp, sequence, event_id in records:
+            user, host = account_names[code]
+            yield (hexlify(guid), user, host, None if timestamp == NO_TIMESTAMP else timestamp, event_id)
+        self.close()
+
+    def iter_sessions(self):
+
+        ''' Yield the sessions as lists in SESSION_HEADER order, sorted by docid, then by user and host in
+            the order they were first added, then by start time. self.index, a documentIndex, is complete
+            once all of them have been read. Events without a time count towards the document index, but
+            cannot be placed in a session. '''
+
+        index = self.index
+        session_key = None
+        session = None
+        document = None
+
+        for doc_id, user, host, timestamp, event_id in self.iter_events():
+            if (doc_id, user, host) != session_key:
+                if session is not None:
+                    yield self.end_session(document, session, None, 'unclosed')
+                session_key = (doc_id, user, host)
+                session = None
+                document = index.summary(doc_id, self.doc_fields[doc_id])
+                index.users[doc_id].add(user)
+                document['users'] = len(index.users[doc_id])
+
+            document['events'] += 1
+            failed = event_id in FAILURE_EVENTS
+            crashed = event_id in SESSION_CRASH_EVENTS
+            if failed:
+                document['failures'] += 1
+            if crashed:
+                document['crashes'] += 1
+            if event_id in SESSION_START_EVENTS:
+                document['opens'] += 1
+            if timestamp is None:
+                continue
+            # Events are only sorted by time within each user and host of the document
+            if document['first_seen'] is None or timestamp < document['first_seen']:
+                document['first_seen'] = timestamp
+            if document['last_seen'] is None or timestamp > document['last_seen']:
+                document['last_seen'] = timestamp
+
+            if event_id in SESSION_START_EVENTS:
+                if session is not None:
+                    yield self.end_session(document, session, None, 'unclosed')
+                session = [doc_id, user, host, timestamp, None, None, None, 1, 0]
+            elif session is not None:
+                session[7] += 1
+                if failed:
+                    session[8] += 1
+                if event_id in SESSION_END_EVENTS:
+                    yield self.end_session(document, session, timestamp, 'closed')
+                    session = None
+                elif crashed:
+                    yield self.end_session(document, session, timestamp, 'crashed')
+                    session = None
+
+        if session is not None:
+            yield self.end_session(document, session, None, 'unclosed')
+
+    def end_session(self, document, session, end, end_reason):
+        session[4] = end
+        session[6] = end_reason
+        document['sessions'] += 1
+        if end is not None:
+            session[5] = end - session[3]
+            document['open_seconds'] += session[5]
+        return(session)
+
+    def close(self):
+
+        ''' Remove the runs. '''
+
+        for run in self.runs:
+            remove_run(run)
+        self.runs = []
+        del self.buffer[:]
+
+
+def write_session_db(path, sessions):
+
+    ''' Write the sessions of a sessionBuilder and its document index into 'sessions' and 'documents'
+        tables of a SQLite database, indexed by docid, with times as UTC date and time text. The sessions
+        are inserted as they are built. Existing tables are replaced. Returns the number of sessions. '''
+
+    connection = connect_sqlite(path)
+    try:
+        cursor = connection.cursor()
+        cursor.execute('DROP TABLE IF EXISTS sessions')
+        cursor.execute('DROP TABLE IF EXISTS documents')
+        cursor.execute('CREATE TABLE sessions (doc_id TEXT, user TEXT, host TEXT, start TEXT, end TEXT, '
+                       'duration INTEGER, end_reason TEXT, events INTEGER, failures INTEGER)')
+        cursor.execute('CREATE INDEX sessions_doc_id ON sessions (doc_id)')
+        cursor.execute('CREATE TABLE documents (doc_id TEXT PRIMARY KEY, doc_title TEXT, doc_path TEXT, doc_type TEXT, '
+                       'first_seen TEXT, last_seen TEXT, events INTEGER, opens INTEGER, sessions INTEGER, '
+                       'open_seconds INTEGER, failures INTEGER, crashes INTEGER, users INTEGER)')
+
+        insert = 'INSERT INTO sessions VALUES (%s)' % ', '.join(['?'] * len(SESSION_HEADER))
+        written = 0
+        rows = []
+        for session in sessions.iter_sessions():
+            rows.append(session[0:3] + [format_timestamp(session[3]), format_timestamp(session[4])] + session[5:])
+            if len(rows) >= SESSION_INSERT_ROWS:
+                cursor.executemany(insert, rows)
+                written += len(rows)
+                rows = []
+        cursor.executemany(insert, rows)
+        written += len(rows)
+
+        rows = []
+        for row in sessions.index.rows():
+            rows.append(row[0:4] + [format_timestamp(row[4]), format_timestamp(row[5])] + row[6:])
+        cursor.executemany('INSERT INTO documents VALUES (%s)' % ', '.join(['?'] * len(DOCUMENT_HEADER)), rows)
+        connection.commit()
+    finally:
+        connection.close()
+        sessions.close()
+    return(written)
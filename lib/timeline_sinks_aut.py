@@ -0,0 +1,171 @@
+###############################################################################
+#
+# Streaming writers for the joined telemetry timeline. Rows from iter_results
+# are written as they are produced, a batch at a time, to CSV, JSON Lines or
+# a SQLite database.
+#
+###############################################################################
+
+import csv
+import json
+import sys
+from misc_functions_aut import *
+
+try:
+    import sqlite3
+except ImportError:
+    # Jython has no sqlite3 module; use the SQLite JDBC driver that ships with Autopsy instead
+    sqlite3 = None
+    from com.ziclix.python.sql import zxJDBC
+
+# Columns of the timeline, one per field of an iter_results row. source_file is the evt.tbl the row came from.
+OUTPUT_HEADER = ['timestamp', 'entry_num', 'event_id', 'event_desc', 'doc_id', 'doc_title', 'doc_path', 'doc_type',
+                 'doc_author', 'addin_name', 'desc', 'user', 'host', 'source_file']
+
+# Rows held in memory before they are written out, and rows per SQLite transaction
+SINK_BATCH_SIZE = 1000
+
+
+def format_timestamp(epoch):
+
+    ''' Epoch seconds as UTC date and time text, '' for None. '''
+
+    timestamp = epoch_to_datetime(epoch)
+    return(timestamp.strftime('%Y-%m-%d %H:%M:%S') if timestamp else '')
+
+
+def format_row(result):
+
+    ''' Format a row from iter_results for output: the timestamp becomes UTC date and time text
+        ('' if the entry has none) and every other field is left as it is. '''
+
+    row = list(result)
+    row[0] = format_timestamp(row[0])
+    return(row)
+
+
+def connect_sqlite(path):
+
+    ''' Open a SQLite database with sqlite3, or through JDBC under Jython. '''
+
+    if sqlite3 is not None:
+        return(sqlite3.connect(path))
+    return(zxJDBC.connect('jdbc:sqlite:' + path, None, None, 'org.sqlite.JDBC'))
+
+
+class timelineSink:
+
+    """ Base class of the sinks. Rows are buffered with write() and handed to the write_batch() of each
+        sink every batch_size rows, and once more by close(). """
+
+    def __init__(self, batch_size=SINK_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.pending = []
+        self.written = 0
+
+    def write(self, result):
+
+        ''' Add one row from iter_results, with the source file name as its last field. '''
+
+        self.pending.append(format_row(result))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def write_rows(self, results):
+        for result in results:
+            self.write(result)
+
+    def flush(self):
+        if self.pending:
+            self.write_batch(self.pending)
+            self.written += len(self.pending)
+            self.pending = []
+
+    def close(self):
+        self.flush()
+
+
+class fileSink(timelineSink):
+
+    """ Base class of the sinks that write to a file-like object. The file is closed by close() only if
+        close_file is set. """
+
+    def __init__(self, outfile, batch_size=SINK_BATCH_SIZE, close_file=False):
+        timelineSink.__init__(self, batch_size)
+        self.outfile = outfile
+        self.close_file = close_file
+
+    def close(self):
+        timelineSink.close(self)
+        if self.close_file:
+            self.outfile.close()
+        else:
+            self.outfile.flush()
+
+
+class csvSink(fileSink):
+
+    """ Writes the timeline as CSV with a header row, UTF-8 encoded. """
+
+    def __init__(self, outfile, batch_size=SINK_BATCH_SIZE, close_file=False):
+        fileSink.__init__(self, outfile, batch_size, close_file)
+        self.writer = csv.writer(outfile)
+        self.writer.writerow(OUTPUT_HEADER)
+
+    def write_batch(self, rows):
+        self.writer.writerows([[value.encode('utf-8') if isinstance(value, unicode) else value for value in row] for row in rows])
+
+
+class jsonlSink(fileSink):
+
+    """ Writes the timeline as JSON Lines: one object per row, keyed by the OUTPUT_HEADER names. """
+
+    def write_batch(self, rows):
+        lines = [json.dumps(dict(zip(OUTPUT_HEADER, row)), sort_keys=True) for row in rows]
+        self.outfile.write('\n'.join(lines) + '\n')
+
+
+class sqliteSink(timelineSink):
+
+    """ Writes the timeline into a 'timeline' table of a SQLite database, with one transaction per
+        batch of rows. An existing timeline table is replaced. """
+
+    def __init__(self, path, batch_size=SINK_BATCH_SIZE):
+        timelineSink.__init__(self, batch_size)
+        self.connection = connect_sqlite(path)
+        cursor = self.connection.cursor()
+        cursor.execute('DROP TABLE IF EXISTS timeline')
+        cursor.execute('CREATE TABLE timeline (timestamp TEXT, entry_num INTEGER, event_id INTEGER, '
+                       'event_desc TEXT, doc_id TEXT, doc_title TEXT, doc_path TEXT, doc_type TEXT, doc_author TEXT, '
+                       'addin_name TEXT, desc TEXT, user TEXT, host TEXT, source_file TEXT)')
+        self.connection.commit()
+        self.insert = 'INSERT INTO timeline VALUES (%s)' % ', '.join(['?'] * len(OUTPUT_HEADER))
+
+    def write_batch(self, rows):
+        cursor = self.connection.cursor()
+        cursor.executemany(self.insert, [[value.decode('utf-8', 'replace') if isinstance(value, str) else value for value in row] for row in rows])
+        self.connection.commit()
+
+    def close(self):
+        timelineSink.close(self)
+        self.connection.close()
+
+
+# Sink class for each output format
+SINK_FORMATS = {'csv': csvSink, 'jsonl': jsonlSink, 'sqlite': sqliteSink}
+
+
+def open_sink(output_format, path=None, batch_size=SINK_BATCH_SIZE):
+
+    ''' Open a sink writing output_format ('csv', 'jsonl' or 'sqlite') to path. CSV and JSON Lines go to
+        standard output when there is no path; a SQLite database needs one. '''
+
+    if output_format not in SINK_FORMATS:
+        raise ValueError('Unknown output format: %s' % output_format)
+    if output_format == 'sqlite':
+        if not path:
+            raise ValueError('SQLite output needs a file path')
+        return(sqliteSink(path, batch_size))
+    if path:
+        return(SINK_FORMATS[output_format](open(path, 'wb'), batch_size, True))
+    return(SINK_FORMATS[output_format](sys.stdout, batch_size))
@@ -5,7 +5,7 @@ class userTable:
 
     def __init__(self, infile_content):
 
-        self.infile_content = infile_content
+        self.infile_content = tbl_buffer(infile_content)
 
         # self.entries format is
         # [last modified, username, domain NetBios (short) name,
@@ -25,10 +25,9 @@ class userTable:
         ''' Search the file for locations of table entries. '''
         doc_length = len(self.infile_content)
 
-        # File last modified timestamp
+        # File last modified timestamp, in seconds since 01/01/1970
         last_mod = self.infile_content[36:44]
-        last_mod_timestamp = binascii.hexlify(last_mod)
-        self.entries.append(convert_time(last_mod_timestamp))
+        self.entries.append(filetime_to_epoch(last_mod))
 
         # User account name (user principal name prefix)
         user_name = self.infile_content[44:558]
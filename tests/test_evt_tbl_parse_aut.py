@@ -0,0 +1,81 @@
+###############################################################################
+#
+# Tests for the evt.tbl parser. Run with:
+#
+#     python2 -m unittest discover tests
+#
+###############################################################################
+
+import os
+import struct
+import sys
+import unittest
+
+if sys.version_info[0] >= 3:
+    raise unittest.SkipTest('the lib modules need Python 2')
+
+import StringIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.evt_tbl_parse_aut import *
+
+# Full evt entry including the block length, which the parser skips
+EVT_WRITE_STRUCT = struct.Struct('<IB19xQ4xB3x16s80xQ12x')
+
+
+def evt_content(count):
+    header = '\x20\x00\x00\x00\x53\x44\x44\x54\x01\x00\x00\x00\x54\x4e\x56\x45'.ljust(EVT_FIRST_ENTRY, '\x00')
+    entries = [EVT_WRITE_STRUCT.pack(EVT_ENTRY_SIZE, number, 0, 1, chr(number) * 16, 0) for number in range(count)]
+    return(header + ''.join(entries))
+
+
+class evtTableStreamTest(unittest.TestCase):
+
+    def test_end_offset(self):
+        evt_table = evtTable(None, 1)
+        entries = list(evt_table.iter_stream(StringIO.StringIO(evt_content(3)), chunk_size=EVT_ENTRY_SIZE))
+        self.assertEqual(len(entries), 3)
+        self.assertEqual(evt_table.end_offset, EVT_FIRST_ENTRY + 3 * EVT_ENTRY_SIZE)
+
+    def test_end_offset_of_short_stream(self):
+        # The stream ends part way into the third entry
+        content = evt_content(3)[:EVT_FIRST_ENTRY + 2 * EVT_ENTRY_SIZE + 50]
+        evt_table = evtTable(None, 1)
+        entries = list(evt_table.iter_stream(StringIO.StringIO(content)))
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(evt_table.end_offset, EVT_FIRST_ENTRY + 2 * EVT_ENTRY_SIZE)
+        self.assertEqual(evt_table.trailing_bytes, 50)
+
+    def test_end_offset_from_position(self):
+        position = EVT_FIRST_ENTRY + EVT_ENTRY_SIZE
+        evt_table = evtTable(None, 1)
+        entries = list(evt_table.iter_stream(StringIO.StringIO(evt_content(3)[position:]), position=position))
+        self.assertEqual([entry[0] for entry in entries], [position + 4, position + EVT_ENTRY_SIZE + 4])
+        self.assertEqual(evt_table.end_offset, EVT_FIRST_ENTRY + 3 * EVT_ENTRY_SIZE)
+
+
+class evtTableEntriesTest(unittest.TestCase):
+
+    def test_timestamps(self):
+        # Entries with and without times, in more than one conversion batch
+        header = evt_content(0)
+        filetimes = [0, epoch_to_filetime(1500000000), epoch_to_filetime(1500000000) + 9999999]
+        count = EVT_CONVERT_BATCH + 5
+        entries = [EVT_WRITE_STRUCT.pack(EVT_ENTRY_SIZE, number % 256, filetimes[number % 3], 1, '\x01' * 16,
+                                         filetimes[(number + 1) % 3]) for number in range(count)]
+        evt_table = evtTable(header + ''.join(entries), 1)
+        evt_table.parse_entries()
+        self.assertEqual(len(evt_table.entries), count)
+        for number, (offset, entry) in enumerate(evt_table.entries.iteritems()):
+            self.assertEqual(entry[1], filetime_to_epoch(filetimes[number % 3]))
+            self.assertEqual(entry[5], filetime_to_epoch(filetimes[(number + 1) % 3]))
+
+    def test_filetimes_to_epoch(self):
+        filetimes = [0, epoch_to_filetime(1500000000), 131000000000000000]
+        expected = [filetime_to_epoch(filetime) for filetime in filetimes]
+        self.assertEqual(filetimes_to_epoch(filetimes), expected)
+        self.assertEqual(filetimes_to_epoch(struct.pack('<3Q', *filetimes)), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
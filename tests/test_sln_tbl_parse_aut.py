@@ -0,0 +1,130 @@
+###############################################################################
+#
+# Tests for the sln.tbl parser. The parallel scan must find and decode the same
+# entries as the sequential one, so both are run over generated buffers. Run
+# with:
+#
+#     python2 -m unittest discover tests
+#
+###############################################################################
+
+import os
+import random
+import sys
+import unittest
+
+if sys.version_info[0] >= 3:
+    raise unittest.SkipTest('the lib modules need Python 2')
+
+import StringIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import lib.sln_tbl_parse_aut
+from lib.sln_tbl_parse_aut import *
+
+# Small enough that the ranges of the parallel scan, and the parts it decodes, end inside entries
+TEST_SCAN_MIN_RANGE = 1000
+
+# Number of generated buffers, and the worker counts each one is scanned with
+TEST_BUFFERS = 150
+TEST_WORKERS = (2, 3, 5, 8)
+
+
+def text_field(text, size):
+    data = text.encode('utf-16-le')[:size]
+    return(data + '\x00' * (size - len(data)))
+
+
+def sln_entry(number, rnd):
+
+    ''' One entry of either type, some with only a BOM for a doc_name, and some with a false
+        signature among the bytes no field is read from. '''
+
+    entry = bytearray(SLN_ENTRY_SIZE)
+    entry[0:4] = SLN_ENTRY_SIGNATURE
+    entry[4:20] = ''.join([chr(rnd.randrange(256)) for i in range(16)])
+    if rnd.random() < 0.1:
+        entry[48:52] = EMPTY_STRING_FIELD
+    else:
+        entry[48:568] = text_field(u'Document %d.docx' % number, 520)
+    entry[568:1086] = text_field(u'C:\\Users\\user\\Folder %d' % number, 518)
+    if rnd.random() < 0.3:
+        entry[1116:1120] = '\x09\x00\x00\x00'
+        entry[1156:1228] = text_field(u'Add-in %d' % number, 72)
+    else:
+        entry[1116:1120] = '\xff\xff\xff\xff'
+        entry[1402:1672] = text_field(u'Author %d' % number, 270)
+    if rnd.random() < 0.4:
+        position = rnd.choice([rnd.randrange(20, 44), rnd.randrange(1086, 1112)])
+        entry[position:position+4] = SLN_ENTRY_SIGNATURE
+    return(str(entry))
+
+
+def sln_content(rnd):
+
+    ''' Entries, some back to back and some with junk between them. The junk can hold false
+        signatures, which swallow the start of the next entry if it is close enough. The content may
+        end part way into an entry. '''
+
+    parts = ['\x20\x00\x00\x00\x53\x44\x44\x54\x01\x00\x00\x00\x56\x4e\x49\x53']
+    for number in range(rnd.randrange(1, 40)):
+        if rnd.random() < 0.4:
+            junk = bytearray(rnd.randrange(1, 4000))
+            if rnd.random() < 0.5:
+                position = rnd.randrange(len(junk))
+                junk[position:position+4] = SLN_ENTRY_SIGNATURE
+            parts.append(str(junk))
+        parts.append(sln_entry(number, rnd))
+    content = ''.join(parts)
+    if rnd.random() < 0.3:
+        content = content[:-rnd.randrange(1, SLN_ENTRY_SIZE)]
+    return(content)
+
+
+class slnParallelScanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.min_range = lib.sln_tbl_parse_aut.SLN_SCAN_MIN_RANGE
+        lib.sln_tbl_parse_aut.SLN_SCAN_MIN_RANGE = TEST_SCAN_MIN_RANGE
+        self.rnd = random.Random(2964)
+
+    def tearDown(self):
+        lib.sln_tbl_parse_aut.SLN_SCAN_MIN_RANGE = self.min_range
+
+    def assertSameTable(self, sln_table, expected):
+        self.assertEqual(sorted(sln_table.entries.items()), sorted(expected.entries.items()))
+        self.assertEqual(sln_table.skipped_entries, expected.skipped_entries)
+        self.assertEqual(sln_table.filtered_entries, expected.filtered_entries)
+
+    def test_locate_entries(self):
+        for i in range(TEST_BUFFERS):
+            content = sln_content(self.rnd)
+            start = self.rnd.choice([0, 16, self.rnd.randrange(len(content))])
+            expected = locate_sln_entries(content, start, len(content))
+            for workers in TEST_WORKERS:
+                self.assertEqual(locate_sln_entries_parallel(content, start, workers), expected)
+
+    def test_parse_entries(self):
+        for i in range(TEST_BUFFERS):
+            content = sln_content(self.rnd)
+            expected = slnTable(content)
+            expected.parse_entries()
+            for workers in TEST_WORKERS:
+                sln_table = slnTable(content, workers)
+                sln_table.parse_entries()
+                self.assertSameTable(sln_table, expected)
+
+    def test_parse_stream(self):
+        for i in range(TEST_BUFFERS):
+            content = sln_content(self.rnd)
+            expected = slnTable(content)
+            expected.parse_entries()
+            chunk_size = self.rnd.choice([SLN_ENTRY_SIZE, 5000, 3 * SLN_ENTRY_SIZE + 7, len(content)])
+            for workers in (1,) + TEST_WORKERS:
+                sln_table = slnTable(None, workers)
+                sln_table.parse_stream(StringIO.StringIO(content), chunk_size)
+                self.assertSameTable(sln_table, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+###############################################################################
+#
+# Tests for the incremental re-ingest checkpoints. The lib modules are written
+# for Jython and CPython 2.7, so run with:
+#
+#     python2 -m unittest discover tests
+#
+###############################################################################
+
+import hashlib
+import itertools
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+
+if sys.version_info[0] >= 3:
+    raise unittest.SkipTest('the lib modules need Python 2')
+
+import StringIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.tbl_checkpoint_aut import *
+from lib.sln_tbl_parse_aut import *
+from lib.tbl_functions_aut import *
+from lib.tbl_carver_aut import blank_user_table
+
+# Full evt entry including the block length, which the parser skips
+EVT_WRITE_STRUCT = struct.Struct('<IB19xQ4xB3x16s80xQ12x')
+
+# Results per batch, small so that a set takes many batches
+TEST_BATCH_SIZE = 7
+
+
+def sln_content(docids):
+    entries = []
+    for number, docid in enumerate(docids):
+        entry = bytearray(SLN_ENTRY_SIZE)
+        entry[0:4] = SLN_ENTRY_SIGNATURE
+        entry[4:20] = docid
+        entry[48:80] = (u'Document %d.docx' % number).encode('utf-16-le').ljust(32, '\x00')
+        entry[1116:1120] = '\xff\xff\xff\xff'
+        entries.append(str(entry))
+    return('\x00' * 16 + ''.join(entries))
+
+
+def evt_content(docids):
+
+    ''' An evt.tbl with an entry for each docid, each with a time of its own. '''
+
+    header = '\x20\x00\x00\x00\x53\x44\x44\x54\x01\x00\x00\x00\x54\x4e\x56\x45'.ljust(EVT_FIRST_ENTRY, '\x00')
+    entries = [EVT_WRITE_STRUCT.pack(EVT_ENTRY_SIZE, number % 256, 0, 1, docid, epoch_to_filetime(1500000000 + number))
+               for number, docid in enumerate(docids)]
+    return(header + ''.join(entries))
+
+
+def ingest(checkpoints, key, sln, evt, posted, cancel_after=None):
+
+    ''' Join the set the way the ingest module does, adding the results to posted and saving a
+        checkpoint after each batch. With cancel_after, the set is cancelled once that many batches
+        have been posted. '''
+
+    sln_table = slnTable(None)
+    sln_table.parse_stream(StringIO.StringIO(sln))
+    sln_hash = hashlib.md5(sln).hexdigest()
+    sln_digests = sln_docid_digests(sln_table)
+    evt_prefix = evt[:EVT_PREFIX_SIZE]
+    evt_start, rejoin_docids = plan_incremental(checkpoints.get(key), len(evt), evt_prefix, sln_hash, sln_digests)
+
+    evt_table = evtTable(None, 1)
+    evt_entries = evt_table.iter_stream(StringIO.StringIO(evt[evt_start:]), position=evt_start)
+    if rejoin_docids:
+        rejoin_start = min(rejoin_docids.values())
+        earlier_entries = evtTable(None, 1).iter_stream(StringIO.StringIO(evt[rejoin_start:evt_start]), position=rejoin_start)
+        evt_entries = itertools.chain(iter_rejoin_entries(earlier_entries, rejoin_docids), evt_entries)
+
+    batches = 0
+    for batch, offsets in iter_result_batches(sln_table, evt_table, blank_user_table(), evt_entries, TEST_BATCH_SIZE):
+        if batches == cancel_after:
+            return
+        if batch:
+            posted.extend([result[0] for result in batch])
+            checkpoints.set(key, resume_checkpoint(offsets[-1], evt_start, rejoin_docids, evt_prefix, sln_hash, sln_digests))
+            batches += 1
+    checkpoints.set(key, make_checkpoint(max(evt_table.end_offset, evt_start), evt_prefix, sln_hash, sln_digests))
+
+
+class tblCheckpointsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_non_ascii_path(self):
+        key = checkpoint_key((1, 2, 3), u'/Users/Jos\xe9/evt.tbl')
+        checkpoint = {'evt_offset': 1024}
+        tblCheckpoints(self.folder).set(key, checkpoint)
+        self.assertEqual(tblCheckpoints(self.folder).get(key), checkpoint)
+
+    def test_missing_checkpoint(self):
+        self.assertEqual(tblCheckpoints(self.folder).get(checkpoint_key((1, 2, 3), u'/evt.tbl')), None)
+
+
+class postedRangesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_ranges_leave_out_unjoined_entries(self):
+        offsets = [44, 200, 356, 1000, 1156, 5000]
+        ranges = posted_ranges(offsets, [], set([44, 200, 1000, 1156, 5000]))
+        self.assertEqual(ranges, [[44, 200], [1000, 5000]])
+        self.assertEqual([offset for offset in offsets if in_ranges(offset, ranges)], [44, 200, 1000, 1156, 5000])
+        self.assertFalse(in_ranges(356, ranges))
+        self.assertFalse(in_ranges(10, ranges))
+
+    def test_later_ingest_merges_ranges(self):
+        offsets = [44, 200, 356, 1000]
+        key = carve_checkpoint_key(7, u'/$Unalloc/Unalloc_1')
+        tblCheckpoints(self.folder).set(key, {'posted_ranges': posted_ranges(offsets, [], set([44, 1000]))})
+        ranges = tblCheckpoints(self.folder).get(key)['posted_ranges']
+        self.assertEqual(posted_ranges(offsets, ranges, set([200, 356])), [[44, 1000]])
+
+
+class cancelledSetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.key = checkpoint_key((1, 2, 3), u'/evt.tbl')
+        self.docids = [chr(number) * 16 for number in range(1, 7)]
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def expected(self, sln, evt):
+        posted = []
+        ingest(tblCheckpoints(tempfile.mkdtemp(dir=self.folder)), self.key, sln, evt, posted)
+        return(posted)
+
+    def test_cancel_part_way(self):
+        # Entries of documents that are not in sln.tbl are left out of the join
+        sln = sln_content(self.docids[:4])
+        evt = evt_content([self.docids[number % 5] for number in range(100)])
+        posted = []
+        ingest(tblCheckpoints(self.folder), self.key, sln, evt, posted, cancel_after=3)
+        self.assertEqual(len(posted), 3 * TEST_BATCH_SIZE)
+        ingest(tblCheckpoints(self.folder), self.key, sln, evt, posted)
+        self.assertEqual(posted, self.expected(sln, evt))
+
+    def test_cancel_part_way_through_rejoin(self):
+        # Documents are added to sln.tbl and more entries to evt.tbl. The earlier entries of the new
+        # documents are joined first, and the ingest is cancelled while they are. Another document is
+        # added before the rejoin is carried on, so the documents are rejoined from different offsets.
+        entries = [self.docids[number % 6] for number in range(120)]
+        posted = []
+        ingest(tblCheckpoints(self.folder), self.key, sln_content(self.docids[:3]), evt_content(entries), posted)
+
+        evt = evt_content(entries + [self.docids[number % 6] for number in range(20)])
+        ingest(tblCheckpoints(self.folder), self.key, sln_content(self.docids[:5]), evt, posted, cancel_after=2)
+        self.assertTrue('rejoin_docids' in tblCheckpoints(self.folder).get(self.key))
+        sln = sln_content(self.docids)
+        ingest(tblCheckpoints(self.folder), self.key, sln, evt, posted, cancel_after=3)
+        ingest(tblCheckpoints(self.folder), self.key, sln, evt, posted)
+        self.assertEqual(sorted(posted), sorted(self.expected(sln, evt)))
+
+if __name__ == '__main__':
+    unittest.main()